@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Animaciones (mp4 o gif) de una secuencia de tiempos sin escribir un png por frame.
+Los frames se dibujan en paralelo (cada proceso con su plantilla de figura) y se
+pasan en orden, como imagenes RGBA, a un codificador: ffmpeg por un pipe si esta
+instalado, o Pillow para los gif si no esta. Solo se dibujan unos pocos frames por
+delante del que se esta codificando, asi que con ffmpeg la memoria no depende de la
+cantidad de tiempos.
+
+Pillow en cambio necesita todos los frames al guardar el gif: se guardan con paleta
+(1 byte por pixel, un cuarto de la imagen RGBA) y como mucho PILLOW_MAX_MB megabytes;
+los frames que no entran no se agregan (con un aviso). Con la variable de entorno
+WRF_ANIMATION_MAX_MB se cambia ese limite.
+"""
+
+import os
+import shutil
+import subprocess
+import warnings
+
+from parallel_utils import ordered_map
+
+PILLOW_MAX_MB = float( os.environ.get( 'WRF_ANIMATION_MAX_MB' , 1024 ) )
+
+
+def animation_filename( filename , nivel=None ) :
+    """Nombre del archivo de la animacion, agregando la altura si hay una animacion por nivel."""
+    if nivel is None :
+        return filename
+    base , ext = filename.rsplit( '.' , 1 )
+    return base + '_altura_' + str( nivel ) + '.' + ext
+
+
+class AnimationWriter :
+    """Codificador de una animacion que recibe los frames (alto,ancho,4) de a uno.
+
+    El formato se elige por la extension de filename (.mp4 o .gif). Sin ffmpeg los frames
+    de los gif se guardan en memoria hasta close, como mucho max_mb megabytes (por defecto
+    PILLOW_MAX_MB); los siguientes se descartan y se cuentan en dropped.
+    """
+
+    def __init__( self , filename , fps=4 , max_mb=None ) :
+        self.filename = filename
+        self.fps = fps
+        self.format = filename.rsplit( '.' , 1 )[-1].lower()
+        if self.format not in ( 'mp4' , 'gif' ) :
+            raise ValueError( 'Formato de animacion no soportado: ' + self.format + ' (usar mp4 o gif)' )
+        self.ffmpeg = shutil.which( 'ffmpeg' )
+        if self.ffmpeg is None and self.format == 'mp4' :
+            raise RuntimeError( 'Para escribir animaciones mp4 hace falta tener ffmpeg instalado' )
+        self.max_mb = PILLOW_MAX_MB if max_mb is None else max_mb
+        self.nframes = 0
+        self.dropped = 0
+        self._nbytes = 0
+        self._process = None
+        self._first = None
+        self._frames = None
+
+    def _start_ffmpeg( self , height , width ) :
+        command = [ self.ffmpeg , '-y' , '-loglevel' , 'error' ,
+                    '-f' , 'rawvideo' , '-pix_fmt' , 'rgba' , '-s' , str( width ) + 'x' + str( height ) ,
+                    '-r' , str( self.fps ) , '-i' , '-' ]
+        if self.format == 'mp4' :
+            #x264 necesita ancho y alto pares.
+            command += [ '-vf' , 'pad=ceil(iw/2)*2:ceil(ih/2)*2' , '-c:v' , 'libx264' , '-pix_fmt' , 'yuv420p' ]
+        else :
+            command += [ '-vf' , 'split[a][b];[a]palettegen=stats_mode=diff[p];[b][p]paletteuse' ]
+        self._process = subprocess.Popen( command + [ self.filename ] , stdin=subprocess.PIPE )
+
+    def write( self , rgba ) :
+        """Agrega un frame a la animacion."""
+        if self.ffmpeg is not None :
+            if self._process is None :
+                self._start_ffmpeg( rgba.shape[0] , rgba.shape[1] )
+            self._process.stdin.write( rgba.tobytes() )
+        else :
+            #Pillow guarda los gif con paleta (1 byte por pixel), todos juntos al final.
+            from PIL import Image
+            nbytes = rgba.shape[0] * rgba.shape[1]
+            if self._first is not None and self._nbytes + nbytes > self.max_mb * 1024**2 :
+                if self.dropped == 0 :
+                    warnings.warn( 'Sin ffmpeg la animacion ' + self.filename + ' se arma en memoria: se llego a ' +
+                                   str( self.max_mb ) + ' MB con ' + str( self.nframes ) + ' frames y los siguientes no se agregan '
+                                   '(instalar ffmpeg o subir WRF_ANIMATION_MAX_MB)' )
+                self.dropped += 1
+                return
+            frame = Image.fromarray( rgba ).convert( 'RGB' ).quantize()
+            self._nbytes += nbytes
+            if self._first is None :
+                self._first , self._frames = frame , list()
+            else :
+                self._frames.append( frame )
+        self.nframes += 1
+
+    def close( self ) :
+        """Termina de escribir la animacion."""
+        if self._process is not None :
+            self._process.stdin.close()
+            if self._process.wait() != 0 :
+                raise RuntimeError( 'ffmpeg no pudo escribir ' + self.filename )
+            self._process = None
+        elif self._first is not None :
+            self._first.save( self.filename , save_all=True , append_images=self._frames ,
+                              duration=int( 1000 / self.fps ) , loop=0 )
+            self._first , self._frames = None , None
+
+
+def write_animation( filenames , worker , tasks , fps=4 , nworkers=None , max_ahead=None , verbose=True ) :
+    """Escribe una o varias animaciones con los frames de worker(task) para cada task.
+
+    worker devuelve, para cada tiempo, una lista con un frame (alto,ancho,4) por cada
+    animacion de filenames (por ejemplo uno por nivel). Los frames se calculan en
+    paralelo con nworkers procesos y se codifican en el orden de tasks.
+    """
+    tasks = list( tasks )
+    writers = [ AnimationWriter( filename , fps ) for filename in filenames ]
+    try :
+        for itask , frames in enumerate( ordered_map( worker , tasks , nworkers , max_ahead ) ) :
+            for writer , frame in zip( writers , frames ) :
+                writer.write( frame )
+            if verbose :
+                print( '[' + str( itask + 1 ) + '/' + str( len( tasks ) ) + '] frame agregado a ' + ', '.join( filenames ) )
+    finally :
+        for writer in writers :
+            writer.close()
+    return filenames
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Funciones comunes para graficar muchos tiempos y niveles en una sola corrida
+de python (modo batch). Las usan los scripts plot_*.py cuando batch = True.
+"""
+
+import glob
+
+
+def get_file_list( path='.' , domain='d01' ) :
+    """Busca todos los wrfout del dominio en la carpeta path y los ordena cronologicamente."""
+    file_list = glob.glob( path + '/wrfout_' + domain + '_*' )
+    file_list.sort()
+    return file_list
+
+
+def get_time_range( ntimes , plot_time_ini=0 , plot_time_end=None ) :
+    """Devuelve los tiempos a graficar entre plot_time_ini y plot_time_end (ambos incluidos).
+
+    Si plot_time_end es None se grafican todos los tiempos hasta el ultimo disponible.
+    """
+    if plot_time_end is None or plot_time_end > ntimes - 1 :
+        plot_time_end = ntimes - 1
+    return range( plot_time_ini , plot_time_end + 1 )
+
+
+def frame_filename( figure_name , plot_time , nivel=None , path='.' , ext='png' ) :
+    """Nombre del archivo de la figura, igual al que usaban los scripts originales.
+
+    ext es la extension (png, webp o rgba) que define el formato en que se guarda.
+    """
+    filename = path + '/' + figure_name + '_tiempo_' + str( plot_time )
+    if nivel is not None :
+        filename = filename + '_altura_' + str( nivel )
+    return filename + '.' + ext
+
+
+def set_headless( plt ) :
+    """Fija el backend Agg para poder graficar sin pantalla (sin plt.show).
+
+    Se tiene que llamar antes de crear las figuras. Funciona aunque el matplotlibrc
+    pida un backend interactivo (TkAgg, QtAgg) en un nodo sin display.
+    """
+    plt.switch_backend('Agg')
+    plt.ioff()
+
+
+def get_pyplot( headless=False ) :
+    """Importa matplotlib.pyplot recien cuando se va a graficar (solo importarlo tarda casi un segundo).
+
+    Si headless es True ademas fija el backend Agg (ver set_headless).
+    """
+    import matplotlib.pyplot as plt
+    if headless :
+        set_headless( plt )
+    return plt
+
+
+def new_figure( **kwargs ) :
+    """Figura con canvas Agg que no pasa por pyplot (kwargs como en plt.figure).
+
+    pyplot guarda estado global (la lista de figuras, la figura actual), asi que no se puede usar
+    desde varios threads; una figura creada asi solo se puede guardar, no mostrar con plt.show.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    fig = Figure( **kwargs )
+    FigureCanvasAgg( fig )
+    return fig
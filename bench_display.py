@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark del graficado a la resolucion de la figura (display_grid).
+Para cada tamanio de reticula de GRIDS (cortes horizontales, con lats y lons de una
+proyeccion Lambert) y de CROSS (cortes verticales de nlevels niveles y npts puntos) se
+dibuja el mismo campo sintetico con cada metodo de METHODS y se mide:
+
+    time_s    tiempo de armar los sombreados y contornos y dibujar la figura (mediana de NREPEAT).
+    speedup   tiempo de contourf sobre la reticula completa / tiempo del metodo.
+    mean_abs  diferencia media (0 a 255) de la imagen contra la de contourf sobre la reticula completa.
+    changed   fraccion de pixeles que cambian mas de CHANGED_THRESHOLD en algun canal.
+    psnr_db   relacion senial/ruido pico de la imagen (mas alto = mas parecida, inf = identica).
+
+No hace falta wrf-python: los campos se arman con numpy como en synthetic_wrfout.
+
+Uso:  python bench_display.py [bench_display.json]
+"""
+
+import sys
+import json
+import time
+import platform
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+
+from batch_utils import set_headless
+from display_grid import to_display, shade
+from figure_templates import HorizontalTemplate
+from synthetic_wrfout import lambert_latlon
+
+GRIDS   = [ ( 300 , 400 ) , ( 1000 , 1200 ) , ( 2000 , 2400 ) ]   #( ny , nx ) de los cortes horizontales.
+CROSS   = [ ( 100 , 300 ) , ( 300 , 1000 ) ]    #( nlevels , npts ) de los cortes verticales.
+DX      = 3000.0    #Resolucion (m) de la reticula horizontal.
+NREPEAT = 3         #Repeticiones de cada medicion (se guarda la mediana).
+FIGSIZE = ( 6.4 , 4.8 )
+DPI     = 100
+CHANGED_THRESHOLD = 16
+OUTPUT  = 'bench_display.json'
+
+#( nombre , display_res , shading ) de cada metodo. El primero es la referencia.
+METHODS = [ ( 'contourf' , False , 'contourf' ) ,
+            ( 'contourf_display' , True , 'contourf' ) ,
+            ( 'pcolormesh' , False , 'pcolormesh' ) ,
+            ( 'pcolormesh_display' , True , 'pcolormesh' ) ,
+            ( 'imshow_display' , True , 'imshow' ) ]
+
+
+def _waves( x , y , scales , rng ) :
+    """Suma de ondas con las longitudes de onda scales (m) y fases al azar, entre -1 y 1."""
+    field = np.zeros( np.broadcast( x , y ).shape )
+    for scale in scales :
+        angle , phase = rng.uniform( 0 , np.pi ) , rng.uniform( 0 , 2 * np.pi )
+        field += np.sin( 2 * np.pi * ( x * np.cos( angle ) + y * np.sin( angle ) ) / scale + phase )
+    return field / len( scales )
+
+
+def horizontal_case( ny , nx , seed=0 ) :
+    """lons, lats, temperatura (K) y velocidad del viento (m/s) sinteticos con estructura de varias escalas."""
+    rng = np.random.default_rng( seed )
+    x = ( np.arange( nx ) - ( nx - 1 ) / 2 ) * DX
+    y = ( np.arange( ny ) - ( ny - 1 ) / 2 ) * DX
+    x , y = np.meshgrid( x , y )
+    lats , lons , mapfac , theta = lambert_latlon( x , y )
+    t = 295.0 - 1e-5 * y + 6.0 * _waves( x , y , [ 400e3 , 150e3 , 40e3 , 12e3 ] , rng )
+    wspd = 8.0 + 7.0 * _waves( x , y , [ 300e3 , 80e3 , 20e3 ] , rng )
+    return lons , lats , t , wspd
+
+
+def cross_case( nlevels , npts , seed=0 ) :
+    """Puntos, alturas (m) y reflectividad (dBZ) sinteticos de un corte vertical."""
+    rng = np.random.default_rng( seed )
+    xs = np.arange( npts , dtype=float )
+    ys = np.linspace( 0.0 , 15000.0 , nlevels )
+    x , z = np.meshgrid( xs * DX , ys )
+    #Las alturas se estiran 10 veces para que las ondas tengan estructura tanto en la vertical como en la horizontal.
+    dbz = 30.0 + 30.0 * _waves( x , 10 * z , [ 300e3 , 100e3 , 40e3 ] , rng ) * np.exp( -z / 8000.0 )
+    #Debajo del terreno no hay datos.
+    dbz[ z < 500.0 * ( 1 + np.sin( x / 50e3 ) ) ] = np.nan
+    return xs , ys , dbz
+
+
+def draw_horizontal( template , lons , lats , t , wspd , display_res , shading ) :
+    ax = template.ax
+    if display_res :
+        lons , lats , t , wspd = to_display( ax , lons , lats , t , wspd )
+    levels = np.arange( np.round( np.nanmin( t ) ) - 2. , np.round( np.nanmax( t ) ) + 2. , 2. )
+    template.update( shade( ax , lons , lats , t , levels , 'rainbow' , shading ) )
+    template.update( ax.contour( lons , lats , wspd , levels=[ 1 , 5 , 10 , 15 ] , colors='k' ) )
+
+
+def draw_cross( template , xs , ys , dbz , display_res , shading ) :
+    ax = template.ax
+    if display_res :
+        xs , ys , dbz = to_display( ax , xs , ys , dbz )
+    template.update( shade( ax , xs , ys , dbz , np.arange( 0.0 , 60.0 , 5.0 ) , 'gist_ncar' , shading ) )
+
+
+def measure( template , draw , *args ) :
+    """Mediana del tiempo de draw + render y la imagen que queda."""
+    times = list()
+    for irepeat in range( NREPEAT ) :
+        template.clear()
+        start = time.perf_counter()
+        draw( template , *args )
+        image = template.render()
+        times.append( time.perf_counter() - start )
+    return float( np.median( times ) ) , np.array( image[ : , : , :3 ] , dtype=float )
+
+
+def compare( image , reference ) :
+    diff = np.abs( image - reference )
+    mse = np.mean( diff**2 )
+    return { 'mean_abs' : float( diff.mean() ) ,
+             'changed' : float( np.mean( diff.max( axis=-1 ) > CHANGED_THRESHOLD ) ) ,
+             'psnr_db' : float( 10 * np.log10( 255.0**2 / mse ) ) if mse > 0 else float( 'inf' ) }
+
+
+def run_case( kind , shape , fields , draw ) :
+    """Mide todos los metodos sobre un campo. Devuelve el resultado de cada metodo."""
+    template = HorizontalTemplate( plt.figure( figsize=FIGSIZE , dpi=DPI ) )
+    x , y = fields[0] , fields[1]
+    template.ax.axis( [ np.min( x ) , np.max( x ) , np.min( y ) , np.max( y ) ] )
+    template.ax.grid()
+    results = dict()
+    reference = None
+    for name , display_res , shading in METHODS :
+        if shading == 'imshow' and kind == 'horizontal' :
+            continue   #La reticula en lat/lon no es regular.
+        elapsed , image = measure( template , draw , *fields , display_res , shading )
+        if reference is None :
+            reference , reference_time = image , elapsed
+        result = { 'time_s' : elapsed , 'speedup' : reference_time / elapsed }
+        result.update( compare( image , reference ) )
+        results[ name ] = result
+        print( '%-10s %-14s %-20s %8.3f s  x%6.1f  dif %6.2f  pixeles %6.3f  psnr %6.1f dB' % (
+               kind , 'x'.join( str( n ) for n in shape ) , name , elapsed , result['speedup'] ,
+               result['mean_abs'] , result['changed'] , result['psnr_db'] ) )
+    template.close()
+    return { 'kind' : kind , 'shape' : list( shape ) , 'methods' : results }
+
+
+def run_benchmark() :
+    set_headless( plt )
+    cases = list()
+    for ny , nx in GRIDS :
+        cases.append( run_case( 'horizontal' , ( ny , nx ) , horizontal_case( ny , nx ) , draw_horizontal ) )
+    for nlevels , npts in CROSS :
+        cases.append( run_case( 'cross' , ( nlevels , npts ) , cross_case( nlevels , npts ) , draw_cross ) )
+    return { 'date' : time.strftime( '%Y-%m-%dT%H:%M:%S' ) , 'host' : platform.node() ,
+             'matplotlib' : matplotlib.__version__ , 'figsize' : FIGSIZE , 'dpi' : DPI , 'cases' : cases }
+
+
+if __name__ == '__main__' :
+
+    output = sys.argv[1] if len( sys.argv ) > 1 else OUTPUT
+    results = run_benchmark()
+    with open( output , 'w' ) as my_file :
+        json.dump( results , my_file , indent=1 )
+    print( 'Resultados en ' + output )
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Benchmark de los scripts con wrfout sinteticos (synthetic_wrfout).
+Para cada tamanio de reticula de GRIDS se escribe una corrida sintetica de NTIMES tiempos
+y se corren sobre ella las funciones de los scripts (plot_frame de los cortes horizontales
+y verticales y el meteograma), midiendo con profiling el tiempo de cada etapa:
+
+    open     abrir el wrfout.
+    getvar   calcular las variables derivadas con wrf-python (sin el cache en disco).
+    interp   interpolacion vertical (VerticalInterpolator).
+    cross    cortes verticales (CrossSection).
+    extract  lectura de las series en los puntos del meteograma.
+    frame    armar los artistas de la figura (contourf, barbas, ...).
+    render   dibujar la figura.
+    save     escribir la imagen.
+
+Para cada etapa se guarda el tiempo propio (sin las etapas que se llaman desde adentro),
+el total, el tiempo de CPU y el crecimiento del pico de memoria. El resultado se guarda
+en un json para comparar entre versiones.
+
+Uso:  python benchmark.py [benchmark.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import importlib
+import traceback
+from functools import partial
+
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from netCDF4 import Dataset
+
+import diag_cache
+import profiling
+from batch_utils import set_headless
+from synthetic_wrfout import make_run
+from cross_section import LatLon
+from wrf_run import WrfRun, open_wrfout
+
+GRIDS     = [ ( 40 , 100 , 120 ) , ( 50 , 250 , 300 ) ]   #( nz , ny , nx ) de cada caso.
+NTIMES    = 4                                             #Tiempos (wrfout) de cada corrida sintetica.
+WORKFLOWS = ( 'horizontal_2d' , 'horizontal_3d' , 'vertical' , 'meteogram' )
+OUTPUT    = 'benchmark.json'
+WORK_DIR  = None    #Carpeta para los wrfout y las figuras (None = una carpeta temporal que se borra al final).
+USE_CACHE = False   #Si es False no se usa el cache en disco de diag_cache (se mide el calculo de getvar).
+
+
+
+def bench_frames( run , module , setup=None ) :
+    """Grafica todos los tiempos de la corrida con plot_frame del script module."""
+    if setup is not None :
+        setup( module , run )
+    template = module.worker_template()
+    for plot_time , filename in enumerate( run.file_list ) :
+        with open_wrfout( filename ) as ncfile :
+            if hasattr( module , 'niveles' ) :
+                module.plot_frame( ncfile , plot_time , module.niveles , template , False )
+            else :
+                module.plot_frame( ncfile , plot_time , template , False )
+    template.close()
+    module._worker.clear()
+
+
+def _vertical_setup( module , run ) :
+    """Corte de oeste a este por el centro del dominio sintetico."""
+    with Dataset( run.file_list[0] ) as ncfile :
+        lats = ncfile.variables['XLAT'][0]
+        lons = ncfile.variables['XLONG'][0]
+    ny , nx = lats.shape
+    module.cross = None
+    module.cross_start = LatLon( float( lats[ ny // 2 , nx // 8 ] ) , float( lons[ ny // 2 , nx // 8 ] ) )
+    module.cross_end = LatLon( float( lats[ ny // 2 , 7 * nx // 8 ] ) , float( lons[ ny // 2 , 7 * nx // 8 ] ) )
+
+
+def bench_meteogram( run , module , nstations=50 ) :
+    """Meteograma como en plot_time_evolution_real, con nstations estaciones en el almacen de series."""
+    from figure_templates import MeteogramTemplate
+    from point_series import station_points
+    from station_store import StationStore
+
+    with open_wrfout( run.file_list[0] ) as ncfile :
+        with profiling.stage( 'open' ) :
+            lats = ncfile.variables['XLAT'][0]
+            lons = ncfile.variables['XLONG'][0]
+            rng = np.random.default_rng( 0 )
+            iy = rng.integers( 0 , lats.shape[0] , nstations )
+            ix = rng.integers( 0 , lats.shape[1] , nstations )
+            points , weights = station_points( ncfile , lats[ iy , ix ] , lons[ iy , ix ] )
+        ter = module.cached_getvar( ncfile , 'ter' )
+        with profiling.stage( 'extract' ) :
+            store = StationStore( 'bench_series' , points , ( 'T2C' , 'td2' ) )
+            store.update( run.file_list )
+            times , series = store.series( run.file_list , 0 )
+        with profiling.frame( 'meteograma' ) :
+            template = MeteogramTemplate( plt.figure( figsize=(9,4) ) )
+            module.plot_location( template , ter , float( lons[ iy[0] , ix[0] ] ) , float( lats[ iy[0] , ix[0] ] ) )
+            hours = ( times - times[0] ) / np.timedelta64( 1 , 'h' )
+            module.plot_series( template , hours , series[ : , 0 ] , series[ : , 1 ] , 'bench_meteogram.png' )
+            template.close()
+
+
+#Script que se mide en cada flujo de trabajo y funcion que lo corre.
+BENCHMARKS = {
+    'horizontal_2d' : ( 'plot_2dvar_horizontal_section_real' , bench_frames ) ,
+    'horizontal_3d' : ( 'plot_3dvar_horizontal_section_real' , bench_frames ) ,
+    'vertical'      : ( 'plot_3dvar_vertical_section_real' , partial( bench_frames , setup=_vertical_setup ) ) ,
+    'meteogram'     : ( 'plot_time_evolution_real' , bench_meteogram ) ,
+}
+
+
+def _versions() :
+    versions = { 'python' : platform.python_version() , 'numpy' : np.__version__ , 'matplotlib' : matplotlib.__version__ }
+    for name in ( 'netCDF4' , 'wrf' , 'scipy' , 'PIL' ) :
+        try :
+            versions[ name ] = getattr( importlib.import_module( name ) , '__version__' , 'unknown' )
+        except ImportError :
+            versions[ name ] = None
+    return versions
+
+
+def run_case( work_dir , nz , ny , nx , ntimes , workflows ) :
+    """Escribe la corrida sintetica de un tamanio de reticula y mide cada flujo de trabajo sobre ella."""
+    run_dir = os.path.join( work_dir , 'run_' + str( nz ) + 'x' + str( ny ) + 'x' + str( nx ) )
+    start = time.perf_counter()
+    file_list = make_run( run_dir , ntimes , nz , ny , nx )
+    case = { 'grid' : { 'nz' : nz , 'ny' : ny , 'nx' : nx } , 'ntimes' : ntimes ,
+             'file_mb' : os.path.getsize( file_list[0] ) / 1024**2 ,
+             'generate_s' : time.perf_counter() - start , 'workflows' : dict() }
+    run = WrfRun( run_dir )
+
+    cwd = os.getcwd()
+    for workflow in workflows :
+        module_name , bench = BENCHMARKS[ workflow ]
+        try :
+            #El script se importa antes de pasar a la carpeta de la corrida (donde se escriben las figuras).
+            module = importlib.import_module( module_name )
+            os.chdir( run_dir )
+            recorder = profiling.enable()
+            start = time.perf_counter()
+            bench( run , module )
+            result = { 'total_s' : time.perf_counter() - start , 'stages' : recorder.summary() }
+        except Exception as error :
+            traceback.print_exc()
+            result = { 'error' : repr( error ) }
+        finally :
+            os.chdir( cwd )
+            profiling.disable()
+        case['workflows'][ workflow ] = result
+        print( str( nz ) + 'x' + str( ny ) + 'x' + str( nx ) , workflow , result.get( 'total_s' , result.get( 'error' ) ) )
+    run.close()
+    return case
+
+
+def run_benchmark( grids=None , ntimes=None , workflows=None , work_dir=None ) :
+    """Corre todos los casos y devuelve el diccionario que se guarda en el json (por defecto con la configuracion de arriba)."""
+    grids = GRIDS if grids is None else grids
+    ntimes = NTIMES if ntimes is None else ntimes
+    workflows = WORKFLOWS if workflows is None else workflows
+    work_dir = WORK_DIR if work_dir is None else work_dir
+    set_headless( plt )
+    if not USE_CACHE :
+        diag_cache.CACHE_MAX_MB = 0
+    tmp_dir = None
+    if work_dir is None :
+        work_dir = tmp_dir = tempfile.mkdtemp( prefix='wrf_benchmark_' )
+    try :
+        cases = [ run_case( work_dir , nz , ny , nx , ntimes , workflows ) for nz , ny , nx in grids ]
+    finally :
+        if tmp_dir is not None :
+            shutil.rmtree( tmp_dir , ignore_errors=True )
+    return { 'date' : time.strftime( '%Y-%m-%dT%H:%M:%S' ) , 'host' : platform.node() , 'platform' : platform.platform() ,
+             'cpu_count' : os.cpu_count() , 'versions' : _versions() , 'use_cache' : USE_CACHE , 'cases' : cases }
+
+
+if __name__ == '__main__' :
+
+    output = sys.argv[1] if len( sys.argv ) > 1 else OUTPUT
+    results = run_benchmark()
+    with open( output , 'w' ) as my_file :
+        json.dump( results , my_file , indent=1 )
+    print( 'Resultados en ' + output )
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cortes verticales reutilizables.
+vertcross e interpline de wrf-python recalculan en cada llamada el camino del corte
+sobre la reticula y los niveles verticales. Aca eso se calcula una sola vez a partir
+de cross_start, cross_end y z, y despues se aplica a todas las variables y a todos los
+tiempos (por ejemplo para animar un corte fijo).
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+from vinterp import VerticalInterpolator
+from profiling import stage
+
+#Extremos de un corte, como los CoordPair de wrf-python pero sin tener que importar wrf.
+LatLon    = namedtuple( 'LatLon' , 'lat lon' )
+GridPoint = namedtuple( 'GridPoint' , 'x y' )
+
+AUTOLEVELS = 100   #Cantidad de niveles del corte por defecto (la misma que en vertcross).
+
+def path_points( start_xy , end_xy ) :
+    """Puntos (x,y) del corte, separados aproximadamente 1 punto de reticula (como xy de wrf-python)."""
+    x0 , y0 = start_xy
+    x1 , y1 = end_xy
+    npts = int( np.hypot( x1 - x0 , y1 - y0 ) ) + 1
+    if npts < 2 :
+        raise ValueError( 'El punto inicial y final del corte son el mismo punto de reticula' )
+    t = np.linspace( 0.0 , 1.0 , npts )
+    return np.stack( [ x0 + t * ( x1 - x0 ) , y0 + t * ( y1 - y0 ) ] , axis=1 )
+
+
+class CrossSection :
+    """Corte vertical entre start_point y end_point (LatLon, GridPoint o CoordPair con x/y o con lat/lon).
+
+    Si los puntos estan en lat/lon hace falta wrfin (el wrfout abierto) para pasarlos a
+    la reticula. Los niveles verticales se eligen como en vertcross: autolevels niveles
+    equiespaciados desde 0 hasta la altura maxima de las columnas del corte (o la lista
+    levels si se pasa). A diferencia de vertcross (que los elige de nuevo en cada llamada)
+    los niveles se eligen con la z del primer tiempo y quedan fijos para los siguientes.
+    """
+
+    def __init__( self , z , start_point , end_point , wrfin=None , autolevels=AUTOLEVELS , levels=None ) :
+        z = np.asarray( z , dtype=float )
+        self.set_path( z.shape[-2:] , start_point , end_point , wrfin )
+        self.set_levels( self.horizontal( z ) , autolevels , levels )
+
+    @classmethod
+    def from_path( cls , shape , start_point , end_point , wrfin=None ) :
+        """Corte sobre una reticula de shape = (ny, nx) puntos sin calcular todavia los niveles.
+
+        Sirve cuando la z completa no entra en memoria: se calcula la z solo en las columnas
+        del corte (ver tiled.tiled_cross) y despues se llama a set_levels.
+        """
+        cross = cls.__new__( cls )
+        cross.set_path( shape , start_point , end_point , wrfin )
+        cross.levels = None
+        return cross
+
+    def set_path( self , shape , start_point , end_point , wrfin=None ) :
+        """Puntos del corte sobre la reticula (ny, nx) y pesos de la interpolacion horizontal."""
+        ny , nx = shape
+        start_xy = self._to_xy( start_point , wrfin )
+        end_xy = self._to_xy( end_point , wrfin )
+        self.xy = path_points( start_xy , end_xy )
+        self.npts = self.xy.shape[0]
+
+        #Pesos de la interpolacion bilineal en la horizontal para cada punto del corte.
+        x = np.clip( self.xy[:,0] , 0 , nx - 1 )
+        y = np.clip( self.xy[:,1] , 0 , ny - 1 )
+        self.i0 = np.minimum( np.floor( x ).astype(int) , nx - 2 )
+        self.j0 = np.minimum( np.floor( y ).astype(int) , ny - 2 )
+        self.fx = x - self.i0
+        self.fy = y - self.j0
+
+    def set_levels( self , z_path , autolevels=AUTOLEVELS , levels=None ) :
+        """Fija los niveles verticales a partir de la altura z_path (nz,npts) en las columnas del corte."""
+        if levels is None :
+            #Como vertcross (para z creciente con el indice vertical): desde 0 con paso z_max / autolevels.
+            dz = np.nanmax( z_path ) / autolevels
+            levels = dz * np.arange( autolevels )
+        self.levels = np.asarray( levels , dtype=float )
+        self.set_z( None , z_path )
+
+    @staticmethod
+    def _to_xy( point , wrfin ) :
+        if getattr( point , 'lat' , None ) is not None :
+            if wrfin is None :
+                raise ValueError( 'Para un corte definido en lat/lon hace falta pasar wrfin' )
+            from wrf import ll_to_xy
+            x , y = ll_to_xy( wrfin , point.lat , point.lon , meta=False )
+            return float( x ) , float( y )
+        return float( point.x ) , float( point.y )
+
+    def horizontal( self , field , points=None , origin=( 0 , 0 ) ) :
+        """Interpola field (...,ny,nx) a los puntos del corte. Devuelve (...,npts).
+
+        Si field es solo un recorte de la reticula que empieza en origin = (y0, x0), con
+        points se eligen los puntos del corte (indices) que caen dentro del recorte.
+        """
+        field = np.asarray( field , dtype=float )
+        points = slice( None ) if points is None else points
+        j0 = self.j0[ points ] - origin[0]
+        i0 = self.i0[ points ] - origin[1]
+        fx , fy = self.fx[ points ] , self.fy[ points ]
+        return ( field[ ... , j0 , i0 ] * ( 1 - fx ) * ( 1 - fy ) +
+                 field[ ... , j0 , i0 + 1 ] * fx * ( 1 - fy ) +
+                 field[ ... , j0 + 1 , i0 ] * ( 1 - fx ) * fy +
+                 field[ ... , j0 + 1 , i0 + 1 ] * fx * fy )
+
+    def set_z( self , z , z_path=None ) :
+        """Recalcula los pesos verticales para la altura z de otro tiempo (los niveles no cambian).
+
+        Solo se usan las columnas del corte, asi que es mucho mas barato que un vertcross.
+        """
+        if z_path is None :
+            z_path = self.horizontal( z )
+        self._vinterp = VerticalInterpolator( z_path[ : , np.newaxis , : ] )
+        self._vinterp.weights( self.levels )
+
+    def apply( self , variables , z=None ) :
+        """Corte vertical de todas las variables (cada una de nz,ny,nx).
+
+        Si se pasa z (de este tiempo) se actualizan los pesos verticales. Devuelve un
+        array (nvars,nlevels,npts), NaN donde el nivel queda fuera de la columna.
+        """
+        with stage( 'cross' ) :
+            if z is not None :
+                self.set_z( z )
+            columns = [ self.horizontal( var ) for var in variables ]
+        return self.apply_columns( columns )
+
+    def apply_columns( self , columns , z_path=None ) :
+        """Igual que apply pero con las variables ya interpoladas a los puntos del corte (cada una de nz,npts)."""
+        with stage( 'cross' ) :
+            if z_path is not None :
+                self.set_z( None , z_path )
+            paths = [ np.asarray( column , dtype=float )[ : , np.newaxis , : ] for column in columns ]
+            return self._vinterp.interp( paths , self.levels )[ : , : , 0 , : ]
+
+    def line( self , field ) :
+        """Valores de un campo 2D a lo largo del corte (como interpline)."""
+        return self.horizontal( field )
+
+    def latlon( self , lats , lons ) :
+        """Latitud y longitud de cada punto del corte."""
+        return self.horizontal( lats ) , self.horizontal( lons )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Cache en disco de las variables derivadas que calcula wrf-python (dbz, uvmet, tk, z, td2, ...).
+La primera vez que se pide una variable de un wrfout se calcula con getvar y se guarda;
+las siguientes veces (por ejemplo al volver a graficar cambiando los colores o el corte)
+se lee directamente del cache. La clave depende del archivo (ruta, fecha de modificacion
+y tamanio), de la variable y de sus opciones (units, timeidx, ...), asi que si el wrfout
+cambia el valor guardado deja de usarse.
+
+Con la variable de entorno WRF_CACHE_DIR se elige la carpeta del cache y con
+WRF_CACHE_MAX_MB su tamanio maximo. Cuando se pasa de ese tamanio se borran los
+archivos que hace mas tiempo que no se usan. Con WRF_CACHE_MAX_MB=0 no se usa el cache.
+"""
+
+import os
+import pickle
+import hashlib
+import threading
+from contextlib import contextmanager
+
+from profiling import stage
+
+CACHE_DIR = os.environ.get( 'WRF_CACHE_DIR' , os.path.join( os.path.expanduser('~') , '.cache' , 'modelado' ) )
+CACHE_MAX_MB = float( os.environ.get( 'WRF_CACHE_MAX_MB' , 2048 ) )
+
+#Variables ya calculadas en memoria (solo dentro de un bloque with memoize()).
+_memo = None
+
+#La libreria de netcdf/HDF5 no siempre esta compilada para usarse desde varios threads: todo lo que
+#consulta un Dataset (dataset_key, getvar) se hace con este lock tomado. Es reentrante, asi que una
+#tarea que ya lo tiene (por ejemplo en plot_jobs) puede llamar a cached_getvar.
+NETCDF_LOCK = threading.RLock()
+
+
+def cache_key( filename , varname , **kwargs ) :
+    """Clave del cache para la variable varname del archivo filename con las opciones kwargs."""
+    stat = os.stat( filename )
+    key = [ os.path.abspath( filename ) , stat.st_mtime_ns , stat.st_size , varname ]
+    key += [ str( name ) + '=' + repr( kwargs[ name ] ) for name in sorted( kwargs ) ]
+    return hashlib.sha1( '|'.join( str( item ) for item in key ).encode() ).hexdigest()
+
+
+def dataset_key( ncfile , varname , **kwargs ) :
+    """Clave del cache para la variable varname del wrfout abierto ncfile."""
+    with NETCDF_LOCK :
+        filename , key_kwargs = ncfile.filepath() , kwargs
+        if 'SUBSET_SOURCE' in ncfile.ncattrs() :
+            #Subdominio en memoria (subdomain.open_subset): la clave es la del archivo original y el recorte.
+            filename = ncfile.getncattr('SUBSET_SOURCE')
+            key_kwargs = dict( kwargs , subset=ncfile.getncattr('SUBSET') )
+    return cache_key( filename , varname , **key_kwargs )
+
+
+def cached_getvar( ncfile , varname , cache_dir=None , max_mb=None , **kwargs ) :
+    """Igual que wrf.getvar(ncfile, varname, **kwargs) pero guardando el resultado en el cache.
+
+    Devuelve el mismo objeto (xarray con su metadata) que devolveria getvar. Dentro de
+    un bloque with memoize() el resultado tambien se guarda en memoria, y los siguientes
+    pedidos de la misma variable no leen ni el cache ni el wrfout.
+    """
+    from wrf import getvar
+
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_mb = CACHE_MAX_MB if max_mb is None else max_mb
+
+    key = dataset_key( ncfile , varname , **kwargs )
+    if _memo is not None and key in _memo :
+        return _memo[ key ]
+
+    with stage( 'getvar' , var=varname ) , NETCDF_LOCK :
+        if max_mb <= 0 :
+            var = getvar( ncfile , varname , **kwargs )
+        else :
+            var = _disk_getvar( ncfile , varname , os.path.join( cache_dir , key + '.pkl' ) , cache_dir , max_mb , **kwargs )
+    if _memo is not None :
+        _memo[ key ] = var
+    return var
+
+
+def _disk_getvar( ncfile , varname , cache_file , cache_dir , max_mb , **kwargs ) :
+    """Lee la variable de cache_file o la calcula con getvar y la guarda ahi."""
+    from wrf import getvar
+
+    if os.path.exists( cache_file ) :
+        try :
+            with open( cache_file , 'rb' ) as my_file :
+                var = pickle.load( my_file )
+            #Actualizo la fecha del archivo para saber cuales son los que se usaron hace menos tiempo.
+            os.utime( cache_file )
+            return var
+        except ( OSError , EOFError , pickle.UnpicklingError ) :
+            pass
+
+    var = getvar( ncfile , varname , **kwargs )
+
+    #Escribimos en un archivo temporal y despues lo renombramos, asi otro proceso
+    #que use el mismo cache nunca lee un archivo escrito a medias.
+    os.makedirs( cache_dir , exist_ok=True )
+    tmp_file = cache_file + '.' + str( os.getpid() ) + '.tmp'
+    with open( tmp_file , 'wb' ) as my_file :
+        pickle.dump( var , my_file , protocol=pickle.HIGHEST_PROTOCOL )
+    os.replace( tmp_file , cache_file )
+    evict( cache_dir , max_mb )
+    return var
+
+
+def forget( ncfile , varname , **kwargs ) :
+    """Saca de la memoria de memoize la variable (el cache en disco no cambia)."""
+    if _memo is not None :
+        _memo.pop( dataset_key( ncfile , varname , **kwargs ) , None )
+
+
+@contextmanager
+def memoize() :
+    """Bloque en el que cached_getvar guarda tambien en memoria lo que calcula.
+
+    Sirve para hacer muchas figuras del mismo wrfout: cada variable derivada se calcula
+    (o se lee del cache) una sola vez. Al salir del bloque se libera la memoria.
+    """
+    global _memo
+    previous = _memo
+    _memo = dict() if previous is None else previous
+    try :
+        yield _memo
+    finally :
+        if previous is None :
+            _memo = None
+
+
+def evict( cache_dir=None , max_mb=None ) :
+    """Borra los archivos usados hace mas tiempo hasta que el cache ocupe menos de max_mb."""
+    cache_dir = CACHE_DIR if cache_dir is None else cache_dir
+    max_mb = CACHE_MAX_MB if max_mb is None else max_mb
+
+    if not os.path.isdir( cache_dir ) :
+        return
+    entries = list()
+    for entry in os.scandir( cache_dir ) :
+        if entry.name.endswith('.pkl') :
+            stat = entry.stat()
+            entries.append( ( stat.st_mtime , stat.st_size , entry.path ) )
+    entries.sort()
+
+    total = sum( entry[1] for entry in entries )
+    for mtime , size , path in entries :
+        if total <= max_mb * 1024**2 :
+            break
+        try :
+            os.remove( path )
+        except OSError :
+            pass
+        total = total - size
+
+
+def clear_cache( cache_dir=None ) :
+    """Borra todo el cache."""
+    evict( cache_dir , max_mb=0 )
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Graficado a la resolucion de la figura.
+contourf y contour trabajan sobre todos los puntos de la reticula aunque la figura tenga
+unos pocos cientos de pixeles de ancho (y un corte vertical con autolevels=300 tiene 300
+niveles aunque el panel tenga 250 pixeles de alto), y en dominios grandes armar los
+contornos es lo que mas tarda al dibujar. Aca los campos se promedian en bloques hasta
+tener a lo sumo oversample puntos por pixel antes de graficarlos (coarsen), y los
+sombreados se pueden dibujar con pcolormesh o imshow (una imagen, sin calcular
+contornos) en lugar de contourf (shade).
+
+Ver bench_display.py para la comparacion de tiempos y de diferencias en las imagenes.
+"""
+
+import warnings
+
+import numpy as np
+
+DISPLAY_OVERSAMPLE = 1    #Puntos de la reticula por pixel que se dejan al promediar.
+AUTO_RASTER_LEVELS = 20   #Con method='auto' se usa pcolormesh si hay mas de estos niveles de sombreado.
+SHADING_METHODS    = ( 'contourf' , 'pcolormesh' , 'imshow' , 'auto' )
+
+
+def axes_pixels( ax ) :
+    """Alto y ancho del eje ax en pixeles de la figura."""
+    bbox = ax.get_window_extent()
+    return bbox.height , bbox.width
+
+
+def display_factor( shape , ax , oversample=DISPLAY_OVERSAMPLE ) :
+    """Tamanio ( fy , fx ) de los bloques para que un campo de shape = (..., ny, nx) tenga a lo sumo oversample puntos por pixel del eje ax."""
+    height , width = axes_pixels( ax )
+    ny , nx = shape[-2:]
+    fy = max( int( ny // max( oversample * height , 1 ) ) , 1 )
+    fx = max( int( nx // max( oversample * width , 1 ) ) , 1 )
+    return fy , fx
+
+
+def coarsen( field , factor ) :
+    """Promedio en bloques de factor = ( fy , fx ) puntos de las dos ultimas dimensiones de field.
+
+    Los bordes que no completan un bloque se promedian con los puntos que tengan y los NaN
+    no se cuentan (un bloque solo es NaN si todos sus puntos lo son). Sirve tambien para
+    las lats y lons, que quedan en el centro de cada bloque.
+    """
+    fy , fx = factor
+    field = np.asarray( field , dtype=float )
+    if fy == 1 and fx == 1 :
+        return field
+    ny , nx = field.shape[-2:]
+    pad = [ ( 0 , 0 ) ] * ( field.ndim - 2 ) + [ ( 0 , -ny % fy ) , ( 0 , -nx % fx ) ]
+    field = np.pad( field , pad , constant_values=np.nan )
+    blocks = field.reshape( field.shape[:-2] + ( field.shape[-2] // fy , fy , field.shape[-1] // fx , fx ) )
+    with warnings.catch_warnings() :
+        warnings.simplefilter( 'ignore' , RuntimeWarning )
+        return np.nanmean( blocks , axis=( -3 , -1 ) )
+
+
+def coarsen_1d( values , factor ) :
+    """Promedio en bloques de factor puntos de un vector (coordenadas de un corte: niveles o puntos)."""
+    return coarsen( np.asarray( values , dtype=float )[ np.newaxis ] , ( 1 , factor ) )[0]
+
+
+def to_display( ax , x , y , *fields , oversample=DISPLAY_OVERSAMPLE ) :
+    """Coordenadas y campos promediados a la resolucion del eje ax.
+
+    x e y pueden ser 2D (lons y lats, del mismo tamanio que los campos) o 1D (por ejemplo
+    los puntos y los niveles de un corte vertical). Devuelve x , y y los campos promediados.
+    """
+    factor = display_factor( np.shape( fields[0] ) , ax , oversample )
+    if np.ndim( x ) == 2 :
+        x , y = coarsen( x , factor ) , coarsen( y , factor )
+    else :
+        x , y = coarsen_1d( x , factor[1] ) , coarsen_1d( y , factor[0] )
+    return ( x , y ) + tuple( coarsen( field , factor ) for field in fields )
+
+
+def level_colors( levels , cmap , extend='neither' ) :
+    """Colormap y norma que dan los mismos colores que contourf( levels=levels , cmap=cmap , extend=extend )."""
+    import matplotlib
+    from matplotlib.colors import BoundaryNorm, ListedColormap, Normalize
+    cmap = matplotlib.colormaps[ cmap ] if isinstance( cmap , str ) else cmap
+    levels = np.asarray( levels , dtype=float )
+    #contourf pinta cada capa con el color del valor medio de la capa.
+    middle = 0.5 * ( levels[:-1] + levels[1:] )
+    colors = cmap( Normalize( levels[0] , levels[-1] )( middle ) )
+    listed = ListedColormap( colors )
+    under = cmap( 0.0 ) if extend in ( 'min' , 'both' ) else ( 0 , 0 , 0 , 0 )
+    over = cmap( 1.0 ) if extend in ( 'max' , 'both' ) else ( 0 , 0 , 0 , 0 )
+    listed = listed.with_extremes( under=under , over=over , bad=( 0 , 0 , 0 , 0 ) )
+    return listed , BoundaryNorm( levels , listed.N )
+
+
+def shade( ax , x , y , field , levels , cmap=None , method='contourf' , extend='neither' ) :
+    """Sombreado de field con los niveles levels, como contourf pero eligiendo como se dibuja.
+
+    method es 'contourf', 'pcolormesh' (una celda por punto, sin calcular contornos),
+    'imshow' (una imagen; solo para reticulas regulares, por ejemplo un corte vertical con
+    niveles equiespaciados) o 'auto' (pcolormesh si hay mas de AUTO_RASTER_LEVELS niveles).
+    pcolormesh e imshow usan los mismos colores por nivel que contourf. Devuelve el artista
+    (sirve para la colorbar).
+    """
+    if method == 'auto' :
+        method = 'pcolormesh' if len( levels ) - 1 > AUTO_RASTER_LEVELS else 'contourf'
+    if method == 'contourf' :
+        return ax.contourf( x , y , field , levels=levels , cmap=cmap , extend=extend )
+    import matplotlib
+    listed , norm = level_colors( levels , cmap if cmap is not None else matplotlib.rcParams['image.cmap'] , extend )
+    field = np.ma.masked_invalid( field )
+    if method == 'pcolormesh' :
+        return ax.pcolormesh( x , y , field , cmap=listed , norm=norm , shading='nearest' , rasterized=True )
+    if method == 'imshow' :
+        #La imagen ocupa el rectangulo de las coordenadas (como si la reticula fuera regular).
+        dx = 0.5 * ( np.max( x ) - np.min( x ) ) / max( np.shape( field )[1] - 1 , 1 )
+        dy = 0.5 * ( np.max( y ) - np.min( y ) ) / max( np.shape( field )[0] - 1 , 1 )
+        extent = [ np.min( x ) - dx , np.max( x ) + dx , np.min( y ) - dy , np.max( y ) + dy ]
+        limits = ax.axis()
+        image = ax.imshow( field , cmap=listed , norm=norm , extent=extent , origin='lower' , aspect='auto' ,
+                           interpolation='nearest' )
+        ax.axis( limits )
+        return image
+    raise ValueError( 'method tiene que ser uno de ' + str( SHADING_METHODS ) )
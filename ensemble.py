@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Extraccion del mismo corte (nivel, corte vertical, superficie o puntos) de varias corridas
+(miembros de un ensamble o experimentos de sensibilidad) y estadisticas del ensamble.
+Cada miembro y tiempo es una tarea independiente que se ejecuta en un pool de procesos;
+cada tarea lee los campos de su wrfout y devuelve solo el corte pedido, asi que al proceso
+principal solo llegan arrays chicos que se apilan en un array (miembro, ...). La media,
+la dispersion, el minimo y el maximo se calculan sobre ese array a lo largo de los miembros y las
+diferencias contra un miembro de referencia salen del mismo array, sin volver a leer los
+campos de ningun miembro.
+"""
+
+import warnings
+
+import numpy as np
+
+from parallel_utils import ordered_map, run_parallel
+from wrf_run import WrfRun, open_wrfout
+
+#Variables de getvar que devuelven mas de un campo (se separan en sus componentes).
+MULTI_FIELD = ( 'uvmet' , 'uvmet10' , 'wspd_wdir' , 'uvmet_wspd_wdir' )
+
+
+def _fields( ncfile , variables , timeidx=0 ) :
+    """Campos (como arrays) de las variables [ ( nombre , opciones ) , ... ], separando las componentes."""
+    from wrf import to_np
+    from diag_cache import cached_getvar
+    fields = list()
+    for varname , kwargs in variables :
+        field = to_np( cached_getvar( ncfile , varname , timeidx=timeidx , **kwargs ) )
+        if varname in MULTI_FIELD :
+            fields.extend( field )
+        else :
+            fields.append( field )
+    return fields
+
+
+def member_level( ncfile , variables , niveles , timeidx=0 ) :
+    """Variables interpoladas a las alturas niveles (m). Devuelve (nfields,nlev,ny,nx)."""
+    from wrf import to_np
+    from diag_cache import cached_getvar
+    from vinterp import VerticalInterpolator
+    z = to_np( cached_getvar( ncfile , 'height' , units='m' , timeidx=timeidx ) )
+    return VerticalInterpolator( z ).interp( _fields( ncfile , variables , timeidx ) , niveles )
+
+
+def member_cross( ncfile , variables , cross_start , cross_end , levels , timeidx=0 ) :
+    """Corte vertical de las variables entre cross_start y cross_end en las alturas levels. Devuelve (nfields,nlevels,npts).
+
+    Los niveles se fijan (no se eligen con autolevels) para que todos los miembros tengan el mismo corte.
+    """
+    from wrf import to_np
+    from diag_cache import cached_getvar
+    from cross_section import CrossSection
+    z = to_np( cached_getvar( ncfile , 'z' , timeidx=timeidx ) )
+    cross = CrossSection( z , cross_start , cross_end , wrfin=ncfile , levels=levels )
+    return cross.apply( _fields( ncfile , variables , timeidx ) , z=z )
+
+
+def member_surface( ncfile , variables , timeidx=0 ) :
+    """Campos 2D de las variables (T2, td2, uvmet10, ...). Devuelve (nfields,ny,nx)."""
+    return np.stack( [ np.asarray( field , dtype=float ) for field in _fields( ncfile , variables , timeidx ) ] )
+
+
+PRODUCTS = {
+    'level'   : member_level ,
+    'cross'   : member_cross ,
+    'surface' : member_surface ,
+}
+
+
+def member_task( task ) :
+    """Tarea para el pool de procesos: el corte product de un miembro en un tiempo."""
+    filename , timeidx , product , args = task
+    with open_wrfout( filename ) as ncfile :
+        return PRODUCTS[ product ]( ncfile , *args , timeidx=timeidx )
+
+
+def ensemble_runs( paths , domain='d01' ) :
+    """WrfRun de cada experimento (una carpeta por miembro). Todos tienen que tener los mismos tiempos."""
+    runs = [ WrfRun( path , domain ) for path in paths ]
+    for path , run in zip( paths , runs ) :
+        if run.ntimes != runs[0].ntimes or np.any( run.times != runs[0].times ) :
+            raise ValueError( 'Los tiempos de ' + path + ' no coinciden con los de ' + paths[0] )
+    return runs
+
+
+def extract_ensemble( runs , product , args , plot_times , nworkers=None ) :
+    """Generador con ( plot_time , stack ) para cada tiempo de plot_times.
+
+    stack es el array (nmembers, ...) con el corte product (ver PRODUCTS) de cada miembro,
+    calculado con PRODUCTS[ product ]( ncfile , *args ). Los miembros y los tiempos
+    se reparten entre nworkers procesos y los tiempos se devuelven en orden.
+    """
+    plot_times = list( plot_times )
+    tasks = list()
+    for plot_time in plot_times :
+        for run in runs :
+            ifile , timeidx = run.locate( plot_time )
+            tasks.append( ( run.file_list[ ifile ] , timeidx , product , args ) )
+    members = list()
+    for result in ordered_map( member_task , tasks , nworkers ) :
+        members.append( result )
+        if len( members ) == len( runs ) :
+            yield plot_times.pop( 0 ) , np.stack( members )
+            members = list()
+
+
+def _point_task( task ) :
+    from point_series import extract_points
+    path , domain , points , variables = task
+    return extract_points( WrfRun( path , domain ) , points , variables )
+
+
+def extract_ensemble_points( paths , points , variables=( 'T2C' , 'td2' ) , domain='d01' , nworkers=None ) :
+    """Series en los puntos de reticula points de todos los experimentos.
+
+    Devuelve times y un array (nmembers, ntimes, npoints, nvars).
+    """
+    results = run_parallel( _point_task , [ ( path , domain , points , variables ) for path in paths ] , nworkers , verbose=False )
+    times = results[0][0]
+    for path , ( member_times , data ) in zip( paths , results ) :
+        if len( member_times ) != len( times ) or np.any( member_times != times ) :
+            raise ValueError( 'Los tiempos de ' + path + ' no coinciden con los de ' + paths[0] )
+    return times , np.stack( [ data for member_times , data in results ] )
+
+
+def ensemble_stats( stack , ddof=1 ) :
+    """Media, dispersion (desvio estandar entre miembros), minimo y maximo de stack (nmembers, ...).
+
+    Se calculan a lo largo del eje de los miembros con las funciones de numpy que ignoran los
+    NaN (por ejemplo niveles debajo del terreno), acumulando en float64 pero sin pasar todo el
+    stack a float64 (uno de float32 se queda en float32). Devuelve un diccionario con mean,
+    spread, min, max y count (cantidad de miembros validos en cada punto); donde no hay
+    miembros validos todo es NaN y la dispersion es NaN si count <= ddof.
+    """
+    stack = np.asarray( stack )
+    if not np.issubdtype( stack.dtype , np.floating ) :
+        stack = stack.astype( float )
+    count = np.count_nonzero( ~np.isnan( stack ) , axis=0 )
+    #Los puntos sin miembros validos (o con menos de ddof + 1) dan NaN con un aviso que no hace falta.
+    with warnings.catch_warnings() :
+        warnings.simplefilter( 'ignore' , RuntimeWarning )
+        mean = np.nanmean( stack , axis=0 , dtype=np.float64 )
+        spread = np.nanstd( stack , axis=0 , dtype=np.float64 , ddof=ddof )
+        low = np.nanmin( stack , axis=0 )
+        high = np.nanmax( stack , axis=0 )
+    spread[ count <= ddof ] = np.nan
+    return { 'mean' : mean , 'spread' : spread , 'min' : low , 'max' : high , 'count' : count }
+
+
+def differences( stack , reference=0 ) :
+    """Diferencia de cada miembro contra el miembro reference (mismo array, sin volver a leer nada)."""
+    stack = np.asarray( stack )
+    return stack - stack[ reference ][ np.newaxis ]
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Plantillas de figuras para graficar muchos tiempos sin rehacer toda la figura.
+La parte fija de cada figura (ejes, grilla, mapa, terreno, ubicacion del corte o del
+meteograma, limites y titulos) se dibuja una sola vez y se guarda como imagen. En
+cada frame solo se dibujan encima los artistas que cambian con el tiempo (contourf,
+contour, barbas, colorbars que cambian de niveles, series temporales).
+"""
+
+import os
+
+import numpy as np
+
+from image_output import write_image, release_figure
+from profiling import stage
+
+
+class FigureTemplate :
+    """Figura con un fondo fijo y artistas que cambian en cada frame.
+
+    update(...)       artistas del frame (se borran con clear()).
+    overlay(...)      artistas fijos que tienen que quedar arriba de los del frame (mapa, terreno).
+    dynamic_axes(...) ejes que se borran y se redibujan completos en cada frame
+                      (colorbars con niveles que cambian, series temporales).
+    El fondo se guarda la primera vez que se llama a render() o save(). Si directory no es
+    None los nombres relativos de save() se toman desde esa carpeta (y no desde la actual).
+    """
+
+    def __init__( self , fig ) :
+        self.fig = fig
+        self.background = None
+        self._dynamic = list()
+        self._overlays = list()
+        self._dynamic_axes = list()
+        #Si frames es una lista, save() agrega ahi las imagenes en lugar de escribirlas (animaciones).
+        self.frames = None
+        self.directory = None
+
+    def update( self , *artists ) :
+        for artist in artists :
+            artist.set_animated( True )
+            self._dynamic.append( artist )
+        return artists[0] if len( artists ) == 1 else artists
+
+    def overlay( self , *artists ) :
+        for artist in artists :
+            #Si es una lista (como la que devuelve plot) agregamos cada elemento.
+            for item in ( artist if isinstance( artist , list ) else [ artist ] ) :
+                item.set_animated( True )
+                self._overlays.append( item )
+
+    def dynamic_axes( self , *axes ) :
+        for ax in axes :
+            ax.set_animated( True )
+            self._dynamic_axes.append( ax )
+
+    def clear( self ) :
+        """Borra los artistas del frame anterior y limpia los ejes dinamicos."""
+        for artist in self._dynamic :
+            try :
+                artist.remove()
+            except ( ValueError , NotImplementedError ) :
+                pass   #Ya se habia borrado junto con otro artista (por ejemplo los clabel de un contour).
+        self._dynamic = list()
+        for ax in self._dynamic_axes :
+            ax.cla()
+
+    def freeze( self ) :
+        """Dibuja la parte fija de la figura y la guarda como imagen."""
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox( self.fig.bbox )
+
+    def render( self ) :
+        """Dibuja el frame sobre el fondo y devuelve la imagen RGBA (alto,ancho,4)."""
+        with stage( 'render' ) :
+            return self._render()
+
+    def _render( self ) :
+        if self.background is None :
+            self.freeze()
+        canvas = self.fig.canvas
+        renderer = canvas.get_renderer()
+        canvas.restore_region( self.background )
+
+        #En cada eje dibujamos los artistas del frame y los fijos que van arriba, ordenados por zorder,
+        #y volvemos a dibujar la grilla y el borde para que queden sobre los sombreados.
+        axes = list()
+        for artist in self._dynamic + self._overlays :
+            if artist.axes is not None and artist.axes not in axes :
+                axes.append( artist.axes )
+        for ax in axes :
+            artists = [ artist for artist in self._dynamic + self._overlays if artist.axes is ax ]
+            for axis in ( ax.xaxis , ax.yaxis ) :
+                artists += [ tick.gridline for tick in axis.get_major_ticks() if tick.gridline.get_visible() ]
+            artists += list( ax.spines.values() )
+            for artist in sorted( artists , key=lambda artist : artist.get_zorder() ) :
+                artist.draw( renderer )
+
+        for ax in self._dynamic_axes :
+            ax.draw( renderer )
+        return np.asarray( canvas.buffer_rgba() )
+
+    def finalize( self ) :
+        """Deja visible el ultimo frame para mostrar la figura con plt.show()."""
+        for artist in self._dynamic + self._overlays + self._dynamic_axes :
+            artist.set_animated( False )
+
+    def save( self , filename , **options ) :
+        """Guarda el frame en filename (png, webp o rgba, ver image_output.write_image)."""
+        if self.frames is not None :
+            self.frames.append( self.render().copy() )
+            return filename
+        if self.directory is not None :
+            filename = os.path.join( self.directory , filename )
+        rgba = self.render()
+        with stage( 'save' ) :
+            return write_image( rgba , filename , **options )
+
+    def close( self ) :
+        """Libera la figura cuando ya no se van a guardar mas frames."""
+        self.background = None
+        self._dynamic = list()
+        self._overlays = list()
+        self._dynamic_axes = list()
+        release_figure( self.fig )
+
+
+def make_axes( ax ) :
+    """Eje para la colorbar de ax (matplotlib se importa recien al crear la primera figura)."""
+    from matplotlib.colorbar import make_axes as colorbar_axes
+    return colorbar_axes( ax )
+
+
+class HorizontalTemplate( FigureTemplate ) :
+    """Corte horizontal: un panel (ax) con su colorbar (cax), que cambia de niveles en cada frame."""
+
+    def __init__( self , fig ) :
+        FigureTemplate.__init__( self , fig )
+        self.ax = fig.add_subplot(111)
+        self.cax , kwargs = make_axes( self.ax )
+        self.dynamic_axes( self.cax )
+
+
+class CrossSectionTemplate( FigureTemplate ) :
+    """Corte vertical: panel con la ubicacion del corte (ax1, fijo) y panel con el corte (ax2)."""
+
+    def __init__( self , fig ) :
+        FigureTemplate.__init__( self , fig )
+        self.ax1 = fig.add_subplot(121)
+        self.ax2 = fig.add_subplot(122)
+        self.cax1 , kwargs = make_axes( self.ax1 )
+        self.cax2 , kwargs = make_axes( self.ax2 )
+
+
+class MeteogramTemplate( FigureTemplate ) :
+    """Meteograma: panel con la ubicacion del punto (ax1, fijo) y panel con las series (ax2)."""
+
+    def __init__( self , fig ) :
+        FigureTemplate.__init__( self , fig )
+        self.ax1 = fig.add_subplot(121)
+        self.ax2 = fig.add_subplot(122)
+        self.cax1 , kwargs = make_axes( self.ax1 )
+        self.dynamic_axes( self.ax2 )
+
+
+class EnsembleTemplate( FigureTemplate ) :
+    """Paneles de un ensamble (miembros, media, dispersion y diferencias) en una grilla de ncols columnas.
+
+    axes tiene un eje por panel (los de la grilla que sobran se ocultan). Las colorbars
+    tienen niveles fijos, asi que se dibujan una sola vez con el fondo.
+    """
+
+    def __init__( self , fig , npanels , ncols=4 ) :
+        FigureTemplate.__init__( self , fig )
+        ncols = min( ncols , npanels )
+        nrows = -( -npanels // ncols )
+        axes = fig.subplots( nrows , ncols , sharex=True , sharey=True , squeeze=False ).ravel()
+        self.axes = list( axes[ :npanels ] )
+        for ax in axes[ npanels: ] :
+            ax.set_visible( False )
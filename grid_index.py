@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Indice espacial de la reticula del WRF para ubicar muchas estaciones a la vez.
+En lugar de llamar a ll_to_xy una vez por estacion (que rehace la proyeccion en cada
+llamada) se arma un KD-tree con las latitudes y longitudes de la reticula y se ubican
+todas las estaciones en una sola consulta vectorizada. Opcionalmente se calculan los
+pesos de la interpolacion bilineal de los 4 puntos que rodean a cada estacion.
+
+El indice se guarda en la carpeta del cache en disco de diag_cache con una clave que
+depende solo de las latitudes y longitudes, asi que para otra corrida sobre el mismo
+dominio no hace falta volver a armarlo. Va en una subcarpeta (GRID_INDEX_DIR) para que
+evict y clear_cache, que solo limpian las variables derivadas, no lo borren.
+"""
+
+import os
+import pickle
+import hashlib
+
+import numpy as np
+
+from diag_cache import CACHE_DIR
+
+#Subcarpeta del cache donde se guardan los indices.
+GRID_INDEX_DIR = 'grid_index'
+
+#Indices ya cargados en este proceso.
+_indexes = dict()
+
+
+def _to_xyz( lats , lons ) :
+    """Pasa lat/lon (grados) a puntos sobre la esfera unidad, para que las distancias no dependan de la latitud."""
+    lats = np.radians( np.asarray( lats , dtype=float ) )
+    lons = np.radians( np.asarray( lons , dtype=float ) )
+    return np.stack( [ np.cos( lats ) * np.cos( lons ) , np.cos( lats ) * np.sin( lons ) , np.sin( lats ) ] , axis=-1 )
+
+
+class GridIndex :
+    """KD-tree sobre los puntos de una reticula con latitudes y longitudes lats, lons (ny,nx)."""
+
+    def __init__( self , lats , lons ) :
+        from scipy.spatial import cKDTree
+        self.lats = np.asarray( lats , dtype=float )
+        self.lons = np.asarray( lons , dtype=float )
+        self.ny , self.nx = self.lats.shape
+        self.tree = cKDTree( _to_xyz( self.lats , self.lons ).reshape( -1 , 3 ) )
+
+    def nearest( self , lats , lons ) :
+        """Punto de reticula mas cercano a cada estacion. Devuelve iy, ix (arrays de enteros)."""
+        distance , ipoint = self.tree.query( _to_xyz( np.atleast_1d( lats ) , np.atleast_1d( lons ) ) )
+        return ipoint // self.nx , ipoint % self.nx
+
+    def fractional( self , lats , lons ) :
+        """Posicion (y, x) de cada estacion en la reticula, en unidades de puntos de reticula.
+
+        Se parte del punto mas cercano y se corrige con el gradiente local de lat y lon
+        (la reticula es casi cartesiana entre dos puntos vecinos).
+        """
+        lats = np.atleast_1d( np.asarray( lats , dtype=float ) )
+        lons = np.atleast_1d( np.asarray( lons , dtype=float ) )
+        iy , ix = self.nearest( lats , lons )
+        ny , nx = self.ny , self.nx
+        #Diferencias centradas (o laterales en el borde) de lat y lon en x e y.
+        ixm , ixp = np.maximum( ix - 1 , 0 ) , np.minimum( ix + 1 , nx - 1 )
+        iym , iyp = np.maximum( iy - 1 , 0 ) , np.minimum( iy + 1 , ny - 1 )
+        coslat = np.cos( np.radians( self.lats[ iy , ix ] ) )
+        jac = np.empty( ( lats.size , 2 , 2 ) )
+        jac[ : , 0 , 0 ] = ( self.lons[ iy , ixp ] - self.lons[ iy , ixm ] ) * coslat / ( ixp - ixm )
+        jac[ : , 0 , 1 ] = ( self.lons[ iyp , ix ] - self.lons[ iym , ix ] ) * coslat / ( iyp - iym )
+        jac[ : , 1 , 0 ] = ( self.lats[ iy , ixp ] - self.lats[ iy , ixm ] ) / ( ixp - ixm )
+        jac[ : , 1 , 1 ] = ( self.lats[ iyp , ix ] - self.lats[ iym , ix ] ) / ( iyp - iym )
+        delta = np.stack( [ ( lons - self.lons[ iy , ix ] ) * coslat , lats - self.lats[ iy , ix ] ] , axis=-1 )
+        dx , dy = np.linalg.solve( jac , delta[ : , : , np.newaxis ] )[ : , : , 0 ].T
+        return iy + dy , ix + dx
+
+    def bilinear( self , lats , lons ) :
+        """Puntos y pesos de la interpolacion bilineal para cada estacion.
+
+        Devuelve iy, ix (nstations,4) con los 4 puntos de reticula que rodean a cada
+        estacion, weights (nstations,4) y inside (True si la estacion esta dentro del dominio).
+        """
+        y , x = self.fractional( lats , lons )
+        inside = ( x >= 0 ) & ( x <= self.nx - 1 ) & ( y >= 0 ) & ( y <= self.ny - 1 )
+        x = np.clip( x , 0 , self.nx - 1 )
+        y = np.clip( y , 0 , self.ny - 1 )
+        i0 = np.minimum( np.floor( x ).astype(int) , self.nx - 2 )
+        j0 = np.minimum( np.floor( y ).astype(int) , self.ny - 2 )
+        fx = x - i0
+        fy = y - j0
+        iy = np.stack( [ j0 , j0 , j0 + 1 , j0 + 1 ] , axis=1 )
+        ix = np.stack( [ i0 , i0 + 1 , i0 , i0 + 1 ] , axis=1 )
+        weights = np.stack( [ ( 1 - fx ) * ( 1 - fy ) , fx * ( 1 - fy ) , ( 1 - fx ) * fy , fx * fy ] , axis=1 )
+        return iy , ix , weights , inside
+
+    def interpolate( self , field , lats , lons ) :
+        """Valores del campo field (...,ny,nx) interpolados a las estaciones. Devuelve (...,nstations)."""
+        iy , ix , weights , inside = self.bilinear( lats , lons )
+        return np.sum( np.asarray( field )[ ... , iy , ix ] * weights , axis=-1 )
+
+
+def grid_key( lats , lons ) :
+    """Clave del dominio: depende solo de las latitudes y longitudes de la reticula."""
+    lats = np.ascontiguousarray( lats , dtype=np.float64 )
+    lons = np.ascontiguousarray( lons , dtype=np.float64 )
+    return hashlib.sha1( repr( lats.shape ).encode() + lats.tobytes() + lons.tobytes() ).hexdigest()
+
+
+def get_grid_index( lats , lons , cache_dir=None ) :
+    """GridIndex de la reticula (lats, lons), armado una sola vez por dominio.
+
+    Primero se busca en este proceso, despues en el cache en disco y si no esta se arma y se guarda.
+    """
+    key = grid_key( lats , lons )
+    if key in _indexes :
+        return _indexes[ key ]
+
+    cache_dir = os.path.join( CACHE_DIR if cache_dir is None else cache_dir , GRID_INDEX_DIR )
+    cache_file = os.path.join( cache_dir , 'grid_index_' + key + '.pkl' )
+    index = None
+    if os.path.exists( cache_file ) :
+        try :
+            with open( cache_file , 'rb' ) as my_file :
+                index = pickle.load( my_file )
+            os.utime( cache_file )
+        except ( OSError , EOFError , pickle.UnpicklingError ) :
+            index = None
+    if index is None :
+        index = GridIndex( lats , lons )
+        os.makedirs( cache_dir , exist_ok=True )
+        tmp_file = cache_file + '.' + str( os.getpid() ) + '.tmp'
+        with open( tmp_file , 'wb' ) as my_file :
+            pickle.dump( index , my_file , protocol=pickle.HIGHEST_PROTOCOL )
+        os.replace( tmp_file , cache_file )
+
+    _indexes[ key ] = index
+    return index
+
+
+def file_grid_index( ncfile , cache_dir=None ) :
+    """GridIndex de la reticula de un wrfout abierto (usa XLAT y XLONG del primer tiempo)."""
+    lats = ncfile.variables['XLAT'][0]
+    lons = ncfile.variables['XLONG'][0]
+    return get_grid_index( lats , lons , cache_dir )
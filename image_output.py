@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Escritura de los frames a disco sin pasar por savefig.
+Las figuras se dibujan con Agg y la imagen RGBA que queda en el canvas se escribe
+directamente en png (con un nivel de compresion configurable), webp o RGBA crudo.
+Con la compresion por defecto de savefig (nivel 6) guardar el png suele tardar mas
+que dibujar el frame; con nivel 1 los archivos quedan algo mas grandes pero se
+escriben varias veces mas rapido.
+"""
+
+import numpy as np
+
+#Nivel de compresion de los png (0 = sin comprimir, 9 = maxima compresion).
+PNG_COMPRESS_LEVEL = 1
+#Calidad de los webp (None = webp sin perdida).
+WEBP_QUALITY = None
+
+#Formatos soportados, segun la extension del archivo.
+FORMATS = ( 'png' , 'webp' , 'rgba' )
+
+
+def image_format( filename ) :
+    """Formato de la imagen segun la extension de filename."""
+    fmt = filename.rsplit( '.' , 1 )[-1].lower()
+    if fmt not in FORMATS :
+        raise ValueError( 'Formato de imagen no soportado: ' + fmt + ' (usar ' + ', '.join( FORMATS ) + ')' )
+    return fmt
+
+
+def write_image( rgba , filename , compress_level=PNG_COMPRESS_LEVEL , quality=WEBP_QUALITY ) :
+    """Escribe la imagen rgba (alto,ancho,4) en filename.
+
+    El formato se elige por la extension: .png, .webp o .rgba. Los .rgba son los bytes
+    crudos de la imagen (alto*ancho*4 bytes, fila por fila desde arriba), que se pueden
+    leer con np.fromfile( filename , np.uint8 ).reshape( alto , ancho , 4 ) o pasar a
+    ffmpeg con -f rawvideo -pix_fmt rgba -s anchoxalto.
+    """
+    fmt = image_format( filename )
+    if fmt == 'rgba' :
+        np.ascontiguousarray( rgba ).tofile( filename )
+        return filename
+
+    from PIL import Image
+    image = Image.fromarray( np.asarray( rgba ) )
+    if fmt == 'png' :
+        image.save( filename , format='PNG' , compress_level=compress_level )
+    else :
+        if quality is None :
+            image.save( filename , format='WEBP' , lossless=True , method=0 )
+        else :
+            image.save( filename , format='WEBP' , quality=quality , method=0 )
+    return filename
+
+
+def release_figure( fig ) :
+    """Libera la memoria de la figura (sus artistas y el canvas) y la saca de pyplot."""
+    fig.clf()
+    #Las figuras de batch_utils.new_figure no estan en pyplot.
+    if fig.canvas.manager is not None :
+        import matplotlib.pyplot as plt
+        plt.close( fig )
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Mapa de provincias y costas (mapas.mat) para superponer a las figuras.
+El archivo se lee una sola vez por proceso, las lineas se recortan al dominio del
+WRF y se simplifican a la resolucion en pixeles de la figura. El resultado se guarda
+y se reutiliza en todos los frames, asi que savefig tiene que dibujar muchos menos puntos.
+"""
+
+import numpy as np
+
+MAP_FILE = './mapas.mat'
+MAP_KEYS = ( 'provincias' , 'samerica' )
+
+#Archivos .mat ya leidos y lineas ya recortadas, por proceso.
+_mapas = dict()
+_lines = dict()
+
+
+def load_map( filename=MAP_FILE ) :
+    """Lee el archivo .mat con los mapas (una sola vez por proceso)."""
+    if filename not in _mapas :
+        import scipy.io as sio
+        _mapas[ filename ] = sio.loadmat( filename )
+    return _mapas[ filename ]
+
+
+def clip_line( line , bbox , margin=0.0 ) :
+    """Recorta una linea (N,2) con NaN separando tramos a bbox = [lonmin, lonmax, latmin, latmax].
+
+    Se conservan los puntos de adentro y los segmentos que pueden pasar por bbox (los que
+    tienen su propio rectangulo superpuesto con bbox), asi la linea llega hasta el borde de
+    la figura aunque un segmento la cruce con los dos extremos afuera. Los tramos eliminados
+    se cambian por NaN.
+    """
+    lonmin , lonmax , latmin , latmax = bbox
+    x , y = line[:,0] , line[:,1]
+    inside = ( x >= lonmin - margin ) & ( x <= lonmax + margin ) & ( y >= latmin - margin ) & ( y <= latmax + margin )
+    x0 , x1 , y0 , y1 = x[:-1] , x[1:] , y[:-1] , y[1:]
+    #Los segmentos con un extremo NaN (cortes entre tramos) no se superponen con nada.
+    segment = ( ( np.minimum( x0 , x1 ) <= lonmax + margin ) & ( np.maximum( x0 , x1 ) >= lonmin - margin ) &
+                ( np.minimum( y0 , y1 ) <= latmax + margin ) & ( np.maximum( y0 , y1 ) >= latmin - margin ) )
+    keep = inside.copy()
+    keep[:-1] |= segment
+    keep[1:] |= segment
+    clipped = np.where( keep[ : , np.newaxis ] , line , np.nan )
+    return _drop_repeated( clipped )
+
+
+def simplify_line( line , tolerance ) :
+    """Simplifica la linea juntando los puntos que caen en la misma celda de tamanio tolerance.
+
+    Con tolerance igual al tamanio de un pixel la figura se ve igual pero con muchos menos puntos.
+    """
+    if tolerance <= 0 :
+        return line
+    snapped = np.round( line / tolerance ) * tolerance
+    return _drop_repeated( snapped )
+
+
+def _drop_repeated( line ) :
+    """Elimina puntos consecutivos repetidos (incluyendo varios NaN seguidos)."""
+    if line.shape[0] < 2 :
+        return line
+    same = np.all( ( line[1:] == line[:-1] ) | ( np.isnan( line[1:] ) & np.isnan( line[:-1] ) ) , axis=1 )
+    keep = np.concatenate( ( [ True ] , ~same ) )
+    return line[ keep ]
+
+
+def pixel_size( ax , bbox ) :
+    """Tamanio de un pixel de ax en grados (el menor entre lon y lat)."""
+    extent = ax.get_window_extent()
+    return min( ( bbox[1] - bbox[0] ) / max( extent.width , 1.0 ) , ( bbox[3] - bbox[2] ) / max( extent.height , 1.0 ) )
+
+
+def get_map_lines( bbox , tolerance=0.0 , filename=MAP_FILE , keys=MAP_KEYS ) :
+    """Lineas del mapa recortadas a bbox y simplificadas a tolerance (en grados).
+
+    El resultado se guarda para no recalcularlo en cada frame.
+    """
+    key = ( filename , tuple( np.round( bbox , 4 ) ) , round( tolerance , 6 ) , tuple( keys ) )
+    if key not in _lines :
+        mapa = load_map( filename )
+        lines = list()
+        for name in keys :
+            line = clip_line( np.asarray( mapa[ name ][ : , :2 ] , dtype=float ) , bbox , margin=tolerance )
+            lines.append( simplify_line( line , tolerance ) )
+        _lines[ key ] = lines
+    return _lines[ key ]
+
+
+def draw_map( ax , lons , lats , filename=MAP_FILE , keys=MAP_KEYS ) :
+    """Agrega el mapa a ax recortado al dominio (lons, lats) y simplificado al tamanio de los pixeles."""
+    bbox = [ np.nanmin( lons ) , np.nanmax( lons ) , np.nanmin( lats ) , np.nanmax( lats ) ]
+    lines = get_map_lines( bbox , pixel_size( ax , bbox ) , filename , keys )
+    artists = list()
+    for line in lines :
+        artists += ax.plot( line[:,0] , line[:,1] , color='k' , lw=0.5 , zorder=1 )
+    return artists
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Reparte el graficado de muchos tiempos entre varios procesos.
+Cada tiempo (cada wrfout) se procesa de forma independiente asi que se puede
+graficar en paralelo sin cambiar los nombres de las figuras.
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def get_nworkers( nworkers=None ) :
+    """Cantidad de procesos a usar. Si nworkers es None se usan todos los cores disponibles."""
+    if nworkers is None or nworkers < 1 :
+        nworkers = os.cpu_count() or 1
+    return nworkers
+
+
+def run_parallel( worker , tasks , nworkers=None , verbose=True ) :
+    """Ejecuta worker(task) para cada task de la lista tasks usando un pool de procesos.
+
+    worker tiene que ser una funcion definida a nivel de modulo (para que se pueda
+    mandar a los otros procesos). Los resultados se devuelven en el mismo orden que
+    tasks y el progreso se reporta tambien en ese orden, aunque los procesos terminen
+    en otro orden.
+    """
+    tasks = list( tasks )
+    ntasks = len( tasks )
+    nworkers = min( get_nworkers( nworkers ) , max( ntasks , 1 ) )
+
+    results = list()
+    if nworkers == 1 :
+        #Sin paralelizar, evitamos el costo de lanzar procesos.
+        for itask , task in enumerate( tasks ) :
+            results.append( worker( task ) )
+            if verbose :
+                print( '[' + str( itask + 1 ) + '/' + str( ntasks ) + '] ' + str( results[-1] ) )
+        return results
+
+    with ProcessPoolExecutor( max_workers=nworkers ) as executor :
+        futures = [ executor.submit( worker , task ) for task in tasks ]
+        for itask , future in enumerate( futures ) :
+            results.append( future.result() )
+            if verbose :
+                print( '[' + str( itask + 1 ) + '/' + str( ntasks ) + '] ' + str( results[-1] ) )
+    return results
+
+
+def ordered_map( worker , tasks , nworkers=None , max_ahead=None ) :
+    """Generador con worker(task) para cada task, en el orden de tasks, calculados en paralelo.
+
+    A diferencia de run_parallel los resultados se van devolviendo a medida que estan
+    listos, y como mucho hay max_ahead tareas pedidas por delante de la que se esta
+    esperando (por defecto 2 por proceso). Asi los procesos trabajan adelantados pero la
+    memoria ocupada por resultados que esperan su turno queda acotada.
+    """
+    nworkers = get_nworkers( nworkers )
+    if nworkers == 1 :
+        for task in tasks :
+            yield worker( task )
+        return
+
+    if max_ahead is None :
+        max_ahead = 2 * nworkers
+    tasks = iter( tasks )
+    with ProcessPoolExecutor( max_workers=nworkers ) as executor :
+        pending = deque()
+        for task in tasks :
+            pending.append( executor.submit( worker , task ) )
+            if len( pending ) >= max( max_ahead , 1 ) :
+                break
+        while len( pending ) > 0 :
+            result = pending.popleft().result()
+            for task in tasks :
+                pending.append( executor.submit( worker , task ) )
+                break
+            yield result
@@ -6,64 +6,160 @@ Basado en los ejemplos
 https://wrf-python.readthedocs.io/en/latest/plot.html
 """
 
-from netCDF4 import Dataset
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.cm import get_cmap
-import glob
-import scipy.io as sio
 
-from wrf import getvar, interplevel, to_np
+from parallel_utils import run_parallel
+from animation_output import write_animation
+from wrf_run import WrfRun, open_wrfout
+from profiling import profile_frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import HorizontalTemplate
 
 plot_time= 20            #En que tiempo vamos a hacer el grafico (arrancando desde 0)
 figure_name= 'T2m_uv10' #Un nombre que distinga esta figura de otros tipos de figuras.
 plot_mat   = True       #Si es True grafica el mapa, sino ponerlo en False
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
-
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ plot_time ])
-
-# Extraigo la altura, la temperatura y las componentes del viento
-#Notar que en el caso de las componentes del viento wrf-python rota dichas
-#componentes para recuperar la orientacion zonal y meridional
-[um10 , vm10 ] = getvar(ncfile, "uvmet10", units="m s-1")
-t2m = getvar(ncfile, "T2")
-nx = to_np(t2m).shape[1]
-ny = to_np(t2m).shape[0]
-
-#Calculo la velocidad del viento
-wspd10 = np.sqrt(to_np(um10)**2 + to_np(vm10)**2)
-
-# Creamos la figura.
-fig = plt.figure()
-
-# Graficamos la temperatura en contornos
-levels = np.arange(np.round(to_np(t2m).min())-2.,np.round(to_np(t2m).max())+2., 2.)
-plt.contourf(np.arange(nx),np.arange(ny),to_np(t2m), levels=levels,cmap='rainbow',extend='max')
-plt.colorbar()
-
-# Agregamos los contornos de velocidad de viento.
-levels = [1,5,10,15]
-contour=plt.contour(np.arange(nx),np.arange(ny),to_np(wspd10),levels=levels,colors='k')
-plt.clabel(contour,inline=1, fontsize=10, fmt="%i")
-
-# Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula.
-skip=2
-plt.barbs(np.arange(nx)[::skip],np.arange(ny)[::skip],to_np(um10[::skip, ::skip]),to_np(vm10[::skip, ::skip]),length=4)
-
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ 0 , nx-1 , 0 , ny-1 ] )
-#Agregamos un titulo para la figura
-plt.title('Temperatura (K) y viento (m/s)')
-#Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
-plt.savefig( './' + figure_name + '_tiempo_' + str( plot_time ) + '.png' )
-#El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
-#muestra por pantalla.
-plt.show()
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end
+#en una sola corrida, sin mostrar las figuras en pantalla.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = 1       #Cantidad de procesos para graficar en paralelo en modo batch (None = todos los cores).
 
+#Animacion: en modo batch, si animation es un nombre de archivo (.mp4 o .gif) todos los tiempos se
+#guardan en una animacion en lugar de un archivo por tiempo.
+animation     = None    #Por ejemplo 'T2m_uv10.mp4'.
+fps           = 4       #Cuadros por segundo de la animacion.
+
+#Salida de las figuras.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+
+
+@profile_frame
+def plot_frame( ncfile , plot_time , template , timeidx=0 ) :
+    """Grafica un tiempo (el timeidx del archivo) sobre la plantilla template (HorizontalTemplate).
+
+    La parte fija de la figura (grilla, limites y titulo) se dibuja solo en el primer
+    frame; en los siguientes solo se cambian los contornos, las barbas y la colorbar.
+    """
+    from wrf import to_np
+    # Extraigo la altura, la temperatura y las componentes del viento
+    #Notar que en el caso de las componentes del viento wrf-python rota dichas
+    #componentes para recuperar la orientacion zonal y meridional
+    [um10 , vm10 ] = cached_getvar(ncfile, "uvmet10", units="m s-1", timeidx=timeidx)
+    t2m = cached_getvar(ncfile, "T2", timeidx=timeidx)
+    nx = to_np(t2m).shape[1]
+    ny = to_np(t2m).shape[0]
+
+    #Calculo la velocidad del viento
+    wspd10 = np.sqrt(to_np(um10)**2 + to_np(vm10)**2)
+
+    ax = template.ax
+    if template.background is None :
+       #Agregamos las gridlines
+       ax.grid()
+       #Ajustamos los limites de la figura al dominio del WRF
+       ax.axis( [ 0 , nx-1 , 0 , ny-1 ] )
+       #Agregamos un titulo para la figura
+       ax.set_title('Temperatura (K) y viento (m/s)')
+
+    #Borramos lo que cambia de un frame a otro.
+    template.clear()
+
+    # Graficamos la temperatura en contornos
+    levels = np.arange(np.round(to_np(t2m).min())-2.,np.round(to_np(t2m).max())+2., 2.)
+    cf = template.update( ax.contourf(np.arange(nx),np.arange(ny),to_np(t2m), levels=levels,cmap='rainbow',extend='max') )
+    template.fig.colorbar( cf , cax=template.cax )
+
+    # Agregamos los contornos de velocidad de viento.
+    levels = [1,5,10,15]
+    contour=template.update( ax.contour(np.arange(nx),np.arange(ny),to_np(wspd10),levels=levels,colors='k') )
+    template.update( *ax.clabel(contour,inline=1, fontsize=10, fmt="%i") )
+
+    # Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula.
+    skip=2
+    template.update( ax.barbs(np.arange(nx)[::skip],np.arange(ny)[::skip],to_np(um10[::skip, ::skip]),to_np(vm10[::skip, ::skip]),length=4) )
+
+    #Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
+    template.save( frame_filename( figure_name , plot_time , ext=output_format ) , compress_level=png_compress_level )
+
+
+#Figura de cada proceso del pool, se crea una sola vez por proceso.
+_worker = dict()
+
+
+def worker_template() :
+    """Plantilla de la figura de este proceso, se crea una sola vez por proceso."""
+    if 'template' not in _worker :
+       plt = get_pyplot( headless=True )
+       _worker['template'] = HorizontalTemplate( plt.figure( dpi=dpi ) )
+    return _worker['template']
+
+
+def plot_task( task ) :
+    """Tarea para el pool de procesos: grafica un tiempo en la figura propia de este proceso."""
+    filename , timeidx , plot_time = task
+    template = worker_template()
+    with open_wrfout( filename ) as ncfile :
+         plot_frame( ncfile , plot_time , template , timeidx )
+    return frame_filename( figure_name , plot_time , ext=output_format )
+
+
+def animation_task( task ) :
+    """Tarea para el pool de procesos en modo animacion: devuelve las imagenes del tiempo en lugar de escribirlas."""
+    template = worker_template()
+    template.frames = list()
+    plot_task( task )
+    frames , template.frames = template.frames , None
+    return frames
+
+
+if __name__ == '__main__' :
+
+    #Indexo una sola vez todos los archivos wrfout* de esta carpeta (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+
+    #Archivo y tiempo dentro del archivo de cada tiempo a graficar (los wrfout pueden tener mas de un tiempo).
+    tasks = [ run.source( plot_time ) + ( plot_time , ) for plot_time in plot_times ]
+
+    #En modo animacion los frames se dibujan en paralelo y se van pasando en orden al codificador,
+    #sin escribir un archivo por tiempo.
+    if batch and animation is not None :
+       write_animation( [ animation ] , animation_task , tasks , fps , nworkers )
+       raise SystemExit
+
+    #En modo batch con mas de un proceso repartimos los tiempos entre los procesos.
+    #Los nombres de las figuras son los mismos que en la version secuencial.
+    if batch and nworkers != 1 :
+       run_parallel( plot_task , tasks , nworkers )
+       raise SystemExit
+
+    # Creamos la figura (y su parte fija) una sola vez.
+    plt = get_pyplot( batch )
+    template = HorizontalTemplate( plt.figure( dpi=dpi ) )
+
+    for plot_time in plot_times :
+        # Tomo el archivo netcdf correspondiente al tiempo indicado (queda abierto en run).
+        ncfile , timeidx = run.time_dataset( plot_time )
+        plot_frame( ncfile , plot_time , template , timeidx )
+
+    run.close()
+
+    #El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
+    #muestra por pantalla.
+    if not batch :
+       template.finalize()
+       plt.show()
+
+    #Liberamos la memoria de la figura.
+    template.close()
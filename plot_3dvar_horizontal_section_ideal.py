@@ -6,73 +6,176 @@ Basado en los ejemplos
 https://wrf-python.readthedocs.io/en/latest/plot.html
 """
 
-from netCDF4 import Dataset
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.cm import get_cmap
-import glob
-import scipy.io as sio
 
-from wrf import getvar, interplevel, to_np, get_basemap, latlon_coords
+from parallel_utils import run_parallel
+from animation_output import write_animation, animation_filename
+from wrf_run import WrfRun, open_wrfout
+from profiling import profile_frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import HorizontalTemplate
+from vinterp import VerticalInterpolator
 
 plot_time= 20         #En que tiempo vamos a hacer el grafico (arrancando desde 0)
 figure_name= 'T_uv'   #Un nombre que distinga esta figura de otros tipos de figuras.
 nivel      = 200      #Altura del nivel (m) a donde interpolaremos los datos.
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
-
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ plot_time ])
-
-# Extraigo la altura, la temperatura y las componentes del viento
-#Notar que en el caso de las componentes del viento wrf-python rota dichas
-#componentes para recuperar la orientacion zonal y meridional
-z = getvar(ncfile, "height",units='m')
-#Obtengo el tamanio del dominio a partir de la dimension de z.
-nz=to_np(z).shape[0]
-ny=to_np(z).shape[1]
-nx=to_np(z).shape[2]
-
-[um , vm] = getvar(ncfile, "uvmet", units="m s-1")
-tk = getvar(ncfile, "tk")
-
-#Interpolamos verticalmente a la altura seleccionada
-um_z = interplevel(um, z, nivel)
-vm_z = interplevel(vm, z, nivel)
-t_z  = interplevel(tk, z, nivel)
-
-#Calculo la velocidad del viento
-wspd_z = np.sqrt(um_z**2 + vm_z**2)
-
-# Creamos la figura.
-fig = plt.figure()
-
-# Graficamos la temperatura en contornos
-levels = np.arange(np.round(to_np(t_z).min())-2.,np.round(to_np(t_z).max())+2., 2.)
-plt.contourf(np.arange(nx),np.arange(ny),to_np(t_z), levels=levels,cmap='rainbow')
-plt.colorbar()
-
-# Agregamos los contornos de velocidad de viento.
-levels = [1,5,10,15]
-contour=plt.contour(np.arange(nx),np.arange(ny),to_np(wspd_z),levels=levels,colors='k')
-plt.clabel(contour,inline=1, fontsize=10, fmt="%i")
-
-# Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula.
-skip=2
-plt.barbs(np.arange(nx)[::skip],np.arange(ny)[::skip],to_np(um_z[::skip, ::skip]),to_np(vm_z[::skip, ::skip]),length=3)
-
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ 0 , nx-1 , 0 , ny-1 ] )
-#Agregamos un titulo para la figura
-plt.title('Temperatura (K) y viento (m/s)')
-#Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
-plt.savefig( './' + figure_name + '_tiempo_' + str( plot_time ) + '_altura_' + str( nivel ) + '.png' )
-#El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
-#muestra por pantalla.
-plt.show()
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end
+#y todos los niveles de la lista niveles en una sola corrida, sin mostrar las figuras en pantalla.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = 1       #Cantidad de procesos para graficar en paralelo en modo batch (None = todos los cores).
+
+#Animacion: en modo batch, si animation es un nombre de archivo (.mp4 o .gif) todos los tiempos se
+#guardan en una animacion (una por nivel) en lugar de un archivo por tiempo.
+animation     = None    #Por ejemplo 'T_uv.mp4'.
+fps           = 4       #Cuadros por segundo de la animacion.
+
+#Salida de las figuras.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+niveles       = [ 200 , 500 , 1000 ]  #Alturas (m) a graficar en modo batch.
 
+
+@profile_frame
+def plot_frame( ncfile , plot_time , niveles , template , timeidx=0 ) :
+    """Grafica todos los niveles de un tiempo (el timeidx del archivo) sobre la plantilla template (HorizontalTemplate).
+
+    Las variables 3D se leen una sola vez por tiempo y se interpolan a cada nivel.
+    La parte fija de la figura (grilla, limites y titulo) se dibuja solo en el primer
+    frame; en los siguientes solo se cambian los contornos, las barbas y la colorbar.
+    """
+    from wrf import to_np
+    # Extraigo la altura, la temperatura y las componentes del viento
+    #Notar que en el caso de las componentes del viento wrf-python rota dichas
+    #componentes para recuperar la orientacion zonal y meridional
+    z = cached_getvar(ncfile, "height",units='m', timeidx=timeidx)
+    #Obtengo el tamanio del dominio a partir de la dimension de z.
+    nz=to_np(z).shape[0]
+    ny=to_np(z).shape[1]
+    nx=to_np(z).shape[2]
+
+    [um , vm] = cached_getvar(ncfile, "uvmet", units="m s-1", timeidx=timeidx)
+    tk = cached_getvar(ncfile, "tk", timeidx=timeidx)
+
+    ax = template.ax
+    if template.background is None :
+       #Agregamos las gridlines
+       ax.grid()
+       #Ajustamos los limites de la figura al dominio del WRF
+       ax.axis( [ 0 , nx-1 , 0 , ny-1 ] )
+       #Agregamos un titulo para la figura
+       ax.set_title('Temperatura (K) y viento (m/s)')
+
+    #Interpolamos verticalmente las 3 variables a todas las alturas seleccionadas de una sola vez.
+    #Los pesos de la interpolacion se calculan una sola vez a partir de z.
+    campos = VerticalInterpolator( to_np(z) ).interp( [ to_np(um) , to_np(vm) , to_np(tk) ] , niveles )
+
+    for ilev , nivel in enumerate( niveles ) :
+
+        um_z , vm_z , t_z = campos[ : , ilev ]
+
+        #Calculo la velocidad del viento
+        wspd_z = np.sqrt(um_z**2 + vm_z**2)
+
+        #Borramos lo que cambia de un frame a otro.
+        template.clear()
+
+        # Graficamos la temperatura en contornos
+        levels = np.arange(np.round(np.nanmin(t_z))-2.,np.round(np.nanmax(t_z))+2., 2.)
+        cf = template.update( ax.contourf(np.arange(nx),np.arange(ny),to_np(t_z), levels=levels,cmap='rainbow') )
+        template.fig.colorbar( cf , cax=template.cax )
+
+        # Agregamos los contornos de velocidad de viento.
+        levels = [1,5,10,15]
+        contour=template.update( ax.contour(np.arange(nx),np.arange(ny),to_np(wspd_z),levels=levels,colors='k') )
+        template.update( *ax.clabel(contour,inline=1, fontsize=10, fmt="%i") )
+
+        # Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula.
+        skip=2
+        template.update( ax.barbs(np.arange(nx)[::skip],np.arange(ny)[::skip],to_np(um_z[::skip, ::skip]),to_np(vm_z[::skip, ::skip]),length=3) )
+
+        #Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
+        template.save( frame_filename( figure_name , plot_time , nivel , ext=output_format ) , compress_level=png_compress_level )
+
+
+#Figura de cada proceso del pool, se crea una sola vez por proceso.
+_worker = dict()
+
+
+def worker_template() :
+    """Plantilla de la figura de este proceso, se crea una sola vez por proceso."""
+    if 'template' not in _worker :
+       plt = get_pyplot( headless=True )
+       _worker['template'] = HorizontalTemplate( plt.figure( dpi=dpi ) )
+    return _worker['template']
+
+
+def plot_task( task ) :
+    """Tarea para el pool de procesos: grafica un tiempo en la figura propia de este proceso."""
+    filename , timeidx , plot_time , niveles = task
+    template = worker_template()
+    with open_wrfout( filename ) as ncfile :
+         plot_frame( ncfile , plot_time , niveles , template , timeidx )
+    return [ frame_filename( figure_name , plot_time , nivel , ext=output_format ) for nivel in niveles ]
+
+
+def animation_task( task ) :
+    """Tarea para el pool de procesos en modo animacion: devuelve las imagenes del tiempo en lugar de escribirlas."""
+    template = worker_template()
+    template.frames = list()
+    plot_task( task )
+    frames , template.frames = template.frames , None
+    return frames
+
+
+if __name__ == '__main__' :
+
+    #Indexo una sola vez todos los archivos wrfout* de esta carpeta (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+       niveles    = [ nivel ]
+
+    #Archivo y tiempo dentro del archivo de cada tiempo a graficar (los wrfout pueden tener mas de un tiempo).
+    tasks = [ run.source( plot_time ) + ( plot_time , niveles ) for plot_time in plot_times ]
+
+    #En modo animacion los frames se dibujan en paralelo y se van pasando en orden al codificador,
+    #sin escribir un archivo por tiempo.
+    if batch and animation is not None :
+       write_animation( [ animation_filename( animation , nivel ) for nivel in niveles ] , animation_task , tasks , fps , nworkers )
+       raise SystemExit
+
+    #En modo batch con mas de un proceso repartimos los tiempos entre los procesos.
+    #Los nombres de las figuras son los mismos que en la version secuencial.
+    if batch and nworkers != 1 :
+       run_parallel( plot_task , tasks , nworkers )
+       raise SystemExit
+
+    # Creamos la figura (y su parte fija) una sola vez.
+    plt = get_pyplot( batch )
+    template = HorizontalTemplate( plt.figure( dpi=dpi ) )
+
+    for plot_time in plot_times :
+        # Tomo el archivo netcdf correspondiente al tiempo indicado (queda abierto en run).
+        ncfile , timeidx = run.time_dataset( plot_time )
+        plot_frame( ncfile , plot_time , niveles , template , timeidx )
+
+    run.close()
+
+    #El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
+    #muestra por pantalla.
+    if not batch :
+       template.finalize()
+       plt.show()
+
+    #Liberamos la memoria de la figura.
+    template.close()
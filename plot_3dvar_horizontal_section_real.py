@@ -6,83 +6,318 @@ Basado en los ejemplos
 https://wrf-python.readthedocs.io/en/latest/plot.html
 """
 
-from netCDF4 import Dataset
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.cm import get_cmap
-import glob
-import scipy.io as sio
 
-from wrf import getvar, interplevel, to_np, get_basemap, latlon_coords
+from parallel_utils import run_parallel, ordered_map
+from animation_output import write_animation, animation_filename
+from wrf_run import WrfRun, open_wrfout
+from profiling import profile_frame, frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import HorizontalTemplate
+from map_overlay import draw_map
+from subdomain import open_subset, close_subset
+from vinterp import VerticalInterpolator
+from tiled import tiled_levels
+from product_store import ProductStore
+from display_grid import to_display, shade
+from prefetch import Prefetcher
 
 plot_time= 0          #En que tiempo vamos a hacer el grafico (arrancando desde 0)
 figure_name= 'T_uv'   #Un nombre que distinga esta figura de otros tipos de figuras.
 nivel      = 5000      #Altura del nivel (m) a donde interpolaremos los datos.
 plot_mat   = True     #Si es True grafica el mapa, sino ponerlo en False
+map_file   = './mapas.mat'  #Archivo con los mapas (provincias y sudamerica).
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
-
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ plot_time ])
-
-# Extraigo la altura, la temperatura y las componentes del viento
-#Notar que en el caso de las componentes del viento wrf-python rota dichas
-#componentes para recuperar la orientacion zonal y meridional
-z = getvar(ncfile, "height",units='m')
-[um , vm] = getvar(ncfile, "uvmet", units="m s-1")
-tk = getvar(ncfile, "tk")
-
-#Interpolamos verticalmente a la altura seleccionada
-um_z = interplevel(um, z, nivel)
-vm_z = interplevel(vm, z, nivel)
-t_z  = interplevel(tk, z, nivel)
-
-#Calculo la velocidad del viento
-wspd_z = np.sqrt(um_z**2 + vm_z**2)
-
-# Obtenemos las lat y lons correspondientes a nuestras variables.
-lats, lons = latlon_coords(t_z)
-lats=to_np(lats)
-lons=to_np(lons)
-#Nota: Por defecto wrfpython genera variables que son objetos Xarray estos son 
-#tipos de datos y metadatos. Para convertir los datos a arrays de numpy esta la
-#funcion to_np que toma el Xarray, extrae los datos como un array de numpy.
-
-# Creamos la figura.
-fig = plt.figure()
-
-# Graficamos la temperatura en contornos
-levels = np.arange(np.round(to_np(t_z).min())-2.,np.round(to_np(t_z).max())+2., 2.)
-plt.contourf(lons,lats,to_np(t_z), levels=levels,cmap='rainbow')
-plt.colorbar()
-
-# Agregamos los contornos de velocidad de viento.
-levels = [1,5,10,15]
-contour=plt.contour(lons,lats,to_np(wspd_z),levels=levels,colors='k')
-plt.clabel(contour,inline=1, fontsize=10, fmt="%i")
-
-# Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula.
-skip=10
-plt.barbs(lons[::skip,::skip],lats[::skip,::skip],to_np(um_z[::skip, ::skip]),to_np(vm_z[::skip, ::skip]),length=6)
-
-#Finalmente agrego el mapa (Solo si plot_mat es True)
-if plot_mat :
-   mapa = sio.loadmat('./mapas.mat')
-   plt.plot(mapa['provincias'][:,0],mapa['provincias'][:,1], color='k', lw=0.5, zorder=1)
-   plt.plot(mapa['samerica'][:,0],mapa['samerica'][:,1], color='k', lw=0.5, zorder=1)
-
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
-#Agregamos un titulo para la figura
-plt.title('Temperatura (K) y viento (m/s)')
-#Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
-plt.savefig( './' + figure_name + '_tiempo_' + str( plot_time ) + '_altura_' + str( nivel ) + '.png' )
-#El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
-#muestra por pantalla.
-plt.show()
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end
+#y todos los niveles de la lista niveles en una sola corrida, sin mostrar las figuras en pantalla.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = 1       #Cantidad de procesos para graficar en paralelo en modo batch (None = todos los cores).
 
+#Lectura adelantada (ver prefetch.py): en el loop secuencial los prefetch tiempos siguientes se leen y se
+#calculan en un thread mientras se grafica el actual (0 = sin adelantar). En modo batch se imprimen las
+#estadisticas de la cola, que sirven para elegir prefetch.
+prefetch      = 2
+
+#Subdominio a graficar: caja [lonmin, lonmax, latmin, latmax] (None = todo el dominio) y decimacion
+#(stride = 2 usa uno de cada 2 puntos de reticula). Se aplican al leer el wrfout, antes de calcular
+#con wrf-python, asi que solo se lee y se calcula lo que se grafica.
+bbox   = None   #Por ejemplo Cordoba: [ -66.0 , -61.5 , -35.0 , -29.5 ]
+stride = 1
+
+#Memoria: si memory_budget_mb no es None, la altura, el viento y la temperatura se calculan e interpolan
+#por partes del dominio que ocupan a lo sumo memory_budget_mb MB, en lugar de cargar los campos 3D completos
+#(para dominios de alta resolucion).
+memory_budget_mb = None
+
+#Animacion: en modo batch, si animation es un nombre de archivo (.mp4 o .gif) todos los tiempos se
+#guardan en una animacion (una por nivel) en lugar de un archivo por tiempo.
+animation     = None    #Por ejemplo 'T_uv.mp4'.
+fps           = 4       #Cuadros por segundo de la animacion.
+
+#Salida de las figuras.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+
+#Resolucion de pantalla (ver display_grid.py): con display_res = True los campos se promedian en bloques hasta
+#tener a lo sumo display_oversample puntos de reticula por pixel antes de graficarlos. shading elige como se
+#dibuja la temperatura: 'contourf', 'pcolormesh' (sin calcular contornos, mucho mas rapido) o 'auto'.
+display_res        = False
+display_oversample = 1
+shading            = 'contourf'
+niveles       = [ 1000 , 3000 , 5000 ]  #Alturas (m) a graficar en modo batch.
+
+#Calcular una vez y graficar muchas: con mode = 'compute' solo se calculan los niveles interpolados y se
+#guardan en products_file (ver product_store.py), sin graficar. Con mode = 'plot' se grafica leyendo
+#products_file, sin abrir los wrfout, para cambiar colores, barbas o titulos sin recalcular nada.
+#Con mode = 'all' se calcula y se grafica como siempre.
+mode          = 'all'
+products_file = 'T_uv_products.nc'
+
+
+def compute_frame( ncfile , niveles , timeidx=0 ) :
+    """Viento y temperatura del tiempo timeidx del archivo interpolados a los niveles. Devuelve campos (3,nlev,ny,nx), lats y lons.
+
+    Las variables 3D se leen una sola vez por tiempo y se interpolan a cada nivel.
+    """
+    from wrf import to_np, latlon_coords
+    # Extraigo la altura, la temperatura y las componentes del viento
+    #Notar que en el caso de las componentes del viento wrf-python rota dichas
+    #componentes para recuperar la orientacion zonal y meridional
+    #Solo se leen del wrfout las variables y los puntos del subdominio (bbox y stride).
+    if memory_budget_mb is None :
+       subset = open_subset( ncfile , bbox , stride , [ 'height' , 'uvmet' , 'tk' ] )
+       z = cached_getvar(subset, "height",units='m', timeidx=timeidx)
+       [um , vm] = cached_getvar(subset, "uvmet", units="m s-1", timeidx=timeidx)
+       tk = cached_getvar(subset, "tk", timeidx=timeidx)
+       close_subset( subset , ncfile )
+
+       # Obtenemos las lat y lons correspondientes a nuestras variables.
+       lats, lons = latlon_coords(tk)
+       lats=to_np(lats)
+       lons=to_np(lons)
+       #Nota: Por defecto wrfpython genera variables que son objetos Xarray estos son
+       #tipos de datos y metadatos. Para convertir los datos a arrays de numpy esta la
+       #funcion to_np que toma el Xarray, extrae los datos como un array de numpy.
+
+       #Interpolamos verticalmente las 3 variables a todas las alturas seleccionadas de una sola vez.
+       #Los pesos de la interpolacion se calculan una sola vez a partir de z.
+       campos = VerticalInterpolator( to_np(z) ).interp( [ to_np(um) , to_np(vm) , to_np(tk) ] , niveles )
+    else :
+       #Lo mismo pero por partes del dominio: de los campos 3D solo queda en memoria una parte a la vez.
+       campos , lats , lons = tiled_levels( ncfile , [ ( 'uvmet' , { 'units' : 'm s-1' } ) , ( 'tk' , { } ) ] , niveles ,
+                                            bbox=bbox , stride=stride , budget_mb=memory_budget_mb , timeidx=timeidx )
+    return campos , lats , lons
+
+
+@profile_frame
+def plot_frame( ncfile , plot_time , niveles , template , plot_mat=False , timeidx=0 ) :
+    """Grafica todos los niveles de un tiempo (el timeidx del archivo) sobre la plantilla template (HorizontalTemplate)."""
+    campos , lats , lons = compute_frame( ncfile , niveles , timeidx )
+    draw_frame( campos , lats , lons , plot_time , niveles , template , plot_mat )
+
+
+def draw_frame( campos , lats , lons , plot_time , niveles , template , plot_mat=False ) :
+    """Grafica los campos (3,nlev,ny,nx) de un tiempo ya interpolados a los niveles.
+
+    La parte fija de la figura (mapa, grilla, limites y titulo) se dibuja solo en el
+    primer frame; en los siguientes solo se cambian los contornos, las barbas y la colorbar.
+    """
+    ax = template.ax
+    if template.background is None :
+       #Finalmente agrego el mapa (Solo si plot_mat es True)
+       if plot_mat :
+          template.overlay( draw_map( ax , lons , lats , map_file ) )
+       #Agregamos las gridlines
+       ax.grid()
+       #Ajustamos los limites de la figura al dominio del WRF
+       ax.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
+       #Agregamos un titulo para la figura
+       ax.set_title('Temperatura (K) y viento (m/s)')
+
+    for ilev , nivel in enumerate( niveles ) :
+
+        um_z , vm_z , t_z = campos[ : , ilev ]
+
+        #Calculo la velocidad del viento
+        wspd_z = np.sqrt(um_z**2 + vm_z**2)
+
+        #Borramos lo que cambia de un frame a otro.
+        template.clear()
+
+        #Campos a graficar, promediados a la resolucion de la figura si display_res es True.
+        plons , plats , pt_z , pwspd_z = lons , lats , t_z , wspd_z
+        if display_res :
+           plons , plats , pt_z , pwspd_z = to_display( ax , lons , lats , t_z , wspd_z , oversample=display_oversample )
+
+        # Graficamos la temperatura en contornos
+        levels = np.arange(np.round(np.nanmin(t_z))-2.,np.round(np.nanmax(t_z))+2., 2.)
+        cf = template.update( shade( ax , plons , plats , pt_z , levels , 'rainbow' , shading ) )
+        template.fig.colorbar( cf , cax=template.cax )
+
+        # Agregamos los contornos de velocidad de viento.
+        levels = [1,5,10,15]
+        contour=template.update( ax.contour(plons,plats,pwspd_z,levels=levels,colors='k') )
+        template.update( *ax.clabel(contour,inline=1, fontsize=10, fmt="%i") )
+
+        # Agregamos el viento en barbas pero graficando solo cada 10 puntos de reticula (del wrfout original).
+        skip=max( 10 // stride , 1 )
+        template.update( ax.barbs(lons[::skip,::skip],lats[::skip,::skip],um_z[::skip, ::skip],vm_z[::skip, ::skip],length=6) )
+
+        #Guardamos la figura en un archivo, el nombre del archivo incluye el tiempo y el nivel asi como el figure_name que definimos al principio
+        template.save( frame_filename( figure_name , plot_time , nivel , ext=output_format ) , compress_level=png_compress_level )
+
+
+#Figura de cada proceso del pool, se crea una sola vez por proceso.
+_worker = dict()
+
+
+def worker_template() :
+    """Plantilla de la figura de este proceso, se crea una sola vez por proceso."""
+    if 'template' not in _worker :
+       plt = get_pyplot( headless=True )
+       _worker['template'] = HorizontalTemplate( plt.figure( dpi=dpi ) )
+    return _worker['template']
+
+
+def plot_task( task ) :
+    """Tarea para el pool de procesos: grafica un tiempo en la figura propia de este proceso."""
+    filename , timeidx , plot_time , niveles = task
+    template = worker_template()
+    with open_wrfout( filename ) as ncfile :
+         plot_frame( ncfile , plot_time , niveles , template , plot_mat , timeidx )
+    return [ frame_filename( figure_name , plot_time , nivel , ext=output_format ) for nivel in niveles ]
+
+
+def compute_task( task ) :
+    """Tarea para el pool de procesos con mode = 'compute': los productos de un tiempo (se guardan en el proceso principal)."""
+    filename , timeidx , plot_time , niveles = task
+    with open_wrfout( filename ) as ncfile :
+         return ( plot_time , ) + compute_frame( ncfile , niveles , timeidx )
+
+
+def store_products( store , plot_time , campos , lats , lons , niveles ) :
+    """Guarda los niveles interpolados de un tiempo (y las coordenadas la primera vez)."""
+    store.write_static( 'niveles' , niveles , dims=( 'nivel' , ) )
+    store.write_static( 'lats' , lats , dims=( 'y' , 'x' ) )
+    store.write_static( 'lons' , lons , dims=( 'y' , 'x' ) )
+    store.write( 'campos' , plot_time , campos , dims=( 'campo' , 'nivel' , 'y' , 'x' ) )
+
+
+def plot_from_store( store , plot_times , niveles , template , plot_mat=False ) :
+    """Grafica los tiempos plot_times leyendo los productos de store (sin abrir los wrfout)."""
+    stored = list( store.read( 'niveles' ) )
+    missing = [ nivel for nivel in niveles if nivel not in stored ]
+    if len( missing ) > 0 :
+       raise ValueError( 'Los niveles ' + str( missing ) + ' no estan en ' + products_file )
+    ilevs = [ stored.index( nivel ) for nivel in niveles ]
+    lats , lons = store.read( 'lats' ) , store.read( 'lons' )
+    available = store.times( 'campos' )
+    for plot_time in plot_times :
+        if plot_time not in available :
+           print( 'El tiempo ' + str( plot_time ) + ' no esta en ' + products_file )
+    plot_times = [ plot_time for plot_time in plot_times if plot_time in available ]
+    #Los productos de los tiempos siguientes se leen en un thread mientras se grafica el actual.
+    reads = Prefetcher( lambda plot_time : store.read( 'campos' , plot_time )[ : , ilevs ] , plot_times , prefetch ,
+                        name='products' , verbose=batch , label=lambda plot_time : plot_time )
+    for plot_time , campos in zip( plot_times , reads ) :
+        with frame( plot_time ) :
+             draw_frame( campos , lats , lons , plot_time , niveles , template , plot_mat )
+
+
+def animation_task( task ) :
+    """Tarea para el pool de procesos en modo animacion: devuelve las imagenes del tiempo en lugar de escribirlas."""
+    template = worker_template()
+    template.frames = list()
+    plot_task( task )
+    frames , template.frames = template.frames , None
+    return frames
+
+
+if __name__ == '__main__' :
+
+    #Solo se grafica a partir de los productos ya calculados: no se abren los wrfout.
+    if mode == 'plot' :
+       store = ProductStore( products_file )
+       if batch :
+          plot_times = get_time_range( max( store.times( 'campos' ) ) + 1 , plot_time_ini , plot_time_end )
+       else :
+          plot_times = [ plot_time ]
+          niveles    = [ nivel ]
+       plt = get_pyplot( batch )
+       template = HorizontalTemplate( plt.figure( dpi=dpi ) )
+       plot_from_store( store , plot_times , niveles , template , plot_mat )
+       store.close()
+       if not batch :
+          template.finalize()
+          plt.show()
+       template.close()
+       raise SystemExit
+
+    #Indexo una sola vez todos los archivos wrfout* de esta carpeta (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+       niveles    = [ nivel ]
+
+    #Archivo y tiempo dentro del archivo de cada tiempo a graficar (los wrfout pueden tener mas de un tiempo).
+    tasks = [ run.source( plot_time ) + ( plot_time , niveles ) for plot_time in plot_times ]
+
+    #Solo se calculan los productos (en paralelo si nworkers != 1) y se guardan en products_file.
+    #El archivo se escribe solo desde este proceso.
+    if mode == 'compute' :
+       store = ProductStore( products_file , 'a' )
+       #Si products_file ya tiene productos de otro recorte, decimacion, niveles o variables no se mezclan.
+       store.set_attrs( campos='um vm tk' , bbox=bbox , stride=stride , niveles=niveles )
+       for plot_time , campos , lats , lons in ordered_map( compute_task , tasks , nworkers ) :
+           store_products( store , plot_time , campos , lats , lons , niveles )
+           print( 'Productos del tiempo ' + str( plot_time ) + ' en ' + products_file )
+       store.close()
+       raise SystemExit
+
+    #En modo animacion los frames se dibujan en paralelo y se van pasando en orden al codificador,
+    #sin escribir un archivo por tiempo.
+    if batch and animation is not None :
+       write_animation( [ animation_filename( animation , nivel ) for nivel in niveles ] , animation_task , tasks , fps , nworkers )
+       raise SystemExit
+
+    #En modo batch con mas de un proceso repartimos los tiempos entre los procesos.
+    #Los nombres de las figuras son los mismos que en la version secuencial.
+    if batch and nworkers != 1 :
+       run_parallel( plot_task , tasks , nworkers )
+       raise SystemExit
+
+    # Creamos la figura (y su parte fija) una sola vez.
+    plt = get_pyplot( batch )
+    template = HorizontalTemplate( plt.figure( dpi=dpi ) )
+
+    #Tomo el archivo netcdf correspondiente a cada tiempo (queda abierto en run). Los tiempos siguientes
+    #se leen y se interpolan en un thread mientras se grafica el actual.
+    def compute_time( plot_time ) :
+        ncfile , timeidx = run.time_dataset( plot_time )
+        return compute_frame( ncfile , niveles , timeidx )
+
+    frames = Prefetcher( compute_time , plot_times , prefetch ,
+                         name='compute_frame' , verbose=batch , label=lambda plot_time : plot_time )
+    for plot_time , ( campos , lats , lons ) in zip( plot_times , frames ) :
+        with frame( plot_time ) :
+             draw_frame( campos , lats , lons , plot_time , niveles , template , plot_mat )
+
+    run.close()
+
+    #El plt.show es opcional solo si se desea ver la figura en tiempo real. Sino se guarda automaticamente la figura en el archivo y no se
+    #muestra por pantalla.
+    if not batch :
+       template.finalize()
+       plt.show()
+
+    #Liberamos la memoria de la figura.
+    template.close()
@@ -1,10 +1,13 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from netCDF4 import Dataset
-from wrf import (getvar, to_np, get_cartopy, latlon_coords, vertcross,
-                 cartopy_xlim, cartopy_ylim, interpline, CoordPair)
-import glob
-import scipy.io as sio
+
+from parallel_utils import run_parallel
+from animation_output import write_animation
+from wrf_run import WrfRun, open_wrfout
+from profiling import profile_frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import CrossSectionTemplate
+from cross_section import CrossSection, GridPoint
 
 #Grafico un mapa de 2 paneles. Uno indicando donde esta el corte.
 #Otro mostrando el resultado del corte.
@@ -13,84 +16,189 @@ plot_time= 20          #En que tiempo vamos a hacer el grafico (arrancando desde
 figure_name= 'CrossRef'
 plot_mat   = True     #Si es True grafica el mapa, sino ponerlo en False
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end
+#en una sola corrida, sin mostrar las figuras en pantalla.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = 1       #Cantidad de procesos para graficar en paralelo en modo batch (None = todos los cores).
 
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ plot_time ])
+#Animacion: en modo batch, si animation es un nombre de archivo (.mp4 o .gif) todos los tiempos se
+#guardan en una animacion en lugar de un archivo por tiempo.
+animation     = None    #Por ejemplo 'CrossRef.mp4'.
+fps           = 4       #Cuadros por segundo de la animacion.
 
+#Salida de las figuras.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
 
 #Definimos el punto de partida del corte y el punto de fin.
-cross_start = CoordPair(x=10, y=10)
-cross_end = CoordPair(x=49, y=10)
-
-#Obtenemos las variables.
-ht = getvar(ncfile, "z")      #Altura sobre el nivel del mar
-#Obtengo el tamanio del dominio a partir de la dimension de z.
-nz=to_np(ht).shape[0]
-ny=to_np(ht).shape[1]
-nx=to_np(ht).shape[2]
-
-ter = getvar(ncfile, "ter")   #Altura de la topografia
-landmask = getvar(ncfile,'LANDMASK')
-[um,vm] = getvar(ncfile, "uvmet")   #Reflectividad de radar simulada
-w = getvar(ncfile,'wa')
-
-# Interpola dbz al corte vertical soliciado.
-# Ademas dbz_cross tiene en su metadata la lat/lon de los puntos que componen el corte.
-um_cross = vertcross(um, ht, wrfin=ncfile,
-                    start_point=cross_start,
-                    end_point=cross_end,
-                    latlon=False, meta=True,autolevels=300)
-w_cross = vertcross(w, ht, wrfin=ncfile,
-                    start_point=cross_start,
-                    end_point=cross_end,
-                    latlon=False, meta=True,autolevels=300)
-
-
-
-ter_line = interpline(ter, wrfin=ncfile, start_point=cross_start,
-                      end_point=cross_end)
-
-#Generamos la figura.
-#Como vamos a hacer 2 paneles queremos un tamanio de figura que 
-#sea el doble de ancho respecto al largo.
-plt.figure(figsize=(9,4))
-
-#Primer subplot con la ubicacion del corte.
-plt.subplot(121)
-plt.contourf(np.arange(nx),np.arange(ny),landmask,levels=[0,0.5,1,1.5],cmap='terrain',extend='max')
-plt.plot( [ cross_start.x , cross_end.x ] , [ cross_start.y , cross_end.y ] , 'o-' )
-plt.colorbar()
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ 0 , nx-1 , 0 , ny-1 ] )
-plt.title('Ubicacion del corte')
-
-#Segundo subplot con el corte vertical
-plt.subplot(122)
-# Make the cross section plot for dbz
-xs = np.arange(0, um_cross.shape[-1], 1)
-ys = to_np(um_cross.coords["vertical"])
-levels=np.arange(-10.0,10.5,0.5)
-plt.contourf(xs,ys,to_np(um_cross),levels=levels,cmap='bwr')
-plt.colorbar()
-plt.contour(xs,ys,to_np(w_cross),levels=[-1.0,-0.5,0.5,1.0,1.5,2.0,3.0] )
-#Genero un sombreado con el terreno.
-plt.fill_between(xs, 0, to_np(ter_line),facecolor='saddlebrown')
-
-#Fijo el tope vertical del corte en 5 km.
-plt.axis([xs.min(),xs.max(),0,5000])
-
-# Add a title
-plt.title('Corte vertical de viento zonal (somb.) y w (cont.)')
-
-
-plt.savefig( './' + figure_name + '_tiempo_' + str( plot_time ) + '.png' )
-
-plt.show()
-
-
+cross_start = GridPoint(x=10, y=10)
+cross_end = GridPoint(x=49, y=10)
+cross     = None   #Se calcula en el primer tiempo que se grafica (ver plot_frame).
+#Alturas (m) del corte. Con None se eligen como en vertcross (autolevels niveles desde 0 hasta la altura
+#maxima del corte) con la z del primer tiempo que se grafica, y quedan fijas para todos los tiempos.
+cross_levels = None
+autolevels   = 300
+
+
+def first_levels( ncfile , timeidx=0 ) :
+    """Alturas del corte elegidas con la z del tiempo timeidx del archivo (las mismas que usaria plot_frame)."""
+    from wrf import to_np
+    ht = cached_getvar(ncfile, "z", timeidx=timeidx)
+    return CrossSection( to_np(ht) , cross_start , cross_end , autolevels=autolevels ).levels
+
+
+@profile_frame
+def plot_frame( ncfile , plot_time , template , timeidx=0 ) :
+    """Grafica el corte de un tiempo (el timeidx del archivo) sobre la plantilla template (CrossSectionTemplate).
+
+    El panel con la ubicacion del corte, el terreno, los limites y los titulos se dibujan
+    solo en el primer frame; en los siguientes solo se cambian los contornos del corte.
+    """
+    from wrf import to_np, getvar
+    #Obtenemos las variables.
+    ht = cached_getvar(ncfile, "z", timeidx=timeidx)      #Altura sobre el nivel del mar
+    #Obtengo el tamanio del dominio a partir de la dimension de z.
+    nz=to_np(ht).shape[0]
+    ny=to_np(ht).shape[1]
+    nx=to_np(ht).shape[2]
+
+    [um,vm] = cached_getvar(ncfile, "uvmet", units="m s-1", timeidx=timeidx)   #Viento rotado a coordenadas de la tierra
+    w = cached_getvar(ncfile,'wa', timeidx=timeidx)
+
+    #El corte (puntos sobre la reticula, pesos de la interpolacion y niveles verticales) se calcula
+    #en el primer tiempo y se reutiliza en los siguientes. En cada tiempo solo se actualizan los
+    #pesos verticales con la z de ese tiempo.
+    global cross
+    if cross is None :
+       cross = CrossSection( to_np(ht) , cross_start , cross_end , autolevels=autolevels , levels=cross_levels )
+
+    # Interpola um y w al corte vertical soliciado.
+    um_cross , w_cross = cross.apply( [ to_np(um) , to_np(w) ] , z=to_np(ht) )
+
+    ax1 , ax2 = template.ax1 , template.ax2
+    xs = np.arange(0, cross.npts, 1)
+    ys = cross.levels
+    first_frame = template.background is None
+
+    if first_frame :
+       ter = cached_getvar(ncfile, "ter", timeidx=timeidx)   #Altura de la topografia
+       landmask = getvar(ncfile,'LANDMASK', timeidx=timeidx)
+       ter_line = cross.line( to_np(ter) )
+
+       #Primer subplot con la ubicacion del corte.
+       cf = ax1.contourf(np.arange(nx),np.arange(ny),landmask,levels=[0,0.5,1,1.5],cmap='terrain',extend='max')
+       ax1.plot( [ cross_start.x , cross_end.x ] , [ cross_start.y , cross_end.y ] , 'o-' )
+       template.fig.colorbar( cf , cax=template.cax1 )
+       #Agregamos las gridlines
+       ax1.grid()
+       #Ajustamos los limites de la figura al dominio del WRF
+       ax1.axis( [ 0 , nx-1 , 0 , ny-1 ] )
+       ax1.set_title('Ubicacion del corte')
+
+       #Segundo subplot con el corte vertical
+       #Genero un sombreado con el terreno (queda arriba de los contornos de cada frame).
+       template.overlay( ax2.fill_between(xs, 0, to_np(ter_line),facecolor='saddlebrown') )
+       #Fijo el tope vertical del corte en 5 km.
+       ax2.axis([xs.min(),xs.max(),0,5000])
+       # Add a title
+       ax2.set_title('Corte vertical de viento zonal (somb.) y w (cont.)')
+
+    #Borramos lo que cambia de un frame a otro.
+    template.clear()
+
+    # Make the cross section plot for dbz
+    levels=np.arange(-10.0,10.5,0.5)
+    cf = template.update( ax2.contourf(xs,ys,to_np(um_cross),levels=levels,cmap='bwr') )
+    if first_frame :
+       #Los niveles son fijos asi que la colorbar es parte del fondo.
+       template.fig.colorbar( cf , cax=template.cax2 )
+    template.update( ax2.contour(xs,ys,to_np(w_cross),levels=[-1.0,-0.5,0.5,1.0,1.5,2.0,3.0] ) )
+
+    template.save( frame_filename( figure_name , plot_time , ext=output_format ) , compress_level=png_compress_level )
+
+
+#Figura de cada proceso del pool, se crea una sola vez por proceso.
+_worker = dict()
+
+
+def worker_template() :
+    """Plantilla de la figura de este proceso, se crea una sola vez por proceso."""
+    if 'template' not in _worker :
+       plt = get_pyplot( headless=True )
+       _worker['template'] = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=dpi ) )
+    return _worker['template']
+
+
+def plot_task( task ) :
+    """Tarea para el pool de procesos: grafica un tiempo en la figura propia de este proceso."""
+    global cross_levels
+    filename , timeidx , plot_time , cross_levels = task
+    template = worker_template()
+    with open_wrfout( filename ) as ncfile :
+         plot_frame( ncfile , plot_time , template , timeidx )
+    return frame_filename( figure_name , plot_time , ext=output_format )
+
+
+def animation_task( task ) :
+    """Tarea para el pool de procesos en modo animacion: devuelve las imagenes del tiempo en lugar de escribirlas."""
+    template = worker_template()
+    template.frames = list()
+    plot_task( task )
+    frames , template.frames = template.frames , None
+    return frames
+
+
+if __name__ == '__main__' :
+
+    #Indexo una sola vez todos los archivos wrfout* de esta carpeta (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+
+    #Las alturas del corte se eligen con el primer tiempo y se pasan a todos los procesos del pool (si cada
+    #proceso las eligiera con el primer tiempo que le toca, las figuras dependerian del reparto de los tiempos).
+    if cross_levels is None :
+       cross_levels = first_levels( *run.time_dataset( plot_times[0] ) )
+
+    #Archivo y tiempo dentro del archivo de cada tiempo a graficar (los wrfout pueden tener mas de un tiempo).
+    tasks = [ run.source( plot_time ) + ( plot_time , cross_levels ) for plot_time in plot_times ]
+
+    #En modo animacion los frames se dibujan en paralelo y se van pasando en orden al codificador,
+    #sin escribir un archivo por tiempo.
+    if batch and animation is not None :
+       write_animation( [ animation ] , animation_task , tasks , fps , nworkers )
+       raise SystemExit
+
+    #En modo batch con mas de un proceso repartimos los tiempos entre los procesos.
+    #Los nombres de las figuras son los mismos que en la version secuencial.
+    if batch and nworkers != 1 :
+       run_parallel( plot_task , tasks , nworkers )
+       raise SystemExit
+
+    #Generamos la figura (y su parte fija) una sola vez.
+    #Como vamos a hacer 2 paneles queremos un tamanio de figura que
+    #sea el doble de ancho respecto al largo.
+    plt = get_pyplot( batch )
+    template = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=dpi ) )
+
+    for plot_time in plot_times :
+        # Tomo el archivo netcdf correspondiente al tiempo indicado (queda abierto en run).
+        ncfile , timeidx = run.time_dataset( plot_time )
+        plot_frame( ncfile , plot_time , template , timeidx )
+
+    run.close()
+
+    if not batch :
+       template.finalize()
+       plt.show()
+
+    #Liberamos la memoria de la figura.
+    template.close()
@@ -1,10 +1,18 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from netCDF4 import Dataset
-from wrf import (getvar, to_np, get_cartopy, latlon_coords, vertcross,
-                 cartopy_xlim, cartopy_ylim, interpline, CoordPair)
-import glob
-import scipy.io as sio
+
+from parallel_utils import run_parallel, ordered_map
+from animation_output import write_animation
+from wrf_run import WrfRun, open_wrfout
+from profiling import profile_frame, frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import CrossSectionTemplate
+from cross_section import CrossSection, LatLon
+from tiled import tiled_cross
+from map_overlay import draw_map
+from product_store import ProductStore
+from display_grid import to_display, shade
+from prefetch import Prefetcher
 
 #Grafico un mapa de 2 paneles. Uno indicando donde esta el corte.
 #Otro mostrando el resultado del corte.
@@ -12,101 +20,351 @@ import scipy.io as sio
 plot_time= 10          #En que tiempo vamos a hacer el grafico (arrancando desde 0)
 figure_name= 'CrossRef'
 plot_mat   = True     #Si es True grafica el mapa, sino ponerlo en False
+map_file   = './mapas.mat'  #Archivo con los mapas (provincias y sudamerica).
+
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end
+#en una sola corrida, sin mostrar las figuras en pantalla.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = 1       #Cantidad de procesos para graficar en paralelo en modo batch (None = todos los cores).
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
+#Lectura adelantada (ver prefetch.py): en el loop secuencial los prefetch tiempos siguientes se leen y se
+#calculan en un thread mientras se grafica el actual (0 = sin adelantar). En modo batch se imprimen las
+#estadisticas de la cola, que sirven para elegir prefetch.
+prefetch      = 2
 
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ plot_time ])
+#Animacion: en modo batch, si animation es un nombre de archivo (.mp4 o .gif) todos los tiempos se
+#guardan en una animacion en lugar de un archivo por tiempo.
+animation     = None    #Por ejemplo 'CrossRef.mp4'.
+fps           = 4       #Cuadros por segundo de la animacion.
 
+#Salida de las figuras.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+
+#Resolucion de pantalla (ver display_grid.py): con display_res = True el corte (que tiene 100 niveles, o los que
+#se pidan) se promedia en bloques hasta tener a lo sumo display_oversample niveles y puntos por pixel del panel.
+#shading elige como se dibuja el corte: 'contourf', 'pcolormesh', 'imshow' (los niveles del corte son
+#equiespaciados, asi que es una imagen regular) o 'auto'.
+display_res        = False
+display_oversample = 1
+shading            = 'contourf'
 
 #Definimos el punto de partida del corte y el punto de fin.
-cross_start = CoordPair(lat=-31.1, lon=-67.0)
-cross_end = CoordPair(lat=-31.1, lon=-58.0)
-
-#Obtenemos las variables.
-ht = getvar(ncfile, "z")      #Altura sobre el nivel del mar
-ter = getvar(ncfile, "ter")   #Altura de la topografia
-dbz = getvar(ncfile, "dbz")   #Reflectividad de radar simulada
-
-# Interpola dbz al corte vertical soliciado.
-# Ademas dbz_cross tiene en su metadata la lat/lon de los puntos que componen el corte.
-dbz_cross = vertcross(dbz, ht, wrfin=ncfile,
-                    start_point=cross_start,
-                    end_point=cross_end,
-                    latlon=True, meta=True)
-
-# Add back the attributes that xarray dropped from the operations above
-#dbz_cross.attrs.update(dbz_cross.attrs)
-#dbz_cross.attrs["description"] = "radar reflectivity cross section"
-#dbz_cross.attrs["units"] = "dBZ"
-# Obtenemos una transecta que representa la altura del terreno en la direccion del corte.
-ter_line = interpline(ter, wrfin=ncfile, start_point=cross_start,
-                      end_point=cross_end)
-
-# Obtenemos las matrices de latitud y longitud para los graficos.
-lats, lons = latlon_coords(dbz)
-lats=to_np(lats)
-lons=to_np(lons)
-
-#Generamos la figura.
-#Como vamos a hacer 2 paneles queremos un tamanio de figura que 
-#sea el doble de ancho respecto al largo.
-plt.figure(figsize=(9,4))
-
-#Primer subplot con la ubicacion del corte.
-plt.subplot(121)
-plot_ter = to_np(ter)
-plot_ter[ plot_ter <= 1.0 ] = np.nan
-plt.contourf(lons,lats,plot_ter,levels=np.arange(-1000,5000,500),cmap='terrain',extend='max')
-plt.plot( [ cross_start.lon , cross_end.lon ] , [ cross_start.lat , cross_end.lat ] , 'o-' )
-plt.colorbar()
-#Agrego el mapa (Solo si plot_mat es True)
-if plot_mat :
-   mapa = sio.loadmat('./mapas.mat')
-   plt.plot(mapa['provincias'][:,0],mapa['provincias'][:,1], color='k', lw=0.5, zorder=1)
-   plt.plot(mapa['samerica'][:,0],mapa['samerica'][:,1], color='k', lw=0.5, zorder=1)
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
-
-
-plt.title('Ubicacion del corte')
-
-#Segundo subplot con el corte vertical
-plt.subplot(122)
-# Make the cross section plot for dbz
-xs = np.arange(0, dbz_cross.shape[-1], 1)
-ys = to_np(dbz_cross.coords["vertical"])
-levels=np.arange(0.0,60.0,5.0)
-plt.contourf(xs,ys,to_np(dbz_cross),levels=levels,cmap='gist_ncar')
-plt.colorbar()
-#Genero un sombreado con el terreno.
-plt.fill_between(xs, 0, to_np(ter_line),facecolor="saddlebrown")
-#Esto permite mostrar el label de x en lat/lon
-coord_pairs = to_np(dbz_cross.coords["xy_loc"])
-x_ticks = np.arange(coord_pairs.shape[0])
-x_labels=list()
-for ii in range( coord_pairs.shape[0]  ) :
-    x_labels.append( coord_pairs[ii].lon )
-
-# Set the desired number of x ticks below
-num_ticks = 5
-thin = int((len(x_ticks) / num_ticks) + .5)
-plt.xticks(x_ticks[::thin],labels=x_labels[::thin],rotation=45, fontsize=8)
-
-#Fijo el tope vertical del corte en 15 km.
-plt.axis([xs.min(),xs.max(),0,15000])
-
-# Add a title
-plt.title('Corte vertical de reflectividad (dBZ)')
-
-
-plt.savefig( './' + figure_name + '_tiempo_' + str( plot_time ) + '.png' )
-
-plt.show()
+cross_start = LatLon(lat=-31.1, lon=-67.0)
+cross_end = LatLon(lat=-31.1, lon=-58.0)
+cross     = None   #Se calcula en el primer tiempo que se grafica (ver plot_frame).
+#Alturas (m) del corte. Con None se eligen como en vertcross (100 niveles desde 0 hasta la altura maxima
+#del corte) con la z del primer tiempo que se grafica, y quedan fijas para todos los tiempos.
+cross_levels = None
+
+#Memoria: si memory_budget_mb no es None, z y dbz se calculan solo en las partes del dominio que toca el
+#corte (de a lo sumo memory_budget_mb MB cada una), en lugar de cargar los campos 3D completos.
+memory_budget_mb = None
+
+#Calcular una vez y graficar muchas: con mode = 'compute' solo se calculan el corte, la linea de terreno y
+#las coordenadas y se guardan en products_file (ver product_store.py), sin graficar. Con mode = 'plot' se
+#grafica leyendo products_file, sin abrir los wrfout, para cambiar colores o titulos sin recalcular nada.
+#Con mode = 'all' se calcula y se grafica como siempre.
+mode          = 'all'
+products_file = 'CrossRef_products.nc'
+
+
+def compute_frame( ncfile , statics=False , timeidx=0 ) :
+    """Productos del tiempo timeidx del archivo: el corte de dbz (dbz_cross) y sus alturas (levels).
+
+    Si statics es True tambien devuelve lo que no cambia con el tiempo y solo se usa en el
+    primer frame: terreno (ter), lats, lons, linea de terreno del corte (ter_line), puntos
+    del corte en la reticula (xy_loc) y su lat/lon (cross_lats, cross_lons).
+    """
+    from wrf import to_np, latlon_coords
+    #El corte (puntos sobre la reticula, pesos de la interpolacion y niveles verticales) se calcula
+    #en el primer tiempo y se reutiliza en los siguientes. En cada tiempo solo se actualizan los
+    #pesos verticales con la z de ese tiempo.
+    global cross
+    if memory_budget_mb is None :
+       #Obtenemos las variables.
+       ht = cached_getvar(ncfile, "z", timeidx=timeidx)      #Altura sobre el nivel del mar
+       dbz = cached_getvar(ncfile, "dbz", timeidx=timeidx)   #Reflectividad de radar simulada
+
+       if cross is None :
+          cross = CrossSection( to_np(ht) , cross_start , cross_end , wrfin=ncfile , levels=cross_levels )
+
+       # Interpola dbz al corte vertical soliciado.
+       dbz_cross = cross.apply( [ to_np(dbz) ] , z=to_np(ht) )[0]
+    else :
+       #Solo se calculan z y dbz en las columnas que rodean al corte.
+       cross , campos = tiled_cross( ncfile , cross_start , cross_end , [ ( 'dbz' , { } ) ] , cross=cross , levels=cross_levels ,
+                                     budget_mb=memory_budget_mb , timeidx=timeidx )
+       dbz_cross = campos[0]
+    products = { 'dbz_cross' : to_np(dbz_cross) , 'levels' : cross.levels }
+
+    if statics :
+       ter = cached_getvar(ncfile, "ter", timeidx=timeidx)   #Altura de la topografia
+       # Obtenemos una transecta que representa la altura del terreno en la direccion del corte.
+       products['ter_line'] = cross.line( to_np(ter) )
+
+       # Obtenemos las matrices de latitud y longitud para los graficos.
+       lats, lons = latlon_coords(ter)
+       products['lats'] = to_np(lats)
+       products['lons'] = to_np(lons)
+       products['ter'] = to_np(ter)
+       # Y la lat/lon de los puntos que componen el corte.
+       products['xy_loc'] = cross.xy
+       products['cross_lats'] , products['cross_lons'] = cross.latlon( products['lats'] , products['lons'] )
+    return products
+
+
+def first_levels( ncfile , timeidx=0 ) :
+    """Alturas del corte elegidas con la z del tiempo timeidx del archivo (las mismas que usaria compute_frame)."""
+    from wrf import to_np
+    if memory_budget_mb is None :
+       ht = cached_getvar(ncfile, "z", timeidx=timeidx)
+       return CrossSection( to_np(ht) , cross_start , cross_end , wrfin=ncfile ).levels
+    return tiled_cross( ncfile , cross_start , cross_end , [ ] , budget_mb=memory_budget_mb , timeidx=timeidx )[0].levels
+
+
+@profile_frame
+def plot_frame( ncfile , plot_time , template , plot_mat=False , timeidx=0 ) :
+    """Grafica el corte de un tiempo (el timeidx del archivo) sobre la plantilla template (CrossSectionTemplate)."""
+    draw_frame( compute_frame( ncfile , template.background is None , timeidx ) , plot_time , template , plot_mat )
+
+
+def draw_frame( products , plot_time , template , plot_mat=False ) :
+    """Grafica el corte de un tiempo a partir de sus productos (ver compute_frame).
+
+    El panel con la ubicacion del corte, el terreno, el mapa, los limites y los titulos se
+    dibujan solo en el primer frame; en los siguientes solo se cambia el sombreado del corte.
+    """
+    ax1 , ax2 = template.ax1 , template.ax2
+    dbz_cross = products['dbz_cross']
+    npts = dbz_cross.shape[-1]
+    xs = np.arange(0, npts, 1)
+    ys = products['levels']
+    first_frame = template.background is None
+
+    if first_frame :
+       lats , lons = products['lats'] , products['lons']
+       ter_line , cross_lons = products['ter_line'] , products['cross_lons']
+
+       #Primer subplot con la ubicacion del corte.
+       plot_ter = np.array( products['ter'] )
+       plot_ter[ plot_ter <= 1.0 ] = np.nan
+       cf = ax1.contourf(lons,lats,plot_ter,levels=np.arange(-1000,5000,500),cmap='terrain',extend='max')
+       ax1.plot( [ cross_start.lon , cross_end.lon ] , [ cross_start.lat , cross_end.lat ] , 'o-' )
+       template.fig.colorbar( cf , cax=template.cax1 )
+       #Agrego el mapa (Solo si plot_mat es True)
+       if plot_mat :
+          draw_map( ax1 , lons , lats , map_file )
+       #Agregamos las gridlines
+       ax1.grid()
+       #Ajustamos los limites de la figura al dominio del WRF
+       ax1.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
+
+       ax1.set_title('Ubicacion del corte')
+
+       #Segundo subplot con el corte vertical
+       #Genero un sombreado con el terreno (queda arriba del sombreado de cada frame).
+       template.overlay( ax2.fill_between(xs, 0, ter_line,facecolor="saddlebrown") )
+       #Esto permite mostrar el label de x en lat/lon
+       x_ticks = np.arange(npts)
+       x_labels=list()
+       for ii in range( npts ) :
+           x_labels.append( str( np.round( cross_lons[ii] , 2 ) ) )
+
+       # Set the desired number of x ticks below
+       num_ticks = 5
+       thin = int((len(x_ticks) / num_ticks) + .5)
+       ax2.set_xticks(x_ticks[::thin],labels=x_labels[::thin],rotation=45, fontsize=8)
+
+       #Fijo el tope vertical del corte en 15 km.
+       ax2.axis([xs.min(),xs.max(),0,15000])
+
+       # Add a title
+       ax2.set_title('Corte vertical de reflectividad (dBZ)')
+
+    #Borramos lo que cambia de un frame a otro.
+    template.clear()
+
+    # Make the cross section plot for dbz
+    levels=np.arange(0.0,60.0,5.0)
+    pxs , pys , pdbz = xs , ys , dbz_cross
+    if display_res :
+       pxs , pys , pdbz = to_display( ax2 , xs , ys , pdbz , oversample=display_oversample )
+    cf = template.update( shade( ax2 , pxs , pys , pdbz , levels , 'gist_ncar' , shading ) )
+    if first_frame :
+       #Los niveles son fijos asi que la colorbar es parte del fondo.
+       template.fig.colorbar( cf , cax=template.cax2 )
+
+    template.save( frame_filename( figure_name , plot_time , ext=output_format ) , compress_level=png_compress_level )
+
+
+#Figura de cada proceso del pool, se crea una sola vez por proceso.
+_worker = dict()
+
+
+def worker_template() :
+    """Plantilla de la figura de este proceso, se crea una sola vez por proceso."""
+    if 'template' not in _worker :
+       plt = get_pyplot( headless=True )
+       _worker['template'] = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=dpi ) )
+    return _worker['template']
+
+
+def plot_task( task ) :
+    """Tarea para el pool de procesos: grafica un tiempo en la figura propia de este proceso."""
+    global cross_levels
+    filename , timeidx , plot_time , cross_levels = task
+    template = worker_template()
+    with open_wrfout( filename ) as ncfile :
+         plot_frame( ncfile , plot_time , template , plot_mat , timeidx )
+    return frame_filename( figure_name , plot_time , ext=output_format )
+
+
+def compute_task( task ) :
+    """Tarea para el pool de procesos con mode = 'compute': los productos de un tiempo (se guardan en el proceso principal).
+
+    Las partes fijas se calculan en todos los tiempos (son baratas comparadas con el corte)
+    porque no se sabe que tiempo le toca primero a cada proceso.
+    """
+    global cross_levels
+    filename , timeidx , plot_time , cross_levels = task
+    with open_wrfout( filename ) as ncfile :
+         return plot_time , compute_frame( ncfile , statics=True , timeidx=timeidx )
+
+
+#Dimensiones de cada producto en products_file.
+PRODUCT_DIMS = { 'dbz_cross' : ( 'vertical' , 'punto' ) , 'levels' : ( 'vertical' , ) ,
+                 'ter_line' : ( 'punto' , ) , 'xy_loc' : ( 'punto' , 'xy' ) , 'cross_lats' : ( 'punto' , ) ,
+                 'cross_lons' : ( 'punto' , ) , 'lats' : ( 'y' , 'x' ) , 'lons' : ( 'y' , 'x' ) , 'ter' : ( 'y' , 'x' ) }
+TIMED_PRODUCTS = ( 'dbz_cross' , 'levels' )
+
+
+def store_products( store , plot_time , products ) :
+    """Guarda los productos de un tiempo (los fijos solo la primera vez)."""
+    for name , array in products.items() :
+        if name in TIMED_PRODUCTS :
+           store.write( name , plot_time , array , dims=PRODUCT_DIMS[ name ] )
+        else :
+           store.write_static( name , array , dims=PRODUCT_DIMS[ name ] )
+
+
+def plot_from_store( store , plot_times , template , plot_mat=False ) :
+    """Grafica los tiempos plot_times leyendo los productos de store (sin abrir los wrfout)."""
+    statics = { name : store.read( name ) for name in PRODUCT_DIMS if name not in TIMED_PRODUCTS }
+    available = store.times( 'dbz_cross' )
+    for plot_time in plot_times :
+        if plot_time not in available :
+           print( 'El tiempo ' + str( plot_time ) + ' no esta en ' + products_file )
+    plot_times = [ plot_time for plot_time in plot_times if plot_time in available ]
+    #Los productos de los tiempos siguientes se leen en un thread mientras se grafica el actual.
+    reads = Prefetcher( lambda plot_time : { name : store.read( name , plot_time ) for name in TIMED_PRODUCTS } ,
+                        plot_times , prefetch , name='products' , verbose=batch , label=lambda plot_time : plot_time )
+    for plot_time , products in zip( plot_times , reads ) :
+        with frame( plot_time ) :
+             products.update( statics )
+             draw_frame( products , plot_time , template , plot_mat )
+
+
+def animation_task( task ) :
+    """Tarea para el pool de procesos en modo animacion: devuelve las imagenes del tiempo en lugar de escribirlas."""
+    template = worker_template()
+    template.frames = list()
+    plot_task( task )
+    frames , template.frames = template.frames , None
+    return frames
+
+
+if __name__ == '__main__' :
+
+    #Solo se grafica a partir de los productos ya calculados: no se abren los wrfout.
+    if mode == 'plot' :
+       store = ProductStore( products_file )
+       if batch :
+          plot_times = get_time_range( max( store.times( 'dbz_cross' ) ) + 1 , plot_time_ini , plot_time_end )
+       else :
+          plot_times = [ plot_time ]
+       plt = get_pyplot( batch )
+       template = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=dpi ) )
+       plot_from_store( store , plot_times , template , plot_mat )
+       store.close()
+       if not batch :
+          template.finalize()
+          plt.show()
+       template.close()
+       raise SystemExit
+
+    #Indexo una sola vez todos los archivos wrfout* de esta carpeta (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+
+    #Solo se calculan los productos (en paralelo si nworkers != 1) y se guardan en products_file.
+    #El archivo se escribe solo desde este proceso. Si ya tiene productos de otro corte u otras alturas
+    #no se mezclan; si las alturas son automaticas se reutilizan las ya guardadas.
+    if mode == 'compute' :
+       store = ProductStore( products_file , 'a' )
+       store.set_attrs( campos='dbz' , cross_start=cross_start , cross_end=cross_end , cross_levels=cross_levels )
+       if cross_levels is None and store.has( 'levels' ) :
+          cross_levels = store.read( 'levels' , store.times( 'levels' )[0] )
+
+    #Las alturas del corte se eligen con el primer tiempo y se pasan a todos los procesos del pool (si cada
+    #proceso las eligiera con el primer tiempo que le toca, las figuras dependerian del reparto de los tiempos).
+    if cross_levels is None :
+       cross_levels = first_levels( *run.time_dataset( plot_times[0] ) )
+
+    #Archivo y tiempo dentro del archivo de cada tiempo a graficar (los wrfout pueden tener mas de un tiempo).
+    tasks = [ run.source( plot_time ) + ( plot_time , cross_levels ) for plot_time in plot_times ]
+
+    if mode == 'compute' :
+       for plot_time , products in ordered_map( compute_task , tasks , nworkers ) :
+           store_products( store , plot_time , products )
+           print( 'Productos del tiempo ' + str( plot_time ) + ' en ' + products_file )
+       store.close()
+       raise SystemExit
+
+    #En modo animacion los frames se dibujan en paralelo y se van pasando en orden al codificador,
+    #sin escribir un archivo por tiempo.
+    if batch and animation is not None :
+       write_animation( [ animation ] , animation_task , tasks , fps , nworkers )
+       raise SystemExit
+
+    #En modo batch con mas de un proceso repartimos los tiempos entre los procesos.
+    #Los nombres de las figuras son los mismos que en la version secuencial.
+    if batch and nworkers != 1 :
+       run_parallel( plot_task , tasks , nworkers )
+       raise SystemExit
+
+    #Generamos la figura (y su parte fija) una sola vez.
+    #Como vamos a hacer 2 paneles queremos un tamanio de figura que
+    #sea el doble de ancho respecto al largo.
+    plt = get_pyplot( batch )
+    template = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=dpi ) )
+
+    #Tomo el archivo netcdf correspondiente a cada tiempo (queda abierto en run). Los cortes de los tiempos
+    #siguientes se calculan en un thread mientras se grafica el actual (las partes fijas solo en el primero).
+    def compute_time( plot_time ) :
+        ncfile , timeidx = run.time_dataset( plot_time )
+        return compute_frame( ncfile , plot_time == plot_times[0] , timeidx )
+
+    frames = Prefetcher( compute_time , plot_times , prefetch , name='compute_frame' , verbose=batch ,
+                         label=lambda plot_time : plot_time )
+    for plot_time , products in zip( plot_times , frames ) :
+        with frame( plot_time ) :
+             draw_frame( products , plot_time , template , plot_mat )
+
+    run.close()
 
+    if not batch :
+       template.finalize()
+       plt.show()
 
+    #Liberamos la memoria de la figura.
+    template.close()
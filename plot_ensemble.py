@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Comparacion de varias corridas (miembros de un ensamble o experimentos de sensibilidad).
+Se extrae el mismo corte (un nivel, un corte vertical o un campo de superficie) de todos
+los experimentos y se grafica en una figura con un panel por miembro, la media y la
+dispersion del ensamble y la diferencia de cada miembro contra el de referencia.
+
+Los cortes de todos los miembros se calculan en paralelo (ver ensemble.py) mientras se
+grafican los tiempos anteriores; la media, la dispersion y las diferencias salen del mismo
+array (miembro, ...), sin volver a leer los campos de los miembros.
+"""
+
+import os
+
+import numpy as np
+
+from cross_section import LatLon
+from ensemble import ensemble_runs, extract_ensemble, ensemble_stats, differences
+from profiling import profile_frame
+from batch_utils import get_time_range, frame_filename, get_pyplot
+from figure_templates import EnsembleTemplate
+
+#Carpetas de los experimentos (una por miembro, cada una con sus wrfout_d01_*). Hay que completarla,
+#por ejemplo [ '../control' , '../exp_1' , '../exp_2' ].
+experiments = [ ]
+labels      = None    #Nombre de cada experimento en los paneles (None = nombre de la carpeta).
+reference   = 0       #Experimento contra el que se calculan las diferencias (indice en experiments).
+
+plot_time   = 0        #En que tiempo vamos a hacer el grafico (arrancando desde 0).
+figure_name = 'ENS_T'  #Un nombre que distinga esta figura de otros tipos de figuras.
+
+#Corte a comparar: 'level' (variable interpolada a la altura nivel), 'cross' (corte vertical entre
+#cross_start y cross_end en las alturas cross_levels) o 'surface' (variable 2D, como T2).
+product  = 'level'
+variable = ( 'tk' , { } )   #Variable de getvar y sus opciones.
+nivel    = 5000             #Altura (m) para product = 'level'.
+cross_start  = LatLon(lat=-31.1, lon=-67.0)   #Extremos del corte para product = 'cross' (GridPoint(x=, y=) en las corridas ideales).
+cross_end    = LatLon(lat=-31.1, lon=-58.0)
+cross_levels = np.arange( 0. , 15000. , 250. )   #Alturas (m) del corte (las mismas para todos los miembros).
+use_latlon   = True     #Si es False los ejes son los puntos de reticula (para las corridas ideales).
+
+#Modo batch: si batch es True se grafican todos los tiempos entre plot_time_ini y plot_time_end sin mostrar las figuras.
+batch         = False
+plot_time_ini = 0       #Primer tiempo a graficar en modo batch.
+plot_time_end = None    #Ultimo tiempo a graficar en modo batch (None = hasta el ultimo wrfout).
+nworkers      = None    #Cantidad de procesos para calcular los cortes de los miembros (None = todos los cores).
+
+#Salida de las figuras.
+ncols              = 4       #Paneles por fila.
+dpi                = 100     #Resolucion de las figuras (puntos por pulgada).
+output_format      = 'png'   #png, webp o rgba (bytes crudos de la imagen, el mas rapido de escribir).
+png_compress_level = 1       #Compresion de los png (0 a 9).
+
+
+def product_args() :
+    """Argumentos de ensemble.PRODUCTS[ product ] para la configuracion de arriba."""
+    if product == 'level' :
+       return ( [ variable ] , [ nivel ] )
+    if product == 'cross' :
+       return ( [ variable ] , cross_start , cross_end , cross_levels )
+    return ( [ variable ] , )
+
+
+def to_panel( stack ) :
+    """Campo 2D a graficar de cada miembro: (nmembers,ny,nx) o (nmembers,nlevels,npts)."""
+    if product == 'level' :
+       return stack[ : , 0 , 0 ]
+    return stack[ : , 0 ]
+
+
+def panel_coords( run , shape ) :
+    """Coordenadas x, y de los paneles."""
+    if product == 'cross' :
+       return np.arange( shape[1] ) , cross_levels
+    if use_latlon :
+       ncfile = run.dataset( 0 )
+       return np.asarray( ncfile.variables['XLONG'][0] ) , np.asarray( ncfile.variables['XLAT'][0] )
+    return np.arange( shape[1] ) , np.arange( shape[0] )
+
+
+def color_levels( field , symmetric=False , nlevels=15 ) :
+    """Niveles de sombreado fijos para todos los tiempos, a partir del primer tiempo."""
+    if symmetric :
+       vmax = np.nanmax( np.abs( field ) )
+       vmax = vmax if vmax > 0 else 1.0
+       return np.linspace( -vmax , vmax , nlevels + 1 )
+    vmin , vmax = np.nanmin( field ) , np.nanmax( field )
+    if vmax <= vmin :
+       vmax = vmin + 1.0
+    return np.linspace( vmin , vmax , nlevels + 1 )
+
+
+def make_template( panels , x , y , fields , stats , diffs ) :
+    """Plantilla con un eje por panel, titulos y colorbars fijas (niveles del primer tiempo)."""
+    from matplotlib.cm import ScalarMappable
+    from matplotlib.colors import BoundaryNorm
+    plt = get_pyplot( batch )
+    template = EnsembleTemplate( plt.figure( figsize=( 3.2 * min( ncols , len( panels ) ) , 2.8 * -( -len( panels ) // ncols ) ) , dpi=dpi ) ,
+                                 len( panels ) , ncols )
+    template.fig.suptitle( variable[0] )
+    template.levels = { 'field'  : color_levels( np.concatenate( ( fields , stats['mean'][ np.newaxis ] ) ) ) ,
+                        'spread' : color_levels( stats['spread'] ) ,
+                        'diff'   : color_levels( diffs , symmetric=True ) }
+    template.cmaps = { 'field' : 'rainbow' , 'spread' : 'viridis' , 'diff' : 'RdBu_r' }
+    for ax , ( kind , title , index ) in zip( template.axes , panels ) :
+        ax.set_title( title , fontsize=9 )
+        ax.grid()
+        ax.axis( [ np.min( x ) , np.max( x ) , np.min( y ) , np.max( y ) ] )
+    for kind in ( 'field' , 'spread' , 'diff' ) :
+        axes = [ ax for ax , panel in zip( template.axes , panels ) if panel[0] == kind ]
+        if len( axes ) > 0 :
+           cmap = plt.get_cmap( template.cmaps[ kind ] )
+           mappable = ScalarMappable( norm=BoundaryNorm( template.levels[ kind ] , cmap.N ) , cmap=cmap )
+           template.fig.colorbar( mappable , ax=axes , shrink=0.8 )
+    return template
+
+
+def panel_list( labels ) :
+    """Paneles ( tipo , titulo , miembro ): cada miembro, la media, la dispersion y las diferencias contra reference."""
+    panels = [ ( 'field' , label , imember ) for imember , label in enumerate( labels ) ]
+    panels += [ ( 'field' , 'Media' , 'mean' ) , ( 'spread' , 'Dispersion' , 'spread' ) ]
+    panels += [ ( 'diff' , label + ' - ' + labels[ reference ] , imember )
+                for imember , label in enumerate( labels ) if imember != reference ]
+    return panels
+
+
+@profile_frame
+def plot_frame( fields , plot_time , template , panels , x , y , stats , diffs ) :
+    """Grafica los paneles de un tiempo. fields (nmembers,...) son los cortes de cada miembro."""
+    template.clear()
+    for ax , ( kind , title , index ) in zip( template.axes , panels ) :
+        if kind == 'field' :
+           field = stats['mean'] if index == 'mean' else fields[ index ]
+        elif kind == 'spread' :
+           field = stats['spread']
+        else :
+           field = diffs[ index ]
+        template.update( ax.contourf( x , y , field , levels=template.levels[ kind ] , cmap=template.cmaps[ kind ] , extend='both' ) )
+    template.save( frame_filename( figure_name , plot_time , nivel if product == 'level' else None , ext=output_format ) ,
+                   compress_level=png_compress_level )
+
+
+if __name__ == '__main__' :
+
+    if len( experiments ) < 2 :
+       raise ValueError( 'Hay que poner en experiments las carpetas de al menos dos corridas' )
+    runs = ensemble_runs( experiments )
+    if labels is None :
+       labels = [ os.path.basename( os.path.normpath( path ) ) for path in experiments ]
+    ntimes = runs[0].ntimes
+
+    if batch :
+       plot_times = get_time_range( ntimes , plot_time_ini , plot_time_end )
+    else :
+       plot_times = [ plot_time ]
+
+    panels = panel_list( labels )
+    template = None
+    #Los cortes de los miembros se calculan en los procesos del pool, adelantados a los tiempos que se grafican.
+    for plot_time , stack in extract_ensemble( runs , product , product_args() , plot_times , nworkers ) :
+        fields = to_panel( stack )
+        #Media, dispersion y diferencias contra la referencia, todo sobre el mismo array.
+        stats = ensemble_stats( fields )
+        diffs = differences( fields , reference )
+        if template is None :
+           x , y = panel_coords( runs[0] , fields.shape[1:] )
+           template = make_template( panels , x , y , fields , stats , diffs )
+        plot_frame( fields , plot_time , template , panels , x , y , stats , diffs )
+
+    for run in runs :
+        run.close()
+
+    if not batch :
+       template.finalize()
+       get_pyplot().show()
+
+    template.close()
@@ -0,0 +1,84 @@
+import numpy as np
+from wrf_run import open_wrfout
+
+from batch_utils import get_file_list, get_pyplot
+from diag_cache import cached_getvar
+from figure_templates import HorizontalTemplate, CrossSectionTemplate, MeteogramTemplate
+from point_series import station_points
+from watch_run import follow_files
+from station_store import StationStore
+
+import plot_2dvar_horizontal_section_real as horizontal_2d
+import plot_3dvar_horizontal_section_real as horizontal_3d
+import plot_3dvar_vertical_section_real as vertical
+import plot_time_evolution_real as meteogram
+
+#Modo "seguir la corrida": mientras el WRF corre, cada tiempo nuevo de los wrfout se grafica
+#en cuanto termina de escribirse (cortes horizontales, corte vertical y meteograma), sin
+#esperar a que termine la corrida. El meteograma agrega el tiempo nuevo al almacen de series
+#(station_store) en lugar de volver a leer todos los archivos anteriores.
+#La configuracion de cada figura (niveles, corte, punto del meteograma, formato de salida)
+#es la de cada script.
+
+path          = '.'     #Carpeta donde el WRF escribe los wrfout.
+domain        = 'd01'
+poll_interval = 10.0    #Segundos entre revisiones de la carpeta (si no esta instalado inotify_simple).
+settle_time   = 5.0     #Segundos sin cambios para considerar que un wrfout esta completo.
+timeout       = 3600.0  #Se termina si pasa este tiempo (s) sin wrfout nuevos (None = no termina nunca).
+skip          = 0       #Cantidad de tiempos del principio que no se grafican (por ejemplo si ya estaban graficados).
+
+plot_horizontal_2d = True
+plot_horizontal_3d = True
+plot_vertical      = True
+plot_meteogram     = True
+
+
+if __name__ == '__main__' :
+
+    plt = get_pyplot( headless=True )
+
+    #Una plantilla por figura, se reutilizan en todos los tiempos.
+    template_2d = HorizontalTemplate( plt.figure( dpi=horizontal_2d.dpi ) )
+    template_3d = HorizontalTemplate( plt.figure( dpi=horizontal_3d.dpi ) )
+    template_cross = CrossSectionTemplate( plt.figure( figsize=(9,4) , dpi=vertical.dpi ) )
+    template_meteogram = MeteogramTemplate( plt.figure( figsize=(9,4) ) )
+
+    #Almacen con las series del meteograma, se crea con el primer archivo.
+    store = None
+
+    #timeidx es el tiempo dentro del wrfout (los archivos pueden tener mas de un tiempo).
+    for plot_time , filename , timeidx in follow_files( path , domain , poll_interval , settle_time , timeout , skip ) :
+        with open_wrfout( filename ) as ncfile :
+             if plot_horizontal_2d :
+                horizontal_2d.plot_frame( ncfile , plot_time , template_2d , horizontal_2d.plot_mat , timeidx )
+             if plot_horizontal_3d :
+                horizontal_3d.plot_frame( ncfile , plot_time , horizontal_3d.niveles , template_3d , horizontal_3d.plot_mat , timeidx )
+             if plot_vertical :
+                vertical.plot_frame( ncfile , plot_time , template_cross , vertical.plot_mat , timeidx )
+
+             if plot_meteogram :
+                if store is None :
+                   #Con el primer archivo ubicamos el punto en la reticula y dibujamos el panel fijo.
+                   points , weights = station_points( ncfile , [ meteogram.point_lat ] , [ meteogram.point_lon ] )
+                   store = StationStore( meteogram.store_directory( meteogram.point_lon , meteogram.point_lat ) ,
+                                         points , ( 'T2C' , 'td2' ) )
+                   #Los archivos salteados (skip) tambien van a la serie, si no estaban ya en el almacen.
+                   run_files = get_file_list( path , domain )
+                   run_files = run_files[ : run_files.index( filename ) ]
+                   store.update( run_files )
+                   meteogram.plot_location( template_meteogram , cached_getvar( ncfile , "ter" ) ,
+                                            meteogram.point_lon , meteogram.point_lat , meteogram.plot_mat )
+                #Del archivo nuevo solo se lee el punto del meteograma (todos los tiempos que tiene escritos).
+                if filename not in run_files :
+                   run_files.append( filename )
+                store.append( filename , ncfile )
+                #Solo los tiempos de esta corrida (el almacen puede tener otras corridas del mismo punto).
+                time , data = store.series( run_files , 0 )
+                time = ( time - time[0] ) / np.timedelta64(1,'h')
+                meteogram.plot_series( template_meteogram , time , data[ : , 0 ] , data[ : , 1 ] ,
+                                       meteogram.meteogram_filename( meteogram.point_lon , meteogram.point_lat ) )
+
+        print( 'Graficado ' + filename + ' (tiempo ' + str( timeidx ) + ')' )
+
+    for template in ( template_2d , template_3d , template_cross , template_meteogram ) :
+        template.close()
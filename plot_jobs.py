@@ -0,0 +1,501 @@
+import io
+import os
+import sys
+import json
+import time
+import secrets
+import importlib
+import threading
+import traceback
+from functools import partial
+from contextlib import redirect_stdout
+
+import numpy as np
+
+from batch_utils import get_time_range, get_pyplot, new_figure
+from cross_section import LatLon, GridPoint
+from diag_cache import CACHE_DIR, NETCDF_LOCK, cached_getvar, memoize, forget
+from figure_templates import HorizontalTemplate, CrossSectionTemplate, MeteogramTemplate
+from parallel_utils import run_parallel
+from task_graph import TaskGraph
+from wrf_run import WrfRun, open_wrfout
+
+#Grafica muchas figuras (de una o varias corridas, reales o idealizadas) a partir de un archivo
+#de trabajos (json, toml o yaml) en lugar de editar y correr cada script por separado.
+#Los trabajos se agrupan por wrfout: cada archivo se abre una sola vez y cada variable derivada
+#(height, uvmet, tk, ...) se calcula una sola vez para todas las figuras que la usan. Dentro de
+#cada wrfout los campos y las figuras forman un grafo de tareas (task_graph): los campos se calculan
+#en nthreads threads, las figuras se hacen de a una en el thread principal (matplotlib no se puede
+#usar desde varios threads) mientras se calculan los campos de las siguientes, y cada campo se
+#libera de la memoria cuando termina la ultima figura que lo usa.
+#
+#Uso:  python plot_jobs.py plot_jobs.json
+#      python plot_jobs.py --imports                  tiempo de importar cada script y los paquetes que mas tardan.
+#      python plot_jobs.py --serve                    deja un proceso con todo importado esperando trabajos.
+#      python plot_jobs.py --submit plot_jobs.json    manda los trabajos al servidor (las figuras quedan en la carpeta actual).
+#      python plot_jobs.py --stop                     termina el servidor.
+#
+#Los pedidos al servidor se deserializan con pickle, asi que solo se aceptan conexiones con la clave
+#del usuario: la variable de entorno WRF_PLOTS_KEY o, si no esta, una clave al azar que el servidor
+#guarda en SERVER_KEY_FILE (solo legible por el usuario) y que --submit y --stop leen de ahi.
+#
+#Los scripts importan wrf-python, netCDF4 y matplotlib recien en la etapa que los usa (wrf al calcular,
+#matplotlib al crear la figura, scipy.io solo al dibujar el mapa con plot_mat), asi que por ejemplo
+#graficar desde un almacen de productos (mode = 'plot') no importa wrf. Aun asi importar wrf y
+#matplotlib tarda un par de segundos en cada corrida; con --serve esos modulos se importan una sola
+#vez y cada --submit solo paga el graficado.
+#
+#Cada trabajo indica el producto, el tipo de corrida y los tiempos, y cualquier otra opcion
+#de la configuracion del script correspondiente (figure_name, niveles, plot_mat, bbox, stride,
+#cross_start, cross_end, point_lon, point_lat, dpi, output_format, ...):
+#
+#   { "nworkers" : 4 , "nthreads" : 4 ,
+#     "jobs" : [ { "product" : "horizontal_3d" , "run" : "." , "kind" : "real" , "times" : "all" , "niveles" : [ 1000 , 3000 ] } ,
+#                { "product" : "vertical" , "kind" : "real" , "times" : { "ini" : 0 , "end" : 10 } ,
+#                  "cross_start" : { "lat" : -31.1 , "lon" : -67.0 } , "cross_end" : { "lat" : -31.1 , "lon" : -58.0 } } ,
+#                { "product" : "meteogram" , "kind" : "real" , "point_lon" : -64.2 , "point_lat" : -31.4 } ] }
+
+job_file = 'plot_jobs.json'   #Archivo de trabajos por defecto (si no se pasa como argumento).
+nworkers = 1                  #Procesos para repartir los tiempos (None = todos los cores). Se puede poner en el archivo.
+nthreads = 4                  #Threads por proceso para calcular los campos de un mismo wrfout mientras se hacen las figuras.
+
+#Modo servidor: direccion (solo local), archivo con la clave del socket y modulos que se importan al
+#arrancar (ademas de los scripts de PRODUCTS).
+SERVER_ADDRESS  = ( 'localhost' , 6150 )
+SERVER_KEY_FILE = os.path.join( CACHE_DIR , 'plot_jobs.key' )
+SERVER_PRELOAD = ( 'wrf' , 'netCDF4' , 'matplotlib.pyplot' )
+
+#Script que hace cada producto, para corridas reales e idealizadas.
+PRODUCTS = {
+    'horizontal_2d' : { 'real' : 'plot_2dvar_horizontal_section_real' , 'ideal' : 'plot_2dvar_horizontal_section_ideal' } ,
+    'horizontal_3d' : { 'real' : 'plot_3dvar_horizontal_section_real' , 'ideal' : 'plot_3dvar_horizontal_section_ideal' } ,
+    'vertical'      : { 'real' : 'plot_3dvar_vertical_section_real'   , 'ideal' : 'plot_3dvar_vertical_section_ideal' } ,
+    'meteogram'     : { 'real' : 'plot_time_evolution_real' } ,
+}
+
+#Campos derivados que usa cada producto (con las mismas opciones con que los pide el script).
+#Se calculan una sola vez por wrfout, antes de las figuras que los usan, y se liberan cuando
+#termina la ultima figura que los necesita.
+PRODUCT_FIELDS = {
+    'horizontal_2d' : ( ( 'uvmet10' , { 'units' : 'm s-1' } ) , ( 'T2' , { } ) ) ,
+    'horizontal_3d' : ( ( 'height' , { 'units' : 'm' } ) , ( 'uvmet' , { 'units' : 'm s-1' } ) , ( 'tk' , { } ) ) ,
+    'vertical'      : { 'real'  : ( ( 'z' , { } ) , ( 'dbz' , { } ) ) ,
+                        'ideal' : ( ( 'z' , { } ) , ( 'uvmet' , { 'units' : 'm s-1' } ) , ( 'wa' , { } ) ) } ,
+    'meteogram'     : ( ) ,
+}
+
+#Las tareas que leen el wrfout se turnan con el lock de diag_cache (ver NETCDF_LOCK).
+_netcdf_lock = NETCDF_LOCK
+#Los trabajos de un mismo script comparten sus variables globales, asi que no pueden graficar a la vez.
+_module_locks = dict()
+
+#Claves del trabajo que no son opciones del script (directory es la carpeta desde la que se toman
+#las rutas relativas, la agrega run_jobs).
+JOB_KEYS = ( 'product' , 'kind' , 'run' , 'domain' , 'times' , 'directory' )
+#Variables de los scripts que guardan estado entre tiempos (por ejemplo el corte ya calculado).
+STATE_VARS = ( 'cross' , )
+
+#Trabajos ya creados en este proceso (cada uno con su figura).
+_worker = dict()
+#Valores originales de las variables de los scripts que cambia algun trabajo.
+_defaults = dict()
+
+
+def load_jobs( filename ) :
+    """Lee el archivo de trabajos (json, toml o yaml segun la extension)."""
+    ext = filename.rsplit( '.' , 1 )[-1].lower()
+    if ext == 'json' :
+        with open( filename ) as my_file :
+            config = json.load( my_file )
+    elif ext == 'toml' :
+        import tomllib
+        with open( filename , 'rb' ) as my_file :
+            config = tomllib.load( my_file )
+    elif ext in ( 'yaml' , 'yml' ) :
+        try :
+            import yaml
+        except ImportError :
+            raise ImportError( 'Para leer trabajos en yaml hace falta instalar pyyaml (o usar json/toml)' )
+        with open( filename ) as my_file :
+            config = yaml.safe_load( my_file )
+    else :
+        raise ValueError( 'Formato de archivo de trabajos no soportado: ' + ext + ' (usar json, toml o yaml)' )
+    if isinstance( config , list ) :
+        config = { 'jobs' : config }
+    for job in config['jobs'] :
+        if job['product'] not in PRODUCTS or job.get( 'kind' , 'real' ) not in PRODUCTS[ job['product'] ] :
+            raise ValueError( 'Producto desconocido: ' + job['product'] + ' (' + job.get( 'kind' , 'real' ) + ')' )
+    return config
+
+
+def job_times( job , ntimes ) :
+    """Tiempos que grafica el trabajo: "all", una lista de tiempos o { "ini" : ... , "end" : ... }."""
+    times = job.get( 'times' , 'all' )
+    if times == 'all' :
+        return list( get_time_range( ntimes ) )
+    if isinstance( times , dict ) :
+        return list( get_time_range( ntimes , times.get( 'ini' , 0 ) , times.get( 'end' ) ) )
+    return [ plot_time for plot_time in times if plot_time < ntimes ]
+
+
+def _setting( name , value ) :
+    """Convierte las opciones que en los scripts no son numeros, textos o listas (los extremos del corte)."""
+    if name in ( 'cross_start' , 'cross_end' ) and isinstance( value , dict ) :
+        return LatLon( **value ) if 'lat' in value else GridPoint( **value )
+    return value
+
+
+class PlotJob :
+    """Un trabajo del archivo: un producto de un script con su configuracion y su figura."""
+
+    def __init__( self , job ) :
+        self.product = job['product']
+        self.kind = job.get( 'kind' , 'real' )
+        self.module = importlib.import_module( PRODUCTS[ self.product ][ self.kind ] )
+        self.settings = { name : _setting( name , value ) for name , value in job.items() if name not in JOB_KEYS }
+        self.state = { name : None for name in STATE_VARS if hasattr( self.module , name ) }
+        self.directory = job.get( 'directory' )
+        #El mapa (plot_mat) tambien se lee de la carpeta del trabajo.
+        if hasattr( self.module , 'map_file' ) :
+            self.settings['map_file'] = self.path( self.settings.get( 'map_file' , self.module.map_file ) )
+        self.template = None
+        self._lock = _module_locks.setdefault( self.module.__name__ , threading.Lock() )
+
+    def fields( self ) :
+        """Campos derivados ( nombre , opciones ) que usa el trabajo en cada tiempo.
+
+        Los trabajos con subdominio (bbox o stride) calculan sus campos sobre el recorte, y los
+        que tienen memory_budget_mb los calculan por partes, asi que no comparten los del archivo completo.
+        """
+        if ( self.settings.get( 'bbox' ) is not None or self.settings.get( 'stride' , 1 ) != 1 or
+             self.settings.get( 'memory_budget_mb' ) is not None ) :
+            return ( )
+        fields = PRODUCT_FIELDS[ self.product ]
+        return fields[ self.kind ] if isinstance( fields , dict ) else fields
+
+    def path( self , filename ) :
+        """filename desde la carpeta del trabajo (las rutas absolutas no cambian)."""
+        if self.directory is None :
+            return filename
+        return os.path.join( self.directory , filename )
+
+    def reads_file( self ) :
+        """True si la figura lee del wrfout algo mas que sus campos (la parte fija del primer frame o el subdominio)."""
+        return self.template is None or len( self.fields() ) == 0
+
+    def _configure( self ) :
+        """Pone en el modulo del script la configuracion y el estado de este trabajo.
+
+        Los scripts leen su configuracion de variables globales, asi que varios trabajos del
+        mismo script se turnan cambiandolas antes de graficar.
+        """
+        defaults = _defaults.setdefault( self.module.__name__ , dict() )
+        for name , value in list( defaults.items() ) :
+            setattr( self.module , name , value )
+        for name , value in list( self.settings.items() ) + list( self.state.items() ) :
+            if name not in defaults :
+                defaults[ name ] = getattr( self.module , name , None )
+            setattr( self.module , name , value )
+
+    def plot( self , ncfile , plot_time , timeidx=0 ) :
+        """Grafica un tiempo del trabajo (el timeidx del wrfout ya abierto)."""
+        if self.product == 'meteogram' :
+            return
+        with self._lock :
+            if self.reads_file() :
+                with _netcdf_lock :
+                    self._plot( ncfile , plot_time , timeidx )
+            else :
+                self._plot( ncfile , plot_time , timeidx )
+
+    def _plot( self , ncfile , plot_time , timeidx ) :
+        self._configure()
+        module = self.module
+        if self.template is None :
+            if self.product == 'vertical' :
+                self.template = CrossSectionTemplate( new_figure( figsize=(9,4) , dpi=module.dpi ) )
+            else :
+                self.template = HorizontalTemplate( new_figure( dpi=module.dpi ) )
+            self.template.directory = self.directory
+        extra = ( module.plot_mat , ) if self.kind == 'real' else ( )
+        if self.product == 'horizontal_3d' :
+            module.plot_frame( ncfile , plot_time , module.niveles , self.template , *extra , timeidx=timeidx )
+        else :
+            module.plot_frame( ncfile , plot_time , self.template , *extra , timeidx=timeidx )
+        for name in self.state :
+            self.state[ name ] = getattr( module , name )
+
+    def finish( self , run ) :
+        """Termina el trabajo: el meteograma se hace al final con todos los tiempos de la corrida."""
+        if self.product == 'meteogram' :
+            self._plot_meteogram( run )
+        if self.template is not None :
+            self.template.close()
+            self.template = None
+
+    def _plot_meteogram( self , run ) :
+        from point_series import station_points
+        from station_store import StationStore
+
+        self._configure()
+        module = self.module
+        ncfile = run.dataset( 0 )
+        points , weights = station_points( ncfile , [ module.point_lat ] , [ module.point_lon ] )
+        store = StationStore( self.path( module.store_directory( module.point_lon , module.point_lat ) ) , points , ( 'T2C' , 'td2' ) )
+        store.update( run.file_list , module.prefetch )
+        time , series = store.series( run.file_list , 0 )
+        time = ( time - time[0] ) / np.timedelta64(1,'h')
+
+        template = MeteogramTemplate( new_figure( figsize=(9,4) ) )
+        template.directory = self.directory
+        module.plot_location( template , cached_getvar( ncfile , "ter" ) , module.point_lon , module.point_lat , module.plot_mat )
+        module.plot_series( template , time , series[ : , 0 ] , series[ : , 1 ] ,
+                            module.meteogram_filename( module.point_lon , module.point_lat ) )
+        template.close()
+
+
+def get_job( ijob , job ) :
+    """Trabajo ijob de este proceso (se crea la primera vez que se usa)."""
+    if ijob not in _worker :
+        _worker[ ijob ] = PlotJob( job )
+    return _worker[ ijob ]
+
+
+def plot_file( task ) :
+    """Grafica todos los trabajos de un tiempo abriendo el wrfout una sola vez.
+
+    Se arma un grafo con los campos derivados que usan los trabajos y las figuras que
+    dependen de ellos: cada campo se calcula una sola vez (dentro de memoize las figuras
+    lo toman de memoria) en uno de nthreads threads y se libera cuando termina la ultima
+    figura que lo usa. Las figuras se hacen de a una en este thread.
+    """
+    filename , timeidx , plot_time , jobs , nthreads = task
+    with open_wrfout( filename ) as ncfile , memoize() :
+        graph = TaskGraph()
+        for ijob , job in jobs :
+            plot_job = get_job( ijob , job )
+            deps = list()
+            for varname , kwargs in plot_job.fields() :
+                #Las figuras piden sus campos con el timeidx de este tiempo (es parte de la clave de memoize).
+                kwargs = dict( kwargs , timeidx=timeidx )
+                name = varname + repr( sorted( kwargs.items() ) )
+                if name not in graph :
+                    graph.add( name , partial( cached_getvar , ncfile , varname , **kwargs ) ,
+                               release=partial( _release_field , ncfile , varname , kwargs ) , lock=_netcdf_lock )
+                deps.append( name )
+            graph.add( 'trabajo ' + str( ijob ) , partial( _plot_job , plot_job , ncfile , plot_time , timeidx ) , deps , inline=True )
+        graph.run( nthreads )
+    return filename + ' (' + str( len( jobs ) ) + ' trabajos)'
+
+
+def _plot_job( plot_job , ncfile , plot_time , timeidx , *fields ) :
+    """Tarea del grafo: los campos ya estan en memoria, la figura los toma con cached_getvar."""
+    plot_job.plot( ncfile , plot_time , timeidx )
+
+
+def _release_field( ncfile , varname , kwargs , value ) :
+    forget( ncfile , varname , **kwargs )
+
+
+def group_jobs( jobs , nthreads=nthreads ) :
+    """Agrupa los trabajos por corrida y por tiempo.
+
+    Devuelve un diccionario { (run, domain) : ( WrfRun , [ ( filename , timeidx , plot_time , [ ( ijob , job ) , ... ] , nthreads ) , ... ] ) },
+    con timeidx el tiempo dentro del archivo (los wrfout pueden tener mas de un tiempo).
+    """
+    groups = dict()
+    for ijob , job in enumerate( jobs ) :
+        key = ( job.get( 'run' , '.' ) , job.get( 'domain' , 'd01' ) )
+        if key not in groups :
+            path = key[0] if job.get( 'directory' ) is None else os.path.normpath( os.path.join( job['directory'] , key[0] ) )
+            groups[ key ] = ( WrfRun( path , key[1] ) , dict() )
+        run , times = groups[ key ]
+        if job['product'] == 'meteogram' :
+            continue
+        plot_times = job_times( job , run.ntimes )
+        if job['product'] == 'vertical' and job.get( 'cross_levels' ) is None and len( plot_times ) > 0 :
+            job = dict( job , cross_levels=cross_levels( job , run , plot_times[0] ) )
+        for plot_time in plot_times :
+            times.setdefault( plot_time , list() ).append( ( ijob , job ) )
+    return { key : ( run , [ run.source( plot_time ) + ( plot_time , times[ plot_time ] , nthreads ) for plot_time in sorted( times ) ] )
+             for key , ( run , times ) in groups.items() }
+
+
+def cross_levels( job , run , plot_time ) :
+    """Alturas del corte de un trabajo vertical, elegidas con la z del tiempo plot_time.
+
+    Se calculan en el proceso principal y van en el trabajo, asi todos los procesos usan las
+    mismas (si no cada uno las elegiria con el primer tiempo que le toca).
+    """
+    plot_job = PlotJob( job )
+    with plot_job._lock :
+        plot_job._configure()
+        ncfile , timeidx = run.time_dataset( plot_time )
+        return plot_job.module.first_levels( ncfile , timeidx )
+
+
+def run_jobs( config , directory=None ) :
+    """Grafica todos los trabajos de config (como lo devuelve load_jobs).
+
+    Con directory las rutas relativas (corridas, figuras, series y mapas.mat) se toman desde
+    esa carpeta y no desde la actual (el servidor grafica en la carpeta del cliente sin cambiar la suya).
+    """
+    jobs = config['jobs']
+    if directory is not None :
+        jobs = [ dict( job , directory=directory ) for job in jobs ]
+    for ( path , domain ) , ( run , tasks ) in group_jobs( jobs , config.get( 'nthreads' , nthreads ) ).items() :
+        print( 'Corrida ' + path + ' (' + domain + '): ' + str( len( tasks ) ) + ' tiempos' )
+        run_parallel( plot_file , tasks , config.get( 'nworkers' , nworkers ) )
+
+        #Los meteogramas (y el cierre de las figuras de los trabajos de este proceso).
+        for ijob , job in enumerate( jobs ) :
+            if ( job.get( 'run' , '.' ) , job.get( 'domain' , 'd01' ) ) == ( path , domain ) :
+                get_job( ijob , job ).finish( run )
+        run.close()
+
+
+def reset_jobs() :
+    """Olvida los trabajos de este proceso (y cierra sus figuras) para empezar otro archivo de trabajos."""
+    for plot_job in _worker.values() :
+        if plot_job.template is not None :
+            plot_job.template.close()
+    _worker.clear()
+
+
+def server_key( create=False ) :
+    """Clave del servidor: WRF_PLOTS_KEY o la guardada en SERVER_KEY_FILE (con create se genera si no existe).
+
+    El archivo tiene que ser del usuario y no poder leerlo nadie mas (permisos 0600).
+    """
+    key = os.environ.get( 'WRF_PLOTS_KEY' )
+    if key :
+        return key.encode()
+    if create and not os.path.exists( SERVER_KEY_FILE ) :
+        os.makedirs( os.path.dirname( SERVER_KEY_FILE ) , exist_ok=True )
+        try :
+            fd = os.open( SERVER_KEY_FILE , os.O_WRONLY | os.O_CREAT | os.O_EXCL , 0o600 )
+        except FileExistsError :
+            pass
+        else :
+            with os.fdopen( fd , 'w' ) as my_file :
+                my_file.write( secrets.token_hex( 32 ) )
+    if not os.path.exists( SERVER_KEY_FILE ) :
+        raise FileNotFoundError( 'No hay clave del servidor en ' + SERVER_KEY_FILE + ' (arrancar antes el servidor con --serve o definir WRF_PLOTS_KEY)' )
+    stat = os.stat( SERVER_KEY_FILE )
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o077 :
+        raise PermissionError( SERVER_KEY_FILE + ' tiene que ser del usuario y solo legible por el (chmod 600), o definir WRF_PLOTS_KEY' )
+    with open( SERVER_KEY_FILE ) as my_file :
+        return my_file.read().strip().encode()
+
+
+def serve( address=SERVER_ADDRESS , authkey=None ) :
+    """Servidor de trabajos: importa una sola vez wrf, matplotlib y los scripts y grafica los pedidos que le llegan.
+
+    Cada pedido es { 'command' : 'run' , 'config' : ... , 'cwd' : ... } (los trabajos se grafican
+    en la carpeta cwd del cliente) o { 'command' : 'stop' }. Los pedidos se atienden de a uno y la
+    respuesta tiene ok, lo que imprimieron los trabajos (log) y cuanto tardaron (seconds). Una conexion
+    que falla (clave incorrecta, cliente que se corta, pedido invalido) no termina el servidor.
+    """
+    from multiprocessing import AuthenticationError
+    from multiprocessing.connection import Listener
+    authkey = server_key( create=True ) if authkey is None else authkey
+    start = time.perf_counter()
+    for module in SERVER_PRELOAD :
+        importlib.import_module( module )
+    for scripts in PRODUCTS.values() :
+        for module in scripts.values() :
+            importlib.import_module( module )
+    get_pyplot( headless=True )
+    print( 'Modulos importados en %.2f s, esperando trabajos en %s:%d' % ( time.perf_counter() - start , *address ) )
+    with Listener( address , authkey=authkey ) as listener :
+        while True :
+            try :
+                conn = listener.accept()
+            except ( AuthenticationError , EOFError , OSError ) as error :
+                print( 'Conexion rechazada: ' + repr( error ) )
+                continue
+            with conn :
+                try :
+                    request = conn.recv()
+                except ( EOFError , OSError ) as error :
+                    print( 'El cliente se desconecto: ' + repr( error ) )
+                    continue
+                except Exception :
+                    request = None
+                stop = isinstance( request , dict ) and request.get( 'command' ) == 'stop'
+                if stop :
+                    response = { 'ok' : True , 'log' : 'Servidor terminado\n' , 'seconds' : 0.0 }
+                else :
+                    response = _serve_request( request )
+                try :
+                    conn.send( response )
+                except ( EOFError , OSError ) as error :
+                    print( 'No se pudo mandar la respuesta: ' + repr( error ) )
+            if stop :
+                break
+
+
+def _check_request( request ) :
+    """Carpeta del cliente de un pedido 'run' (ValueError si el pedido no es valido)."""
+    if not isinstance( request , dict ) or request.get( 'command' ) != 'run' :
+        raise ValueError( 'Pedido invalido: tiene que ser { "command" : "run" , "config" : ... , "cwd" : ... } o "stop"' )
+    cwd = request.get( 'cwd' )
+    if not isinstance( cwd , str ) or not os.path.isabs( cwd ) or not os.path.isdir( cwd ) :
+        raise ValueError( 'Pedido invalido: cwd tiene que ser una carpeta (ruta absoluta), no ' + repr( cwd ) )
+    if not isinstance( request.get( 'config' ) , dict ) or not isinstance( request['config'].get( 'jobs' ) , list ) :
+        raise ValueError( 'Pedido invalido: config tiene que tener la lista de trabajos (jobs)' )
+    return cwd
+
+
+def _serve_request( request ) :
+    """Grafica los trabajos de un pedido en la carpeta del cliente (sin cambiar la del servidor) y arma la respuesta."""
+    log = io.StringIO()
+    start = time.perf_counter()
+    cwd = None
+    try :
+        cwd = _check_request( request )
+        with redirect_stdout( log ) :
+            run_jobs( request['config'] , directory=cwd )
+        ok = True
+    except Exception :
+        log.write( traceback.format_exc() )
+        ok = False
+    finally :
+        reset_jobs()
+    print( 'Pedido de ' + str( cwd ) + ( ' terminado' if ok else ' con errores' ) +
+           ' en %.2f s' % ( time.perf_counter() - start ) )
+    return { 'ok' : ok , 'log' : log.getvalue() , 'seconds' : time.perf_counter() - start }
+
+
+def submit( config , command='run' , address=SERVER_ADDRESS , authkey=None ) :
+    """Manda un pedido al servidor (ver serve) y devuelve su respuesta."""
+    from multiprocessing.connection import Client
+    authkey = server_key() if authkey is None else authkey
+    with Client( address , authkey=authkey ) as conn :
+        conn.send( { 'command' : command , 'config' : config , 'cwd' : os.getcwd() } )
+        return conn.recv()
+
+
+if __name__ == '__main__' :
+
+    args = sys.argv[1:]
+    if len( args ) > 0 and args[0] == '--imports' :
+       from profiling import import_report
+       scripts = [ module for products in PRODUCTS.values() for module in products.values() ]
+       import_report( [ 'plot_jobs' ] + scripts + list( SERVER_PRELOAD ) )
+    elif len( args ) > 0 and args[0] == '--serve' :
+       serve()
+    elif len( args ) > 0 and args[0] in ( '--submit' , '--stop' ) :
+       if args[0] == '--stop' :
+          response = submit( None , command='stop' )
+       else :
+          response = submit( load_jobs( args[1] if len( args ) > 1 else job_file ) )
+       sys.stdout.write( response['log'] )
+       if args[0] == '--submit' :
+          print( 'Graficado en el servidor en %.2f s' % response['seconds'] )
+       if not response['ok'] :
+          raise SystemExit( 1 )
+    else :
+       if len( args ) > 0 :
+          job_file = args[0]
+       run_jobs( load_jobs( job_file ) )
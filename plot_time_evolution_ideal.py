@@ -1,81 +1,109 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from netCDF4 import Dataset
-from wrf import (getvar, to_np, ll_to_xy , latlon_coords  )
-import glob
-import scipy.io as sio
+
+from batch_utils import get_pyplot
+from figure_templates import MeteogramTemplate
+from ensemble import extract_ensemble_points, ensemble_stats
+from wrf_run import WrfRun
 
 #Grafico un mapa de 2 paneles. Uno indicando donde esta el punto
 #otro mostrando la serie temporal de una variable en ese punto.
 
 path_exp = "/home/mn09/modelado2/WRFLAB/EXP/ideal_rio"
+#Experimentos a comparar (miembros de un ensamble o experimentos de sensibilidad). Con mas de uno se
+#grafica la serie de cada experimento y la media +- la dispersion del ensamble.
+experiments = [ path_exp ]
+nworkers   = None     #Procesos para leer las series de los experimentos en paralelo (None = todos los cores).
 figure_name= 'TimeEvolTyTd'
+batch      = False    #Si es True guarda la figura sin mostrarla en pantalla (para correr sin display).
+png_compress_level = 1 #Compresion del png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+
+
+def main() :
+    """Lee las series de todos los experimentos en el punto y grafica el meteograma."""
+    from wrf import getvar, to_np
+
+    #Indexo una sola vez todos los archivos wrfout* de la carpeta indicada (ordenados cronologicamente).
+    run = WrfRun(path_exp)
+    file_list = run.file_list
+    print(file_list)
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    # Abro el archivo netcdf correspondiente al tiempo indicado.
+    ncfile = run.dataset( 0 )
+
 
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob(f'{path_exp}/wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-print(file_list)
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
+    #Definimos el punto donde hacemos la serie
+    point_x = 21
+    point_y = 10
 
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ 0 ])
 
+    #Obtengo la topografia.
+    landmask = getvar(ncfile, "LANDMASK")   #Altura de la topografia
 
-#Definimos el punto donde hacemos la serie
-point_x = 21
-point_y = 10
+    nx = to_np(landmask).shape[1]
+    ny = to_np(landmask).shape[0]
 
+    print(f"{nx},{ny}")
 
-#Obtengo la topografia.
-landmask = getvar(ncfile, "LANDMASK")   #Altura de la topografia
+    #Leo la serie temporal de T2m y Td2m de todos los archivos de todos los experimentos (un proceso por
+    #experimento). De cada archivo se lee solo el punto que necesitamos (y no el campo completo).
+    #T2C es la temperatura a 2 metros en C y td2 la Td a 2 metros en C (misma formula que wrf-python).
+    run.close()
+    time , series = extract_ensemble_points( experiments , [ ( point_y , point_x ) ] , variables=( 'T2C' , 'td2' ) , nworkers=nworkers )
+    series = series[ : , : , 0 ]   #(experimento, tiempo, variable)
+    stats = ensemble_stats( series )
 
-nx = to_np(landmask).shape[1]
-ny = to_np(landmask).shape[0]
+    time = (time - time[0])/np.timedelta64(1,'h')  #Pongo el tiempo en horas desde el inicio de la simulacion.
 
-print(f"{nx},{ny}")
-#Hago un loop sobre los tiempos para leer todos los archivos y asi recontruir la serie temporal de T2m y Td2m
-t2m = np.zeros( ntimes ) #Genero las variables con 0s y luego vamos a ir leyendo y completando los valores para cada tiempo.
-td2m= np.zeros( ntimes )
-time= np.zeros( ntimes )
-for ifile , my_file in enumerate( file_list ) :
-    ncfile = Dataset(file_list[ ifile ])
-    t2m[ ifile ] = getvar(ncfile, 'T2' )[point_y,point_x]-273.16    #Temperatura a 2 metros (por defecto viene en K)
-    td2m[ ifile ]= getvar(ncfile, 'td2')[point_y,point_x]           #Td a 2 metros (el wrf-python la calcula en C)
-    time[ ifile ]= getvar(ncfile,'times')
 
-time = (time - time[0])/3600.0e9  #Pongo el tiempo en horas desde el inicio de la simulacion.
+    plt = get_pyplot( batch )
 
+    #Generamos la figura.
+    #Como vamos a hacer 2 paneles queremos un tamanio de figura que
+    #sea el doble de ancho respecto al largo.
+    #El panel de la ubicacion es fijo (se dibuja una sola vez), el de las series se redibuja
+    #cada vez que se guarda la figura (por ejemplo si se agregan tiempos a la serie).
+    template = MeteogramTemplate( plt.figure(figsize=(9,4)) )
+    ax1 , ax2 = template.ax1 , template.ax2
 
-#Generamos la figura.
-#Como vamos a hacer 2 paneles queremos un tamanio de figura que 
-#sea el doble de ancho respecto al largo.
-plt.figure(figsize=(9,4))
+    #Primer subplot con la ubicacion del corte.
+    cf = ax1.contourf(np.arange(nx),np.arange(ny),landmask,levels=[0,0.5,1,1.5],cmap='terrain',extend='max')
+    ax1.plot( point_x , point_y , 'o' )
+    template.fig.colorbar( cf , cax=template.cax1 )
+    #Agregamos las gridlines
+    ax1.grid()
+    #Ajustamos los limites de la figura al dominio del WRF
+    ax1.axis( [ 0 , nx-1 , 0 , ny-1 ] )
 
-#Primer subplot con la ubicacion del corte.
-plt.subplot(121)
-plt.contourf(np.arange(nx),np.arange(ny),landmask,levels=[0,0.5,1,1.5],cmap='terrain',extend='max')
-plt.plot( point_x , point_y , 'o' )
-plt.colorbar()
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ 0 , nx-1 , 0 , ny-1 ] )
 
+    ax1.set_title('Ubicacion del meteograma')
 
-plt.title('Ubicacion del meteograma')
+    #Segundo subplot con el corte vertical
+    template.clear()
+    #Grafico las series temporales de T y Td
+    if len( experiments ) == 1 :
+       ax2.plot( time , series[0,:,0] , 'ro-' ,label='T 2m')
+       ax2.plot( time , series[0,:,1] , 'bo-' ,label='Td 2m')
+    else :
+       #Cada experimento en linea fina y la media +- la dispersion del ensamble.
+       for ivar , ( color , name ) in enumerate( [ ( 'r' , 'T 2m' ) , ( 'b' , 'Td 2m' ) ] ) :
+           ax2.plot( time , series[ : , : , ivar ].T , color=color , linewidth=0.5 , alpha=0.5 )
+           ax2.fill_between( time , stats['mean'][:,ivar] - stats['spread'][:,ivar] , stats['mean'][:,ivar] + stats['spread'][:,ivar] , color=color , alpha=0.2 )
+           ax2.plot( time , stats['mean'][:,ivar] , color + 'o-' , label=name + ' (media)' )
+    ax2.legend()
+    # Agrego el titulo
+    ax2.set_title('Meteograma de T y Td (dBZ)')
 
-#Segundo subplot con el corte vertical
-plt.subplot(122)
-#Grafico las series temporales de T y Td
-plt.plot( time , t2m , 'ro-' ,label='T 2m')
-plt.plot( time , td2m, 'bo-' ,label='Td 2m')
-plt.legend()
-# Agrego el titulo
-plt.title('Meteograma de T y Td (dBZ)')
 
+    template.save( f'{path_exp}/{figure_name}_lon_{point_x}_lat_{point_y}.png' , compress_level=png_compress_level )
 
-plt.savefig( f'{path_exp}/{figure_name}_lon_{point_x}_lat_{point_y}.png' )
+    if not batch :
+       template.finalize()
+       plt.show()
 
-plt.show()
+    template.close()
 
 
+if __name__ == '__main__' :
+    #El guard hace falta porque extract_ensemble_points usa un pool de procesos.
+    main()
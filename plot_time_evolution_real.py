@@ -1,90 +1,127 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from netCDF4 import Dataset
-from wrf import (getvar, to_np, ll_to_xy , latlon_coords  )
-import glob
-import scipy.io as sio
+
+from batch_utils import get_pyplot
+from figure_templates import MeteogramTemplate
+from diag_cache import cached_getvar
+from point_series import station_points
+from station_store import StationStore
+from wrf_run import WrfRun
+from map_overlay import draw_map
 
 #Grafico un mapa de 2 paneles. Uno indicando donde esta el punto
 #otro mostrando la serie temporal de una variable en ese punto.
 
 figure_name= 'TimeEvolTyTd'
+batch      = False    #Si es True guarda la figura sin mostrarla en pantalla (para correr sin display).
 plot_mat   = True     #Si es True grafica el mapa, sino ponerlo en False
-
-#Busco en esta carpeta todos los archivos wrfout* y los ordeno cronologicamente. Guardo eso en una lista que se llama file_list.
-file_list = glob.glob('./wrfout_d01_*')   #Busco todos los wrfout en la carpeta indicada.
-file_list.sort()
-ntimes = len( file_list ) #Encuentro la cantidad de tiempos disponibles.
-
-# Abro el archivo netcdf correspondiente al tiempo indicado.
-ncfile = Dataset(file_list[ 0 ])
-
+map_file   = './mapas.mat'  #Archivo con los mapas (provincias y sudamerica).
+png_compress_level = 1 #Compresion del png (0 a 9). Con 1 se escribe mucho mas rapido que con la de savefig (6).
+prefetch   = 2        #Archivos que se leen por adelantado en un thread al agregar wrfout nuevos a la serie (0 = sin adelantar).
 
 #Definimos el punto donde hacemos la serie
 point_lon = -60.0
 point_lat = -35.0
 
-#Convierto el punto de latitud y longitud en x e y de la reticula del WRF.
-[point_x,point_y]=ll_to_xy(ncfile, point_lat, point_lon, meta=False)
-
-
-#Obtengo la topografia.
-ter = getvar(ncfile, "ter")   #Altura de la topografia
-
-#Hago un loop sobre los tiempos para leer todos los archivos y asi recontruir la serie temporal de T2m y Td2m
-t2m = np.zeros( ntimes ) #Genero las variables con 0s y luego vamos a ir leyendo y completando los valores para cada tiempo.
-td2m= np.zeros( ntimes )
-time= np.zeros( ntimes )
-for ifile , my_file in enumerate( file_list ) :
-    ncfile = Dataset(file_list[ ifile ])
-    t2m[ ifile ] = getvar(ncfile, 'T2' )[point_y,point_x]-273.16    #Temperatura a 2 metros (por defecto viene en K)
-    td2m[ ifile ]= getvar(ncfile, 'td2')[point_y,point_x]           #Td a 2 metros (el wrf-python la calcula en C)
-    time[ ifile ]= getvar(ncfile,'times')
-
-time = (time - time[0])/3600.0e9  #Pongo el tiempo en horas desde el inicio de la simulacion.
-
-# Obtenemos las matrices de latitud y longitud para los graficos.
-lats, lons = latlon_coords(ter)
-lats=to_np(lats)
-lons=to_np(lons)
-
-#Generamos la figura.
-#Como vamos a hacer 2 paneles queremos un tamanio de figura que 
-#sea el doble de ancho respecto al largo.
-plt.figure(figsize=(9,4))
-
-#Primer subplot con la ubicacion del corte.
-plt.subplot(121)
-plot_ter = to_np(ter)
-plot_ter[ plot_ter <= 1.0 ] = np.nan
-plt.contourf(lons,lats,plot_ter,levels=np.arange(-1000,5000,500),cmap='terrain',extend='max')
-plt.plot( point_lon , point_lat , 'o' )
-plt.colorbar()
-#Agrego el mapa (Solo si plot_mat es True)
-if plot_mat :
-   mapa = sio.loadmat('./mapas.mat')
-   plt.plot(mapa['provincias'][:,0],mapa['provincias'][:,1], color='k', lw=0.5, zorder=1)
-   plt.plot(mapa['samerica'][:,0],mapa['samerica'][:,1], color='k', lw=0.5, zorder=1)
-#Agregamos las gridlines
-plt.grid()
-#Ajustamos los limites de la figura al dominio del WRF
-plt.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
-
-
-plt.title('Ubicacion del meteograma')
-
-#Segundo subplot con el corte vertical
-plt.subplot(122)
-#Grafico las series temporales de T y Td
-plt.plot( time , t2m , 'ro-' ,label='T 2m')
-plt.plot( time , td2m, 'bo-' ,label='Td 2m')
-plt.legend()
-# Agrego el titulo
-plt.title('Meteograma de T y Td (dBZ)')
-
-
-plt.savefig( './' + figure_name + '_lon_' + str(point_lon) + '_lat_' + str(point_lat) + '.png' )
-
-plt.show()
 
+def meteogram_filename( point_lon , point_lat ) :
+    """Nombre del archivo del meteograma en el punto (point_lon, point_lat)."""
+    return './' + figure_name + '_lon_' + str(point_lon) + '_lat_' + str(point_lat) + '.png'
+
+
+def store_directory( point_lon , point_lat ) :
+    """Carpeta donde se guardan las series ya extraidas en el punto (ver station_store)."""
+    return './series_lon_' + str(point_lon) + '_lat_' + str(point_lat)
+
+
+def plot_location( template , ter , point_lon , point_lat , plot_mat=False ) :
+    """Primer panel (fijo) con la topografia y la ubicacion del punto."""
+    from wrf import to_np, latlon_coords
+    # Obtenemos las matrices de latitud y longitud para los graficos.
+    lats, lons = latlon_coords(ter)
+    lats=to_np(lats)
+    lons=to_np(lons)
+
+    ax1 = template.ax1
+    plot_ter = to_np(ter)
+    plot_ter[ plot_ter <= 1.0 ] = np.nan
+    cf = ax1.contourf(lons,lats,plot_ter,levels=np.arange(-1000,5000,500),cmap='terrain',extend='max')
+    ax1.plot( point_lon , point_lat , 'o' )
+    template.fig.colorbar( cf , cax=template.cax1 )
+    #Agrego el mapa (Solo si plot_mat es True)
+    if plot_mat :
+       draw_map( ax1 , lons , lats , map_file )
+    #Agregamos las gridlines
+    ax1.grid()
+    #Ajustamos los limites de la figura al dominio del WRF
+    ax1.axis( [ lons.min() , lons.max() , lats.min() , lats.max() ] )
+
+    ax1.set_title('Ubicacion del meteograma')
+
+
+def plot_series( template , time , t2m , td2m , filename ) :
+    """Segundo panel con las series de T y Td. Se redibuja cada vez que cambian las series."""
+    ax2 = template.ax2
+    template.clear()
+    #Grafico las series temporales de T y Td
+    ax2.plot( time , t2m , 'ro-' ,label='T 2m')
+    ax2.plot( time , td2m, 'bo-' ,label='Td 2m')
+    ax2.legend()
+    # Agrego el titulo
+    ax2.set_title('Meteograma de T y Td (dBZ)')
+
+    template.save( filename , compress_level=png_compress_level )
+
+
+if __name__ == '__main__' :
+
+    #Indexo una sola vez todos los archivos wrfout* de la carpeta indicada (ordenados cronologicamente).
+    run = WrfRun('.')
+    file_list = run.file_list
+    ntimes = run.ntimes #Encuentro la cantidad de tiempos disponibles.
+
+    # Abro el archivo netcdf correspondiente al tiempo indicado.
+    ncfile = run.dataset( 0 )
+
+    #Convierto el punto de latitud y longitud en el punto de reticula mas cercano del WRF.
+    #Se usa el indice de la reticula (grid_index), que se arma una sola vez por dominio y
+    #permite ubicar muchas estaciones a la vez (pasando listas de latitudes y longitudes).
+    points , weights = station_points( ncfile , [ point_lat ] , [ point_lon ] )
+    point_y , point_x = points[0]
+
+
+    #Obtengo la topografia.
+    ter = cached_getvar(ncfile, "ter")   #Altura de la topografia
+
+    #Leo la serie temporal de T2m y Td2m. Las series ya extraidas se guardan en un almacen en disco,
+    #asi que solo se leen los wrfout que todavia no estan o que cambiaron (y de cada uno solo el punto que necesitamos).
+    #T2C es la temperatura a 2 metros en C y td2 la Td a 2 metros en C (misma formula que wrf-python).
+    store = StationStore( store_directory( point_lon , point_lat ) , [ ( point_y , point_x ) ] , ( 'T2C' , 'td2' ) )
+    store.update( file_list , prefetch , verbose=batch )
+    run.close()
+    time , series = store.series( file_list , 0 )
+    t2m = series[ : , 0 ]
+    td2m= series[ : , 1 ]
+
+    time = (time - time[0])/np.timedelta64(1,'h')  #Pongo el tiempo en horas desde el inicio de la simulacion.
+
+    plt = get_pyplot( batch )
+
+    #Generamos la figura.
+    #Como vamos a hacer 2 paneles queremos un tamanio de figura que
+    #sea el doble de ancho respecto al largo.
+    #El panel de la ubicacion es fijo (se dibuja una sola vez), el de las series se redibuja
+    #cada vez que se guarda la figura (por ejemplo si se agregan tiempos a la serie).
+    template = MeteogramTemplate( plt.figure(figsize=(9,4)) )
+
+    #Primer subplot con la ubicacion del corte.
+    plot_location( template , ter , point_lon , point_lat , plot_mat )
+
+    #Segundo subplot con el corte vertical
+    plot_series( template , time , t2m , td2m , meteogram_filename( point_lon , point_lat ) )
+
+    if not batch :
+       template.finalize()
+       plt.show()
+
+    template.close()
 
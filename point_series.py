@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Extraccion de series temporales en puntos de reticula (meteogramas).
+En lugar de leer el campo 2D completo con getvar y quedarnos con un solo punto,
+leemos del netcdf solamente las celdas que necesitamos y calculamos las variables
+derivadas (por ejemplo td2) solo en esas celdas.
+"""
+
+import numpy as np
+
+from wrf_run import WrfRun
+
+
+def dewpoint( qv , pres ) :
+    """Temperatura de rocio (C) a partir de la humedad especifica (kg/kg) y la presion (hPa).
+
+    Es la misma formula que usa wrf-python para calcular td y td2.
+    """
+    qv = np.maximum( qv , 0.0 )
+    e = np.maximum( qv * pres / ( 0.622 + qv ) , 0.001 )   #Presion de vapor (hPa)
+    return ( 243.5 * np.log( e ) - 440.8 ) / ( 19.48 - np.log( e ) )
+
+
+#Variables derivadas que podemos calcular a partir de variables del wrfout en cada punto.
+#Para cada una indicamos las variables que hay que leer y la funcion que la calcula.
+DERIVED_VARS = {
+    'td2'    : ( ( 'Q2' , 'PSFC' ) , lambda q2 , psfc : dewpoint( q2 , psfc * 0.01 ) ) ,
+    'T2C'    : ( ( 'T2' , )        , lambda t2 : t2 - 273.16 ) ,
+    'wspd10' : ( ( 'U10' , 'V10' ) , lambda u10 , v10 : np.sqrt( u10**2 + v10**2 ) ) ,
+}
+
+
+def _raw_vars( variables ) :
+    """Lista (sin repetir) de las variables del wrfout que hay que leer para calcular variables."""
+    raw_vars = list()
+    for var in variables :
+        needed = DERIVED_VARS[ var ][0] if var in DERIVED_VARS else ( var , )
+        for raw_var in needed :
+            if raw_var not in raw_vars :
+                raw_vars.append( raw_var )
+    return raw_vars
+
+
+def station_points( ncfile , lats , lons , bilinear=False ) :
+    """Puntos de reticula de las estaciones con latitudes lats y longitudes lons (listas o arrays).
+
+    Usa el indice de la reticula (grid_index), asi que se pueden ubicar miles de estaciones
+    de una vez. Devuelve la lista de puntos [ (iy,ix) , ... ] para read_points y extract_points.
+    Con bilinear=True devuelve los 4 puntos que rodean a cada estacion y los pesos
+    (nstations,4) para pasarlos en weights; si no, el punto mas cercano y weights=None.
+    """
+    from grid_index import file_grid_index
+    index = file_grid_index( ncfile )
+    if bilinear :
+        iy , ix , weights , inside = index.bilinear( lats , lons )
+        return np.stack( [ iy.ravel() , ix.ravel() ] , axis=1 ) , weights
+    iy , ix = index.nearest( lats , lons )
+    return np.stack( [ iy , ix ] , axis=1 ) , None
+
+
+def read_points( ncfile , points , variables , weights=None ) :
+    """Lee las variables en los puntos de reticula points = [ (iy,ix) , ... ] de un wrfout abierto.
+
+    Devuelve un array de (ntimes_archivo , npoints , nvars). Si se pasan los pesos
+    weights (nstations,npesos) de station_points, los puntos se combinan de a npesos
+    y se devuelve (ntimes_archivo , nstations , nvars).
+    """
+    points = np.atleast_2d( np.asarray( points , dtype=int ) )
+    #Leemos un solo bloque por variable con las filas y columnas que contienen los puntos.
+    ys , iy = np.unique( points[:,0] , return_inverse=True )
+    xs , ix = np.unique( points[:,1] , return_inverse=True )
+    #Con muchas estaciones es mas rapido leer el rectangulo que las contiene de una vez.
+    box = ( ys[-1] - ys[0] + 1 ) * ( xs[-1] - xs[0] + 1 )
+    if len( ys ) * len( xs ) > 0.25 * box :
+        iy , ix = points[:,0] - ys[0] , points[:,1] - xs[0]
+        ys , xs = slice( ys[0] , ys[-1] + 1 ) , slice( xs[0] , xs[-1] + 1 )
+
+    raw = dict()
+    for raw_var in _raw_vars( variables ) :
+        block = np.asarray( ncfile.variables[ raw_var ][ : , ys , xs ] , dtype=float )
+        raw[ raw_var ] = block[ : , iy , ix ]
+
+    data = np.zeros( ( raw[ raw_var ].shape[0] , points.shape[0] , len( variables ) ) )
+    for ivar , var in enumerate( variables ) :
+        if var in DERIVED_VARS :
+            needed , func = DERIVED_VARS[ var ]
+            data[ : , : , ivar ] = func( *[ raw[ raw_var ] for raw_var in needed ] )
+        else :
+            data[ : , : , ivar ] = raw[ var ]
+    if weights is not None :
+        weights = np.asarray( weights , dtype=float )
+        data = data.reshape( data.shape[0] , weights.shape[0] , weights.shape[1] , len( variables ) )
+        data = np.sum( data * weights[ np.newaxis , : , : , np.newaxis ] , axis=2 )
+    return data
+
+
+def extract_points( run , points , variables=( 'T2C' , 'td2' ) , weights=None ) :
+    """Serie temporal de variables en los puntos de reticula points para toda la corrida.
+
+    run es un WrfRun (o una lista de wrfout). points es una lista de (iy,ix) (una por
+    estacion) y weights los pesos de la interpolacion si se uso station_points con
+    bilinear=True. Devuelve times (ntimes) y data (ntimes , nstations , nvars). Cada
+    archivo se abre una sola vez.
+    """
+    if not isinstance( run , WrfRun ) :
+        run = WrfRun( file_list=run )
+    data = list()
+    for ifile in range( len( run.file_list ) ) :
+        data.append( read_points( run.dataset( ifile ) , points , variables , weights ) )
+    return run.times , np.concatenate( data )
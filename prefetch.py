@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Lectura adelantada de los tiempos siguientes mientras se grafica el actual.
+En los loops secuenciales (un tiempo tras otro, o un wrfout tras otro en el meteograma)
+leer el archivo N+1 espera a que el N este calculado y graficado, y en un disco de red
+la lectura tarda tanto como el calculo. Prefetcher lee (y calcula, si el lector lo hace)
+los depth tiempos siguientes en un thread mientras el proceso principal grafica, y los
+entrega en orden.
+
+La cola esta acotada (backpressure): el thread lector reserva el lugar en la cola antes
+de leer, asi que entre la cola y la lectura en curso nunca hay mas de depth resultados
+(ni, si se pide, mas de max_mb MB) y la memoria no depende del largo de la corrida. Hay un solo thread lector porque la libreria de netcdf no siempre se puede
+usar desde varios threads a la vez; el proceso principal no tiene que tocar los wrfout
+mientras tanto (solo grafica lo que le entrega el lector). Para leer en paralelo hay que
+usar procesos (nworkers, ver parallel_utils).
+
+Las etapas del lector (lectura, getvar, interpolacion, ...) se registran en el thread
+lector (ver profiling); con label cada lectura queda en el frame de su tiempo, igual que
+el graficado que la usa.
+
+Las estadisticas de la cola (PrefetchStats) sirven para elegir depth: si el proceso
+principal espera mucho (wait) con la cola vacia, el cuello de botella es la lectura y
+mas depth solo suaviza los picos; si el lector pasa mucho tiempo bloqueado (blocked)
+con la cola llena, depth se puede bajar sin perder nada.
+"""
+
+import time
+import threading
+from collections import deque
+
+import numpy as np
+
+from profiling import stage, frame
+
+PREFETCH_DEPTH = 2    #Resultados que se leen por adelantado por defecto.
+
+
+def nbytes( item ) :
+    """Memoria (bytes) de los arrays de item (array, lista, tupla o diccionario de arrays)."""
+    if isinstance( item , np.ndarray ) :
+        return item.nbytes
+    if isinstance( item , dict ) :
+        return sum( nbytes( value ) for value in item.values() )
+    if isinstance( item , ( list , tuple ) ) :
+        return sum( nbytes( value ) for value in item )
+    return getattr( item , 'nbytes' , 0 )
+
+
+class PrefetchStats :
+    """Estadisticas de la cola de un Prefetcher.
+
+    read_s     tiempo del lector leyendo (y calculando) los resultados.
+    blocked_s  tiempo del lector esperando lugar en la cola (cola llena).
+    wait_s     tiempo del proceso principal esperando un resultado (cola vacia).
+    busy_s     tiempo del proceso principal entre un resultado y el pedido del siguiente.
+    queued     cantidad de resultados en la cola cada vez que se pide uno.
+    """
+
+    def __init__( self , name , depth , max_mb=None ) :
+        self.name = name
+        self.depth = depth
+        self.max_mb = max_mb
+        self.items = 0
+        self.read_s = 0.0
+        self.read_max_s = 0.0
+        self.blocked_s = 0.0
+        self.wait_s = 0.0
+        self.busy_s = 0.0
+        self.queued = list()
+        self.peak_mb = 0.0
+
+    def as_dict( self ) :
+        queued = np.array( self.queued if len( self.queued ) > 0 else [ 0 ] )
+        return { 'name' : self.name , 'depth' : self.depth , 'max_mb' : self.max_mb , 'items' : self.items ,
+                 'read_s' : self.read_s , 'read_max_s' : self.read_max_s , 'blocked_s' : self.blocked_s ,
+                 'wait_s' : self.wait_s , 'busy_s' : self.busy_s , 'queued_mean' : float( queued.mean() ) ,
+                 'queued_max' : int( queued.max() ) , 'empty' : float( np.mean( queued == 0 ) ) , 'peak_mb' : self.peak_mb }
+
+    def summary( self ) :
+        """Resumen de una linea por etapa."""
+        stats = self.as_dict()
+        nitems = max( self.items , 1 )
+        return '\n'.join( [
+            'Prefetch %s (depth=%d, %d resultados):' % ( self.name , self.depth , self.items ) ,
+            '    lectura   %8.2f s  (%.3f s por resultado, max %.3f s), bloqueada por cola llena %8.2f s' % (
+                self.read_s , self.read_s / nitems , self.read_max_s , self.blocked_s ) ,
+            '    grafico   %8.2f s  (%.3f s por resultado), esperando resultados %8.2f s' % (
+                self.busy_s , self.busy_s / nitems , self.wait_s ) ,
+            '    cola      media %.2f, max %d, vacia en el %.0f%% de los pedidos, pico %.1f MB' % (
+                stats['queued_mean'] , stats['queued_max'] , 100 * stats['empty'] , self.peak_mb ) ] )
+
+
+class Prefetcher :
+    """Iterable con reader( task ) para cada task de tasks, en orden, leidos por adelantado en un thread.
+
+    Como mucho hay depth resultados leidos por adelantado, contando el que se esta leyendo
+    (ademas del que esta usando el proceso principal). Si max_mb no es None, el siguiente
+    se empieza a leer solo si la cola mas un resultado del tamanio del anterior entran en
+    max_mb MB, salvo que la cola este vacia. Con depth = 0 no se usa el thread: cada
+    resultado se lee recien cuando se pide, como en un loop comun. Los errores del lector
+    se levantan en el proceso principal al pedir el resultado que fallo. Al terminar (o al
+    cortar el loop) stats tiene las estadisticas de la cola y si verbose es True se imprimen.
+    Si label no es None, label( task ) es el frame (ver profiling.frame) al que se atribuye
+    la lectura de task (por ejemplo el plot_time).
+    """
+
+    def __init__( self , reader , tasks , depth=PREFETCH_DEPTH , max_mb=None , name='prefetch' , verbose=False , label=None ) :
+        self.reader = reader
+        self.label = label
+        self.tasks = list( tasks )
+        self.depth = max( int( depth ) , 0 )
+        self.max_mb = max_mb
+        self.name = name
+        self.verbose = verbose
+        self.stats = PrefetchStats( name , self.depth , max_mb )
+
+    def _read( self , task ) :
+        start = time.perf_counter()
+        if self.label is None :
+            context = stage( 'prefetch_read' , queue=self.name )
+        else :
+            context = frame( self.label( task ) , 'prefetch_read' , queue=self.name )
+        with context :
+            item = self.reader( task )
+        elapsed = time.perf_counter() - start
+        self.stats.read_s += elapsed
+        self.stats.read_max_s = max( self.stats.read_max_s , elapsed )
+        return item
+
+    def __iter__( self ) :
+        if self.depth == 0 :
+            generator = self._sequential()
+        else :
+            generator = self._threaded()
+        try :
+            yield from generator
+        finally :
+            generator.close()
+            if self.verbose :
+                print( self.stats.summary() )
+
+    def _sequential( self ) :
+        for task in self.tasks :
+            self.stats.queued.append( 0 )
+            item = self._read( task )
+            self.stats.items += 1
+            start = time.perf_counter()
+            yield item
+            self.stats.busy_s += time.perf_counter() - start
+
+    def _fits( self , queue , size ) :
+        """True si un resultado de size bytes entra en la cola."""
+        if len( queue ) >= self.depth :
+            return False
+        if self.max_mb is None or len( queue ) == 0 :
+            return True
+        return sum( item_size for item , item_size , error in queue ) + size <= self.max_mb * 1024**2
+
+    def _threaded( self ) :
+        queue = deque()
+        condition = threading.Condition()
+        stop = threading.Event()
+
+        def produce() :
+            size = 0   #Tamanio del ultimo resultado, para estimar el del siguiente antes de leerlo.
+            for task in self.tasks :
+                start = time.perf_counter()
+                with condition :
+                    #Backpressure: antes de leer se espera a que haya lugar en la cola para el resultado.
+                    while not stop.is_set() and not self._fits( queue , size ) :
+                        condition.wait()
+                    if stop.is_set() :
+                        return
+                self.stats.blocked_s += time.perf_counter() - start
+                error = None
+                try :
+                    item = self._read( task )
+                except BaseException as exception :
+                    item , error = None , exception
+                size = nbytes( item )
+                with condition :
+                    if stop.is_set() :
+                        return
+                    queue.append( ( item , size , error ) )
+                    self.stats.peak_mb = max( self.stats.peak_mb , sum( entry[1] for entry in queue ) / 1024**2 )
+                    condition.notify_all()
+                del item
+                if error is not None :
+                    return
+
+        thread = threading.Thread( target=produce , name='prefetch-' + self.name , daemon=True )
+        thread.start()
+        try :
+            for itask in range( len( self.tasks ) ) :
+                start = time.perf_counter()
+                with stage( 'prefetch_wait' , queue=self.name ) , condition :
+                    self.stats.queued.append( len( queue ) )
+                    while len( queue ) == 0 :
+                        condition.wait()
+                    item , size , error = queue.popleft()
+                    condition.notify_all()
+                self.stats.wait_s += time.perf_counter() - start
+                if error is not None :
+                    raise error
+                self.stats.items += 1
+                start = time.perf_counter()
+                yield item
+                del item
+                self.stats.busy_s += time.perf_counter() - start
+        finally :
+            #Si se corta el loop (o hubo un error) el lector termina sin leer lo que falta.
+            with condition :
+                stop.set()
+                queue.clear()
+                condition.notify_all()
+            thread.join()
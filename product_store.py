@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Almacen de productos ya calculados (niveles interpolados, cortes verticales, lineas de
+terreno, coordenadas) para separar el calculo del graficado: los scripts con mode='compute'
+leen los wrfout, calculan los productos y los guardan aca; con mode='plot' solo leen estos
+arrays chicos y grafican, asi que cambiar niveles de colores, cmap, barbas o titulos no
+obliga a volver a leer los wrfout ni a recalcular los diagnosticos.
+
+Es un archivo netCDF4 con una dimension time ilimitada (indexada con plot_time). Cada
+producto que cambia con el tiempo es una variable (time, ...) comprimida y dividida en
+bloques (chunks) de un tiempo y un campo 2D, asi que leer un nivel de un tiempo es leer
+un solo bloque. Los productos fijos (lats, lons, terreno, puntos del corte) se guardan una
+sola vez, sin la dimension time. Las series en estaciones tienen su propio almacen
+(station_store).
+"""
+
+import os
+
+import numpy as np
+from netCDF4 import Dataset
+
+TIME_DIM   = 'time'
+DATA_DTYPE = np.float32
+WRITTEN    = '_written'   #Sufijo de la variable que marca que tiempos de cada producto estan guardados.
+COMPLEVEL  = 1    #Compresion zlib (1 a 9). Con 1 se escribe rapido y los campos suaves igual comprimen bien.
+
+
+class ProductStore :
+    """Productos de un script guardados en filename.
+
+    mode es 'r' (solo lectura) o 'a' (crea el archivo si no existe y agrega productos).
+    """
+
+    def __init__( self , filename , mode='r' ) :
+        self.filename = filename
+        if mode == 'a' and not os.path.exists( filename ) :
+            self.ncfile = Dataset( filename , 'w' )
+            self.ncfile.createDimension( TIME_DIM , None )
+        else :
+            self.ncfile = Dataset( filename , mode )
+
+    def _variable( self , name , shape , dims , timed ) :
+        """Variable name (la crea si no existe), con dimensiones dims (por defecto name_0, name_1, ...)."""
+        if name in self.ncfile.variables :
+            return self.ncfile.variables[ name ]
+        if dims is None :
+            dims = tuple( name + '_' + str( idim ) for idim in range( len( shape ) ) )
+        for dim , size in zip( dims , shape ) :
+            if dim not in self.ncfile.dimensions :
+                self.ncfile.createDimension( dim , size )
+        #Bloques de un tiempo y un campo 2D (o un vector si el producto es 1D).
+        chunks = [ 1 ] * max( len( shape ) - 2 , 0 ) + list( shape[-2:] )
+        if timed :
+            dims = ( TIME_DIM , ) + tuple( dims )
+            chunks = [ 1 ] + chunks
+        return self.ncfile.createVariable( name , DATA_DTYPE , dims , zlib=True , complevel=COMPLEVEL ,
+                                           chunksizes=chunks if len( chunks ) > 0 else None , fill_value=np.nan )
+
+    def write( self , name , plot_time , array , dims=None ) :
+        """Guarda el producto name del tiempo plot_time."""
+        array = np.asarray( array , dtype=DATA_DTYPE )
+        self._variable( name , array.shape , dims , True )[ plot_time ] = array
+        #Marca de que el tiempo esta completo (los NaN no alcanzan: puede haber niveles bajo el terreno).
+        if name + WRITTEN not in self.ncfile.variables :
+            self.ncfile.createVariable( name + WRITTEN , 'i1' , ( TIME_DIM , ) , fill_value=0 )
+        self.ncfile.variables[ name + WRITTEN ][ plot_time ] = 1
+
+    def write_static( self , name , array , dims=None ) :
+        """Guarda un producto que no cambia con el tiempo (si ya estaba no se vuelve a escribir)."""
+        if name not in self.ncfile.variables :
+            array = np.asarray( array , dtype=DATA_DTYPE )
+            self._variable( name , array.shape , dims , False )[:] = array
+
+    def read( self , name , plot_time=None , index=() ) :
+        """Producto name del tiempo plot_time (o el fijo si plot_time es None), como array con NaN.
+
+        Con index (por ejemplo ( 0 , 2 ) o ( slice( None ) , 2 )) se lee solo esa parte del producto.
+        """
+        var = self.ncfile.variables[ name ]
+        if plot_time is not None :
+            index = ( plot_time , ) + tuple( index )
+        return np.ma.filled( var[ index ] , np.nan )
+
+    def has( self , name , plot_time=None ) :
+        """True si el producto name (del tiempo plot_time) ya esta guardado."""
+        if name not in self.ncfile.variables :
+            return False
+        if plot_time is None :
+            return True
+        return plot_time in self.times( name )
+
+    def times( self , name ) :
+        """plot_time de los tiempos que tienen guardado el producto name."""
+        written = np.ma.filled( self.ncfile.variables[ name + WRITTEN ][:] , 0 )
+        return [ int( plot_time ) for plot_time in np.nonzero( written == 1 )[0] ]
+
+    def set_attrs( self , **attrs ) :
+        """Guarda la configuracion con la que se calcularon los productos (atributos globales, como texto).
+
+        Si el archivo ya tiene productos calculados con otra configuracion (o sin registrarla)
+        lanza ValueError: agregarle tiempos mezclaria productos de distintos recortes, niveles
+        o variables.
+        """
+        attrs = { name : str( value ) for name , value in attrs.items() }
+        if len( self.ncfile.variables ) > 0 :
+            different = [ name for name , value in attrs.items() if self.get_attr( name ) != value ]
+            if len( different ) > 0 :
+                raise ValueError( self.filename + ' tiene productos calculados con otra configuracion (' +
+                                  ', '.join( name + '=' + str( self.get_attr( name ) ) + ' en lugar de ' + attrs[ name ]
+                                             for name in different ) + '), hay que borrarlo o usar otro products_file' )
+        self.ncfile.setncatts( attrs )
+
+    def get_attr( self , name , default=None ) :
+        return getattr( self.ncfile , name , default )
+
+    def sync( self ) :
+        self.ncfile.sync()
+
+    def close( self ) :
+        self.ncfile.close()
+
+    def __enter__( self ) :
+        return self
+
+    def __exit__( self , *args ) :
+        self.close()
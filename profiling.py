@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tiempos y memoria de cada etapa de los scripts (abrir el wrfout, getvar, interpolacion,
+cortes, dibujo y escritura de la imagen), por etapa y por frame.
+Las funciones comunes (wrf_run, diag_cache, vinterp, cross_section, tiled, figure_templates)
+marcan sus etapas con stage( nombre ) y cada plot_frame se marca como un frame. Mientras
+no se active el registro stage() no hace nada, asi que el costo es una llamada a funcion.
+
+Se activa con la variable de entorno WRF_PROFILE=prefijo (o llamando a enable()). Al
+terminar cada proceso se imprime una tabla con el resumen y se escriben prefijo.json
+(todas las etapas) y prefijo.trace.json (formato de Chrome trace, se abre en
+chrome://tracing o en https://ui.perfetto.dev). Los procesos del pool escriben
+prefijo.<pid>.json y prefijo.<pid>.trace.json. Con WRF_PROFILE_MEMORY=1 tambien se
+mide el pico de memoria de python de cada etapa (tracemalloc, que hace todo mas lento).
+El pico de tracemalloc es de todo el proceso, asi que solo se guarda para las etapas
+durante las que ningun otro thread (prefetch, task_graph) estaba registrando etapas.
+
+Para cada etapa se guarda el tiempo de reloj, el tiempo de CPU del thread, la memoria
+residente (RSS) al terminar, cuanto crecio el pico de RSS del proceso durante la etapa
+y, si se pide, el pico de tracemalloc.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+#Registro activo (None = desactivado).
+_recorder = None
+_NULL = nullcontext()
+
+
+def _maxrss_mb() :
+    """Pico de memoria residente del proceso (MB)."""
+    try :
+        import resource
+    except ImportError :
+        return None
+    maxrss = resource.getrusage( resource.RUSAGE_SELF ).ru_maxrss
+    #En linux ru_maxrss esta en KB y en macOS en bytes.
+    return maxrss / 1024**2 if sys.platform == 'darwin' else maxrss / 1024
+
+
+def _rss_mb() :
+    """Memoria residente actual del proceso (MB), o None si no se puede saber."""
+    try :
+        with open( '/proc/self/statm' ) as my_file :
+            return int( my_file.read().split()[1] ) * os.sysconf( 'SC_PAGE_SIZE' ) / 1024**2
+    except ( OSError , ValueError , IndexError , AttributeError ) :
+        return None
+
+
+class Recorder :
+    """Guarda las etapas (eventos) de este proceso.
+
+    Cada evento tiene nombre, frame, thread, inicio y duracion (s), tiempo propio (sin las
+    etapas de adentro), CPU, RSS y memoria de python, y los argumentos que se pasaron a stage.
+    """
+
+    def __init__( self , memory=False ) :
+        self.memory = memory
+        self.events = list()
+        self.t0 = time.perf_counter()
+        self._local = threading.local()
+        #Pilas de etapas abiertas de cada thread (para saber si hay otros midiendo memoria a la vez).
+        self._stacks = dict()
+        self._lock = threading.Lock()
+        if memory :
+            import tracemalloc
+            if not tracemalloc.is_tracing() :
+                tracemalloc.start()
+
+    def _stack( self ) :
+        if not hasattr( self._local , 'stack' ) :
+            self._local.stack = list()
+            self._local.frame = None
+            with self._lock :
+                self._stacks[ threading.get_ident() ] = self._local.stack
+        return self._local.stack
+
+    @contextmanager
+    def stage( self , name , args ) :
+        stack = self._stack()
+        entry = { 'children' : 0.0 , 'peak' : 0 }
+        if self.memory :
+            import tracemalloc
+            #Si otro thread tiene etapas abiertas, los picos de todas se mezclan (y reset_peak de
+            #uno borra el del otro): no se guardan.
+            with self._lock :
+                others = [ other for other in self._stacks.values() if other is not stack and len( other ) > 0 ]
+                if len( others ) > 0 :
+                    entry['shared'] = True
+                    for other in others + [ stack ] :
+                        for open_entry in other :
+                            open_entry['shared'] = True
+            current , peak = tracemalloc.get_traced_memory()
+            if len( stack ) > 0 :
+                stack[-1]['peak'] = max( stack[-1]['peak'] , peak )
+            tracemalloc.reset_peak()
+            entry['start_mem'] = current
+        stack.append( entry )
+        maxrss = _maxrss_mb()
+        cpu = time.thread_time()
+        start = time.perf_counter()
+        try :
+            yield
+        finally :
+            wall = time.perf_counter() - start
+            cpu = time.thread_time() - cpu
+            stack.pop()
+            event = { 'name' : name , 'frame' : self._local.frame , 'thread' : threading.get_ident() ,
+                      'start' : start - self.t0 , 'wall' : wall , 'self' : wall - entry['children'] , 'cpu' : cpu ,
+                      'rss_mb' : _rss_mb() , 'maxrss_mb' : _maxrss_mb() }
+            if maxrss is not None :
+                event['maxrss_delta_mb'] = event['maxrss_mb'] - maxrss
+            if self.memory :
+                import tracemalloc
+                current , peak = tracemalloc.get_traced_memory()
+                peak = max( peak , entry['peak'] )
+                with self._lock :
+                    shared = entry.get( 'shared' , False )
+                if not shared :
+                    event['py_peak_mb'] = ( peak - entry['start_mem'] ) / 1024**2
+                tracemalloc.reset_peak()
+                if len( stack ) > 0 :
+                    stack[-1]['peak'] = max( stack[-1]['peak'] , peak )
+            if len( args ) > 0 :
+                event['args'] = args
+            if len( stack ) > 0 :
+                stack[-1]['children'] += wall
+            self.events.append( event )
+
+    @contextmanager
+    def frame( self , label , name='frame' , args=None ) :
+        self._stack()
+        previous , self._local.frame = self._local.frame , label
+        try :
+            with self.stage( name , dict( args or dict() , frame=label ) ) :
+                yield
+        finally :
+            self._local.frame = previous
+
+    def summary( self ) :
+        """Totales por etapa: { nombre : { n , wall , self , cpu , maxrss_delta_mb , py_peak_mb , py_peak_n } }.
+
+        py_peak_n es la cantidad de etapas con pico de python medido (las que corrieron sin otros threads).
+        """
+        totals = dict()
+        for event in self.events :
+            total = totals.setdefault( event['name'] , { 'n' : 0 , 'wall' : 0.0 , 'self' : 0.0 , 'cpu' : 0.0 ,
+                                                         'maxrss_delta_mb' : 0.0 , 'py_peak_mb' : 0.0 , 'py_peak_n' : 0 } )
+            total['n'] += 1
+            for key in ( 'wall' , 'self' , 'cpu' , 'maxrss_delta_mb' ) :
+                total[ key ] += event.get( key , 0.0 ) or 0.0
+            if 'py_peak_mb' in event :
+                total['py_peak_mb'] = max( total['py_peak_mb'] , event['py_peak_mb'] )
+                total['py_peak_n'] += 1
+        return totals
+
+    def table( self ) :
+        """Tabla de texto con el resumen, ordenada por tiempo propio."""
+        totals = self.summary()
+        lines = [ '%-12s %6s %10s %10s %10s %12s %12s' % ( 'etapa' , 'n' , 'total (s)' , 'propio (s)' , 'cpu (s)' ,
+                                                            'pico RSS +MB' , 'pico py MB' ) ]
+        shared = 0
+        for name , total in sorted( totals.items() , key=lambda item : -item[1]['self'] ) :
+            py_peak = '-'
+            if self.memory and total['py_peak_n'] > 0 :
+                py_peak = '%.1f' % total['py_peak_mb']
+                if total['py_peak_n'] < total['n'] :
+                    py_peak += '*'
+            if self.memory :
+                shared += total['n'] - total['py_peak_n']
+            lines.append( '%-12s %6d %10.3f %10.3f %10.3f %12.1f %12s' % (
+                          name , total['n'] , total['wall'] , total['self'] , total['cpu'] , total['maxrss_delta_mb'] , py_peak ) )
+        if shared > 0 :
+            lines.append( 'pico py: sin medir en %d etapas que corrieron con otros threads (* = solo parte de las etapas)' % shared )
+        return '\n'.join( lines )
+
+    def frames( self ) :
+        """Tiempo propio de cada etapa en cada frame: { frame : { nombre : segundos } }."""
+        frames = dict()
+        for event in self.events :
+            if event['frame'] is not None :
+                stages = frames.setdefault( str( event['frame'] ) , dict() )
+                stages[ event['name'] ] = stages.get( event['name'] , 0.0 ) + event['self']
+        return frames
+
+    def write_json( self , filename ) :
+        with open( filename , 'w' ) as my_file :
+            json.dump( { 'pid' : os.getpid() , 'summary' : self.summary() , 'frames' : self.frames() ,
+                         'events' : self.events } , my_file , indent=1 , default=str )
+        return filename
+
+    def write_chrome_trace( self , filename ) :
+        """Escribe las etapas en el formato de eventos completos ('X') de Chrome trace (tiempos en microsegundos)."""
+        pid = os.getpid()
+        trace = list()
+        for event in self.events :
+            args = { key : event[ key ] for key in ( 'frame' , 'cpu' , 'rss_mb' , 'maxrss_delta_mb' , 'py_peak_mb' ) if key in event }
+            args.update( event.get( 'args' , dict() ) )
+            trace.append( { 'name' : event['name'] , 'cat' : 'stage' , 'ph' : 'X' , 'pid' : pid , 'tid' : event['thread'] ,
+                            'ts' : event['start'] * 1e6 , 'dur' : event['wall'] * 1e6 , 'args' : args } )
+        with open( filename , 'w' ) as my_file :
+            json.dump( { 'traceEvents' : trace , 'displayTimeUnit' : 'ms' } , my_file , default=str )
+        return filename
+
+
+def stage( name , **args ) :
+    """Bloque with que se registra como la etapa name (no hace nada si el registro esta desactivado)."""
+    if _recorder is None :
+        return _NULL
+    return _recorder.stage( name , args )
+
+
+def frame( label , name='frame' , **args ) :
+    """Bloque with que agrupa las etapas de un frame (por ejemplo un tiempo de plot_frame).
+
+    El bloque se registra como la etapa name; con otro nombre (por ejemplo la lectura adelantada
+    de un tiempo en el thread de prefetch) las etapas quedan en el frame sin contarlo dos veces.
+    """
+    if _recorder is None :
+        return _NULL
+    return _recorder.frame( label , name , args )
+
+
+def profile_frame( plot_frame ) :
+    """Decorador para las funciones plot_frame( ncfile , plot_time , ... ): cada llamada es un frame."""
+    @wraps( plot_frame )
+    def wrapper( ncfile , plot_time , *args , **kwargs ) :
+        if _recorder is None :
+            return plot_frame( ncfile , plot_time , *args , **kwargs )
+        with _recorder.frame( plot_time ) :
+            return plot_frame( ncfile , plot_time , *args , **kwargs )
+    return wrapper
+
+
+def enable( prefix=None , memory=False ) :
+    """Activa el registro en este proceso. Si se pasa prefix se escriben los resultados al terminar el proceso."""
+    global _recorder
+    _recorder = Recorder( memory )
+    if prefix is not None :
+        #Finalize (a diferencia de atexit) tambien se ejecuta al terminar los procesos del pool,
+        #y cada proceso creado con fork empieza su propio registro.
+        from multiprocessing import util , parent_process
+        filename = prefix if parent_process() is None else prefix + '.' + str( os.getpid() )
+        util.Finalize( _recorder , report , args=( _recorder , filename ) , exitpriority=10 )
+        util.register_after_fork( _recorder , lambda recorder : enable( prefix , memory ) )
+    return _recorder
+
+
+def disable() :
+    """Desactiva el registro y devuelve el que estaba activo."""
+    global _recorder
+    recorder , _recorder = _recorder , None
+    return recorder
+
+
+def get_recorder() :
+    return _recorder
+
+
+def report( recorder , prefix ) :
+    """Imprime la tabla y escribe prefix.json y prefix.trace.json."""
+    if len( recorder.events ) == 0 :
+        return
+    print( recorder.table() )
+    recorder.write_json( prefix + '.json' )
+    recorder.write_chrome_trace( prefix + '.trace.json' )
+    print( 'Etapas en ' + prefix + '.json y ' + prefix + '.trace.json' )
+
+
+def import_times( module ) :
+    """Tiempo de importar module en un interprete nuevo (python -X importtime), por paquete.
+
+    Devuelve el tiempo total (s) y una lista ( paquete , s ) de mayor a menor, donde cada
+    paquete cuenta lo que tardo en importarse con todo lo que importo a su vez (salvo lo
+    que es de otro paquete, que se cuenta aparte).
+    """
+    import subprocess
+    result = subprocess.run( [ sys.executable , '-X' , 'importtime' , '-c' , 'import ' + module ] ,
+                             capture_output=True , text=True )
+    if result.returncode != 0 :
+        raise ImportError( 'No se pudo importar ' + module + ':\n' + result.stderr.strip().splitlines()[-1] )
+    #Las lineas son "import time: propio | acumulado | nombre", con el nombre indentado segun la
+    #profundidad y cada modulo despues de los que importa.
+    pending = dict()
+    for line in result.stderr.splitlines() :
+        if not line.startswith( 'import time:' ) or 'cumulative' in line :
+            continue
+        own , cumulative , name = line[ len( 'import time:' ) : ].split( '|' )
+        depth = ( len( name ) - len( name.lstrip() ) - 1 ) // 2
+        node = ( name.strip() , int( cumulative ) * 1e-6 , pending.pop( depth + 1 , [] ) )
+        pending.setdefault( depth , list() ).append( node )
+    packages = dict()
+    def add( node , parent ) :
+        name , cumulative , children = node
+        package = name.split( '.' )[0]
+        if package != parent :
+            others = sum( child[1] for child in children if child[0].split( '.' )[0] != package )
+            packages[ package ] = packages.get( package , 0.0 ) + cumulative - others
+        for child in children :
+            add( child , package )
+    total = 0.0
+    for node in pending.get( 0 , [] ) :
+        if node[0] == module :
+            total = node[1]
+            add( node , None )
+    return total , sorted( packages.items() , key=lambda item : -item[1] )
+
+
+def import_report( modules , top=15 ) :
+    """Imprime lo que tarda en importarse cada modulo de modules y los top paquetes que mas tardan."""
+    results = dict()
+    for module in modules :
+        try :
+            total , packages = import_times( module )
+        except ImportError as error :
+            print( '%-45s %s' % ( module , error ) )
+            continue
+        results[ module ] = ( total , packages )
+        print( '%-45s %8.3f s' % ( module , total ) )
+        for package , seconds in packages[ :top ] :
+            if package != module :
+                print( '    %-41s %8.3f s' % ( package , seconds ) )
+    return results
+
+
+if os.environ.get( 'WRF_PROFILE' ) :
+    enable( os.environ['WRF_PROFILE'] , memory=os.environ.get( 'WRF_PROFILE_MEMORY' , '0' ) not in ( '' , '0' ) )
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Almacen de series temporales en estaciones (puntos de reticula) para los meteogramas.
+Los valores extraidos se agregan al final de un archivo binario que se lee con
+np.memmap, y en un json se guarda que wrfout ya se leyeron (ruta absoluta, fecha de
+modificacion y tamanio, como las claves de diag_cache). Al volver a correr con wrfout
+nuevos solo se leen los archivos nuevos o que cambiaron (una corrida rehecha en la misma
+carpeta, un wrfout al que el WRF le agrego tiempos), y graficar un meteograma es una sola
+lectura del memmap. Como un mismo almacen puede tener varias corridas, series devuelve
+solo las filas de los wrfout que se le piden.
+
+Archivos dentro de directory:
+    index.json   estaciones, variables, cantidad de filas y wrfout ya leidos.
+    times.i8     tiempos (datetime64[s] como enteros), uno por tiempo.
+    data.f4      valores (ntimes , nstations , nvars) en float32.
+"""
+
+import json
+import os
+
+import numpy as np
+from netCDF4 import Dataset
+
+from point_series import read_points
+from prefetch import Prefetcher
+from wrf_run import read_times
+
+DATA_DTYPE = np.float32
+
+
+def file_key( filename ) :
+    """Ruta absoluta y fecha de modificacion y tamanio del wrfout (cambian si se vuelve a escribir)."""
+    stat = os.stat( filename )
+    return os.path.abspath( filename ) , [ stat.st_mtime_ns , stat.st_size ]
+
+
+class StationStore :
+    """Series de variables en los puntos points = [ (iy,ix) , ... ] guardadas en directory.
+
+    Si directory ya tiene un almacen se abre (las estaciones y variables tienen que ser
+    las mismas); si no, se crea uno vacio.
+    """
+
+    def __init__( self , directory , points , variables=( 'T2C' , 'td2' ) ) :
+        self.directory = directory
+        self.points = [ [ int( iy ) , int( ix ) ] for iy , ix in points ]
+        self.variables = list( variables )
+        self._index_file = os.path.join( directory , 'index.json' )
+        self._times_file = os.path.join( directory , 'times.i8' )
+        self._data_file = os.path.join( directory , 'data.f4' )
+
+        if os.path.exists( self._index_file ) :
+            with open( self._index_file ) as my_file :
+                index = json.load( my_file )
+            if index['points'] != self.points or index['variables'] != self.variables :
+                raise ValueError( 'El almacen ' + directory + ' tiene otras estaciones o variables' )
+            self.ntimes = index['ntimes']
+            #Los almacenes viejos indexaban por el nombre del archivo; esos archivos se vuelven a leer.
+            self.files = { name : entry for name , entry in index['files'].items() if isinstance( entry , dict ) }
+        else :
+            os.makedirs( directory , exist_ok=True )
+            self.ntimes = 0
+            self.files = dict()
+            self._write_index()
+        #Si se corto una escritura anterior puede haber datos de mas al final (no figuran en el indice).
+        self._truncate()
+
+    @property
+    def shape( self ) :
+        return ( self.ntimes , len( self.points ) , len( self.variables ) )
+
+    def _write_index( self ) :
+        index = { 'points' : self.points , 'variables' : self.variables ,
+                  'ntimes' : self.ntimes , 'files' : self.files }
+        tmp_file = self._index_file + '.tmp'
+        with open( tmp_file , 'w' ) as my_file :
+            json.dump( index , my_file , indent=1 )
+        os.replace( tmp_file , self._index_file )
+
+    def _truncate( self ) :
+        record = len( self.points ) * len( self.variables ) * np.dtype( DATA_DTYPE ).itemsize
+        for filename , size in ( ( self._times_file , self.ntimes * 8 ) , ( self._data_file , self.ntimes * record ) ) :
+            with open( filename , 'ab' ) as my_file :
+                if my_file.tell() != size :
+                    my_file.truncate( size )
+
+    def ingested( self , filename ) :
+        """True si el wrfout ya se agrego al almacen y no cambio desde entonces."""
+        path , stat = file_key( filename )
+        return path in self.files and self.files[ path ]['stat'] == stat
+
+    def append( self , filename , ncfile=None ) :
+        """Agrega los tiempos de un wrfout (si no se habia agregado o si cambio). Devuelve la cantidad de tiempos leidos.
+
+        Si el archivo ya esta abierto se puede pasar en ncfile para no volver a abrirlo.
+        """
+        if self.ingested( filename ) :
+            return 0
+        stat = file_key( filename )[1]
+        times , data = self.read_file( filename , ncfile )
+        return self._write( filename , stat , times , data )
+
+    def read_file( self , filename , ncfile=None ) :
+        """Tiempos y valores en las estaciones de un wrfout (sin agregarlos al almacen)."""
+        if ncfile is None :
+            with Dataset( filename ) as ncfile :
+                return self.read_file( filename , ncfile )
+        times = read_times( ncfile ).astype('datetime64[s]').astype( np.int64 )
+        data = read_points( ncfile , self.points , self.variables ).astype( DATA_DTYPE )
+        return times , data
+
+    def _write( self , filename , stat , times , data ) :
+        """Agrega al final del almacen los tiempos y valores leidos de filename.
+
+        Si el archivo ya estaba (cambio desde que se leyo) sus filas viejas dejan de usarse;
+        si eran las ultimas del almacen (un wrfout que sigue creciendo) se reutiliza su lugar.
+        stat es la fecha y el tamanio (file_key) de antes de leerlo.
+        """
+        path = os.path.abspath( filename )
+        old = self.files.pop( path , None )
+        if old is not None and old['start'] + old['count'] == self.ntimes :
+            #Primero el indice sin esas filas y despues se recortan los datos.
+            self.ntimes = old['start']
+            self._write_index()
+            self._truncate()
+        #Primero se escriben los datos y despues el indice; si se corta antes, el indice no cambia.
+        with open( self._times_file , 'ab' ) as my_file :
+            times.tofile( my_file )
+        with open( self._data_file , 'ab' ) as my_file :
+            data.tofile( my_file )
+        self.files[ path ] = { 'stat' : stat , 'start' : self.ntimes , 'count' : len( times ) }
+        self.ntimes += len( times )
+        self._write_index()
+        return len( times )
+
+    def update( self , file_list , prefetch=0 , verbose=False ) :
+        """Agrega todos los wrfout de file_list que todavia no estan. Devuelve la cantidad de tiempos nuevos.
+
+        Con prefetch > 0 los prefetch archivos siguientes se leen en un thread mientras se
+        guarda el actual (ver prefetch.py); con verbose se imprimen las estadisticas de la cola.
+        """
+        new_files = list( dict.fromkeys( filename for filename in file_list if not self.ingested( filename ) ) )
+        #La fecha y el tamanio se toman antes de leer: si el archivo cambia mientras tanto se vuelve a leer la proxima vez.
+        stats = [ file_key( filename )[1] for filename in new_files ]
+        reads = Prefetcher( self.read_file , new_files , prefetch , name='series' , verbose=verbose )
+        return sum( self._write( filename , stat , times , data )
+                    for filename , stat , ( times , data ) in zip( new_files , stats , reads ) )
+
+    def read( self ) :
+        """Devuelve times (ntimes) y data (ntimes , nstations , nvars) de solo lectura, sin copiar los datos.
+
+        Son todas las filas del almacen, incluidas las de otras corridas y las de archivos que cambiaron.
+        """
+        if self.ntimes == 0 :
+            return np.zeros( 0 , dtype='datetime64[s]' ) , np.zeros( self.shape , dtype=DATA_DTYPE )
+        times = np.memmap( self._times_file , dtype=np.int64 , mode='r' , shape=( self.ntimes , ) )
+        data = np.memmap( self._data_file , dtype=DATA_DTYPE , mode='r' , shape=self.shape )
+        return times.view('datetime64[s]') , data
+
+    def rows( self , file_list ) :
+        """Filas del almacen con los tiempos de los wrfout de file_list, en ese orden."""
+        rows = list()
+        for filename in dict.fromkeys( file_list ) :
+            if not self.ingested( filename ) :
+                raise ValueError( 'El wrfout ' + filename + ' no esta en el almacen ' + self.directory + ' o cambio (falta update)' )
+            entry = self.files[ os.path.abspath( filename ) ]
+            rows.append( np.arange( entry['start'] , entry['start'] + entry['count'] ) )
+        return np.concatenate( rows ) if len( rows ) > 0 else np.zeros( 0 , dtype=int )
+
+    def series( self , file_list , istation=0 , variables=None ) :
+        """Tiempos y series (ntimes , nvars) de una estacion en los wrfout de file_list, para las variables pedidas (todas si es None).
+
+        Solo se devuelven los tiempos de esos archivos (la corrida que se grafica), aunque el
+        almacen tenga otras corridas del mismo punto.
+        """
+        times , data = self.read()
+        if variables is None :
+            variables = self.variables
+        ivars = [ self.variables.index( var ) for var in variables ]
+        rows = self.rows( file_list )
+        return times[ rows ] , data[ rows , istation ][ : , ivars ]
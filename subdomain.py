@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recorte y decimacion de un wrfout antes de calcular con wrf-python.
+open_subset lee del wrfout solo el rectangulo de la reticula que cubre una caja en
+lat/lon (y, si se pide, uno de cada stride puntos) y lo guarda en un netcdf en memoria
+con la misma estructura que el wrfout. Ese dataset se le pasa a getvar/cached_getvar
+como si fuera el archivo original, asi que la lectura, la memoria y las cuentas de
+height, uvmet, tk, etc. son proporcionales al area que se grafica.
+
+Las variables escalonadas (U, V, XLAT_U, ...) se recortan de forma que al pasarlas a
+los puntos de masa (como hace wrf-python) den el mismo valor que en el wrfout original,
+tambien cuando se usa stride.
+"""
+
+import os
+import itertools
+
+import numpy as np
+from netCDF4 import Dataset
+
+#Dimensiones horizontales de los wrfout (puntos de masa y escalonadas).
+Y_DIM , X_DIM = 'south_north' , 'west_east'
+Y_STAG , X_STAG = 'south_north_stag' , 'west_east_stag'
+
+#Variables que siempre se copian (coordenadas y campos que usa wrf-python para la metadata y la proyeccion).
+BASE_VARS = ( 'Times' , 'XTIME' , 'XLAT' , 'XLONG' , 'XLAT_U' , 'XLONG_U' , 'XLAT_V' , 'XLONG_V' ,
+              'HGT' , 'SINALPHA' , 'COSALPHA' , 'MAPFAC_M' , 'MAPFAC_U' , 'MAPFAC_V' , 'F' ,
+              'ZNU' , 'ZNW' , 'P_TOP' )
+
+#Variables del wrfout que necesita cada diagnostico de getvar que usan los scripts.
+GETVAR_INPUTS = {
+    'height'  : ( 'PH' , 'PHB' ) ,
+    'z'       : ( 'PH' , 'PHB' ) ,
+    'ter'     : ( ) ,
+    'uvmet'   : ( 'U' , 'V' ) ,
+    'uvmet10' : ( 'U10' , 'V10' ) ,
+    'tk'      : ( 'T' , 'P' , 'PB' ) ,
+    'tc'      : ( 'T' , 'P' , 'PB' ) ,
+    'td2'     : ( 'Q2' , 'PSFC' ) ,
+    'dbz'     : ( 'T' , 'P' , 'PB' , 'QVAPOR' , 'QRAIN' , 'QSNOW' , 'QGRAUP' ) ,
+    'wa'      : ( 'W' , ) ,
+}
+
+_counter = itertools.count()
+
+
+def subdomain_bounds( lats , lons , bbox , halo=1 ) :
+    """Primer y ultimo punto de masa (y0, y1, x0, x1) del rectangulo que cubre bbox = [lonmin, lonmax, latmin, latmax].
+
+    Se agregan halo puntos de cada lado para que los contornos lleguen hasta el borde de la caja.
+    """
+    ny , nx = lats.shape
+    if bbox is None :
+        return 0 , ny - 1 , 0 , nx - 1
+    lonmin , lonmax , latmin , latmax = bbox
+    inside = ( lons >= lonmin ) & ( lons <= lonmax ) & ( lats >= latmin ) & ( lats <= latmax )
+    if not inside.any() :
+        raise ValueError( 'La caja ' + str( bbox ) + ' no tiene puntos del dominio' )
+    ys = np.where( inside.any( axis=1 ) )[0]
+    xs = np.where( inside.any( axis=0 ) )[0]
+    return ( int( max( ys[0] - halo , 0 ) ) , int( min( ys[-1] + halo , ny - 1 ) ) ,
+             int( max( xs[0] - halo , 0 ) ) , int( min( xs[-1] + halo , nx - 1 ) ) )
+
+
+def _stagger_subset( data , axis , n , stride ) :
+    """Valores escalonados (n+1) para los n puntos de masa 0, stride, 2*stride, ... de data.
+
+    data tiene los valores escalonados desde el primer punto de masa. Con stride=1 es
+    un recorte; con stride>1 se eligen valores cuyo promedio entre vecinos es igual al
+    valor en el punto de masa del dataset original (lo que calcula destagger).
+    """
+    take = lambda index : np.take( data , index , axis=axis )
+    if stride == 1 :
+        return take( np.arange( n + 1 ) )
+    mass = stride * np.arange( n )
+    center = 0.5 * ( take( mass ) + take( mass + 1 ) )
+    values = [ take( [ 0 ] ).astype( float ) ]
+    for k in range( n ) :
+        values.append( 2.0 * np.take( center , [ k ] , axis=axis ) - values[-1] )
+    return np.concatenate( values , axis=axis )
+
+
+def _read_subset( var , bounds , stride ) :
+    """Lee una variable del wrfout recortada a bounds y decimada cada stride puntos."""
+    y0 , y1 , x0 , x1 = bounds
+    ny = ( y1 - y0 ) // stride + 1
+    nx = ( x1 - x0 ) // stride + 1
+    index = list()
+    for dim in var.dimensions :
+        if dim == Y_DIM :
+            index.append( slice( y0 , y0 + ( ny - 1 ) * stride + 1 , stride ) )
+        elif dim == X_DIM :
+            index.append( slice( x0 , x0 + ( nx - 1 ) * stride + 1 , stride ) )
+        elif dim == Y_STAG :
+            index.append( slice( y0 , y0 + ( ny - 1 ) * stride + 2 ) )
+        elif dim == X_STAG :
+            index.append( slice( x0 , x0 + ( nx - 1 ) * stride + 2 ) )
+        else :
+            index.append( slice( None ) )
+    data = var[ tuple( index ) ]
+    if isinstance( data , np.ma.MaskedArray ) :
+        data = data.filled()
+    for axis , dim in enumerate( var.dimensions ) :
+        if dim == Y_STAG :
+            data = _stagger_subset( data , axis , ny , stride )
+        elif dim == X_STAG :
+            data = _stagger_subset( data , axis , nx , stride )
+    return data
+
+
+def open_subset( ncfile , bbox=None , stride=1 , variables=None , halo=1 , bounds=None ) :
+    """Dataset en memoria con el wrfout ncfile recortado a bbox y decimado cada stride puntos.
+
+    bbox = [lonmin, lonmax, latmin, latmax] (None = todo el dominio). En lugar de bbox se
+    pueden pasar directamente los puntos de masa bounds = (y0, y1, x0, x1) del recorte.
+    variables es la lista de variables del wrfout que se copian, ademas de BASE_VARS
+    (None = todas). Se pueden usar los nombres de GETVAR_INPUTS ('height', 'uvmet', 'tk', ...)
+    para copiar lo que necesita cada diagnostico. Si no hay recorte ni decimacion devuelve
+    el mismo ncfile. El dataset devuelto se cierra con close_subset().
+    """
+    if bbox is None and bounds is None and stride == 1 :
+        return ncfile
+
+    ny_full = len( ncfile.dimensions[ Y_DIM ] )
+    nx_full = len( ncfile.dimensions[ X_DIM ] )
+    if bounds is None :
+        lats = np.asarray( ncfile.variables['XLAT'][0] )
+        lons = np.asarray( ncfile.variables['XLONG'][0] )
+        bounds = subdomain_bounds( lats , lons , bbox , halo )
+    bounds = tuple( int( bound ) for bound in bounds )
+    if bounds == ( 0 , ny_full - 1 , 0 , nx_full - 1 ) and stride == 1 :
+        return ncfile
+    y0 , y1 , x0 , x1 = bounds
+    ny = ( y1 - y0 ) // stride + 1
+    nx = ( x1 - x0 ) // stride + 1
+
+    if variables is None :
+        names = list( ncfile.variables )
+    else :
+        names = list()
+        for name in list( BASE_VARS ) + list( variables ) :
+            for var_name in GETVAR_INPUTS.get( name , ( name , ) ) :
+                if var_name in ncfile.variables and var_name not in names :
+                    names.append( var_name )
+
+    source = os.path.abspath( ncfile.filepath() )
+    subset = Dataset( 'subset_' + str( next( _counter ) ) + '.nc' , 'w' , diskless=True , persist=False )
+    attrs = { name : ncfile.getncattr( name ) for name in ncfile.ncattrs() }
+    attrs['WEST-EAST_GRID_DIMENSION'] = nx + 1
+    attrs['SOUTH-NORTH_GRID_DIMENSION'] = ny + 1
+    for name in ( 'DX' , 'DY' ) :
+        if name in attrs :
+            attrs[ name ] = attrs[ name ] * stride
+    #Con esto diag_cache distingue el subdominio del archivo completo.
+    attrs['SUBSET_SOURCE'] = source
+    attrs['SUBSET'] = repr( ( bounds , stride ) )
+    subset.setncatts( attrs )
+
+    sizes = { Y_DIM : ny , X_DIM : nx , Y_STAG : ny + 1 , X_STAG : nx + 1 }
+    for name , dim in ncfile.dimensions.items() :
+        size = None if dim.isunlimited() else sizes.get( name , len( dim ) )
+        subset.createDimension( name , size )
+
+    for name in names :
+        var = ncfile.variables[ name ]
+        var_attrs = { attr : var.getncattr( attr ) for attr in var.ncattrs() }
+        fill_value = var_attrs.pop( '_FillValue' , None )
+        new_var = subset.createVariable( name , var.datatype , var.dimensions , fill_value=fill_value )
+        new_var.setncatts( var_attrs )
+        new_var[:] = _read_subset( var , bounds , stride )
+    return subset
+
+
+def close_subset( subset , ncfile ) :
+    """Cierra el dataset de open_subset (si es el mismo ncfile no hace nada)."""
+    if subset is not ncfile :
+        subset.close()
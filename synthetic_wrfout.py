@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+wrfout sinteticos para medir los tiempos de los scripts sin tener una corrida del WRF.
+Los archivos tienen la misma estructura que un wrfout (dimensiones, variables escalonadas,
+atributos de la proyeccion Lambert) y las variables que usan los scripts: T2, Q2, PSFC,
+U10, V10, U, V, W, PH, PHB, P, PB, T, QVAPOR, los hidrometeoros de dbz, HGT, LANDMASK,
+XLAT, XLONG y Times. Los campos son una atmosfera estandar con una montania, un jet y
+celdas de precipitacion que se mueven con el tiempo, asi que los contornos, las barbas
+y los cortes tienen una complejidad parecida a la de una corrida real.
+
+Uso:  python synthetic_wrfout.py carpeta [ntimes nz ny nx]
+"""
+
+import os
+import sys
+
+import numpy as np
+from netCDF4 import Dataset
+
+EARTH_RADIUS = 6370000.0   #Radio de la tierra que usa el WRF (m).
+G = 9.81
+P0 = 100000.0
+P_TOP = 5000.0
+SCALE_HEIGHT = 8000.0      #Escala de altura de la presion de la atmosfera sintetica (m).
+
+#Proyeccion y dominio por defecto (centro de Argentina).
+CEN_LAT , CEN_LON = -32.0 , -63.0
+TRUELAT1 , TRUELAT2 = -30.0 , -60.0
+
+
+def lambert_latlon( x , y , cen_lat=CEN_LAT , cen_lon=CEN_LON , truelat1=TRUELAT1 , truelat2=TRUELAT2 ) :
+    """Latitud y longitud de los puntos (x, y) en metros desde el centro de una proyeccion Lambert conforme.
+
+    Devuelve tambien el factor de mapa y el angulo entre el norte de la reticula y el norte geografico.
+    """
+    phi1 , phi2 , phi0 = np.radians( truelat1 ) , np.radians( truelat2 ) , np.radians( cen_lat )
+    t = lambda phi : np.tan( np.pi / 4 + phi / 2 )
+    n = np.log( np.cos( phi1 ) / np.cos( phi2 ) ) / np.log( t( phi2 ) / t( phi1 ) )
+    f = np.cos( phi1 ) * t( phi1 )**n / n
+    rho0 = EARTH_RADIUS * f / t( phi0 )**n
+    rho = np.sign( n ) * np.hypot( x , rho0 - y )
+    theta = np.arctan2( np.sign( n ) * x , np.sign( n ) * ( rho0 - y ) )
+    lat = 2 * np.arctan( ( EARTH_RADIUS * f / rho )**( 1 / n ) ) - np.pi / 2
+    lon = np.radians( cen_lon ) + theta / n
+    mapfac = np.abs( n * rho / ( EARTH_RADIUS * np.cos( lat ) ) )
+    return np.degrees( lat ) , np.degrees( lon ) , mapfac , theta
+
+
+def _base_state( hgt , znu , znw ) :
+    """Presion (niveles de masa) y altura (niveles w) de la atmosfera sintetica sobre el terreno hgt."""
+    psfc = P0 * np.exp( -hgt / SCALE_HEIGHT )
+    mu = psfc - P_TOP
+    pb = P_TOP + znu[ : , None , None ] * mu
+    p_w = P_TOP + znw[ : , None , None ] * mu
+    z_w = -SCALE_HEIGHT * np.log( p_w / P0 )
+    return psfc , pb , z_w
+
+
+def _temperature( z ) :
+    """Temperatura (K) de la atmosfera estandar a la altura z (m)."""
+    return np.maximum( 288.15 - 0.0065 * z , 216.65 )
+
+
+def _cells( x , y , itime , ncells , rng , length ) :
+    """Campo (ny,nx) entre 0 y 1 con ncells celdas gaussianas que se trasladan con el tiempo."""
+    field = np.zeros( x.shape )
+    for icell in range( ncells ) :
+        x0 = ( rng.uniform( -0.5 , 0.5 ) + 0.02 * itime ) * np.ptp( x )
+        y0 = rng.uniform( -0.4 , 0.4 ) * np.ptp( y )
+        field += np.exp( -( ( x - x0 )**2 + ( y - y0 )**2 ) / ( 2 * length**2 ) )
+    return np.minimum( field , 1.0 )
+
+
+def write_wrfout( filename , itime , start , dt_minutes=60 , nz=40 , ny=100 , nx=120 , dx=4000.0 , seed=0 , ncells=8 ) :
+    """Escribe un wrfout sintetico de un tiempo (el tiempo itime de la corrida que empieza en start)."""
+    rng = np.random.default_rng( seed )
+    time = np.datetime64( start , 's' ) + np.timedelta64( itime * dt_minutes , 'm' )
+    time_str = str( time ).replace( 'T' , '_' )
+
+    #Reticula (puntos de masa y escalonados) en metros desde el centro del dominio.
+    xm = ( np.arange( nx ) - ( nx - 1 ) / 2 ) * dx
+    ym = ( np.arange( ny ) - ( ny - 1 ) / 2 ) * dx
+    xs = ( np.arange( nx + 1 ) - nx / 2 ) * dx
+    ys = ( np.arange( ny + 1 ) - ny / 2 ) * dx
+    x , y = np.meshgrid( xm , ym )
+    lat , lon , mapfac , alpha = lambert_latlon( x , y )
+    lat_u , lon_u , mapfac_u , _ = lambert_latlon( *np.meshgrid( xs , ym ) )
+    lat_v , lon_v , mapfac_v , _ = lambert_latlon( *np.meshgrid( xm , ys ) )
+
+    #Terreno: una cordillera al oeste y una llanura con el mar al este.
+    hgt = 4000.0 * np.exp( -( ( x + 0.3 * np.ptp( x ) ) / ( 0.05 * np.ptp( x ) + dx ) )**2 ) * ( 1 + 0.2 * np.sin( y / ( 20 * dx ) ) )
+    landmask = ( x < 0.35 * np.ptp( x ) ).astype( np.float32 )
+    hgt = hgt * landmask
+
+    znw = np.linspace( 1.0 , 0.0 , nz + 1 )**1.3
+    znu = 0.5 * ( znw[1:] + znw[:-1] )
+    psfc , pb , z_w = _base_state( hgt , znu , znw )
+    z_m = 0.5 * ( z_w[1:] + z_w[:-1] )
+
+    #Perturbaciones que cambian con el tiempo: ondas en la altura y celdas de precipitacion.
+    wave = np.sin( 2 * np.pi * ( x / ( 40 * dx ) - itime / 12 ) ) * np.cos( 2 * np.pi * y / ( 50 * dx ) )
+    ph = G * 20.0 * wave[ None ] * np.sin( np.pi * np.arange( nz + 1 ) / nz )[ : , None , None ]
+    cells = _cells( x , y , itime , ncells , rng , 6 * dx )
+    profile = np.exp( -( ( z_m - 5000.0 ) / 3000.0 )**2 )
+    tk = _temperature( z_m ) + 2.0 * wave[ None ] + 3.0 * cells[ None ] * profile
+    p = 200.0 * wave[ None ] * np.exp( -z_m / SCALE_HEIGHT )
+    theta = tk * ( P0 / ( pb + p ) )**0.2857 - 300.0
+    qvapor = 0.014 * np.exp( -z_m / 2500.0 ) * ( 0.6 + 0.4 * cells[ None ] )
+
+    jet = 30.0 * np.exp( -( ( z_m - 11000.0 ) / 3000.0 )**2 ) + 5.0
+    u = np.empty( ( nz , ny , nx + 1 ) )
+    u[ : , : , 1:-1 ] = 0.5 * ( jet[ : , : , 1: ] + jet[ : , : , :-1 ] )
+    u[ : , : , 0 ] , u[ : , : , -1 ] = jet[ : , : , 0 ] , jet[ : , : , -1 ]
+    u += 3.0 * rng.standard_normal( u.shape )
+    v = 5.0 * np.cos( 2 * np.pi * ( np.arange( ny + 1 ) / 30 - itime / 10 ) )[ None , : , None ] * np.ones( ( nz , 1 , nx ) )
+    w = np.zeros( ( nz + 1 , ny , nx ) )
+    w[ 1:-1 ] = 8.0 * cells[ None ] * np.sin( np.pi * np.arange( 1 , nz ) / nz )[ : , None , None ]
+
+    hydro = cells[ None ] * profile
+    warm = tk > 273.15
+    variables = {
+        'T'       : theta ,
+        'P'       : p ,
+        'PB'      : pb ,
+        'PH'      : ph ,
+        'PHB'     : G * z_w ,
+        'U'       : u ,
+        'V'       : v ,
+        'W'       : w ,
+        'QVAPOR'  : qvapor ,
+        'QCLOUD'  : 5e-4 * hydro ,
+        'QRAIN'   : 3e-3 * hydro * warm ,
+        'QICE'    : 2e-4 * hydro * ~warm ,
+        'QSNOW'   : 2e-3 * hydro * ~warm ,
+        'QGRAUP'  : 1e-3 * hydro * ( z_m > 3000.0 ) ,
+        'HGT'     : hgt ,
+        'LANDMASK': landmask ,
+        'PSFC'    : psfc + p[0] ,
+        'T2'      : tk[0] + 0.5 ,
+        'Q2'      : qvapor[0] ,
+        'U10'     : 0.5 * ( u[ 0 , : , 1: ] + u[ 0 , : , :-1 ] ) * 0.6 ,
+        'V10'     : 0.5 * ( v[ 0 , 1: ] + v[ 0 , :-1 ] ) * 0.6 ,
+        'XLAT'    : lat ,
+        'XLONG'   : lon ,
+        'XLAT_U'  : lat_u ,
+        'XLONG_U' : lon_u ,
+        'XLAT_V'  : lat_v ,
+        'XLONG_V' : lon_v ,
+        'MAPFAC_M': mapfac ,
+        'MAPFAC_U': mapfac_u ,
+        'MAPFAC_V': mapfac_v ,
+        'SINALPHA': np.sin( alpha ) ,
+        'COSALPHA': np.cos( alpha ) ,
+        'F'       : 2 * 7.292e-5 * np.sin( np.radians( lat ) ) ,
+        'ZNU'     : znu ,
+        'ZNW'     : znw ,
+        'P_TOP'   : np.float32( P_TOP ) ,
+        'XTIME'   : np.float32( itime * dt_minutes ) ,
+    }
+    mass = ( 'south_north' , 'west_east' )
+    stag = { 'U' : ( 'south_north' , 'west_east_stag' ) , 'V' : ( 'south_north_stag' , 'west_east' ) }
+    dims = { 'T' : 'm3' , 'P' : 'm3' , 'PB' : 'm3' , 'QVAPOR' : 'm3' , 'QCLOUD' : 'm3' , 'QRAIN' : 'm3' ,
+             'QICE' : 'm3' , 'QSNOW' : 'm3' , 'QGRAUP' : 'm3' , 'PH' : 'w3' , 'PHB' : 'w3' , 'W' : 'w3' ,
+             'U' : 'u3' , 'V' : 'v3' , 'XLAT_U' : 'u2' , 'XLONG_U' : 'u2' , 'MAPFAC_U' : 'u2' ,
+             'XLAT_V' : 'v2' , 'XLONG_V' : 'v2' , 'MAPFAC_V' : 'v2' , 'ZNU' : 'z' , 'ZNW' : 'zw' , 'P_TOP' : 't' , 'XTIME' : 't' }
+    shapes = { 'm3' : ( 'bottom_top' , ) + mass , 'w3' : ( 'bottom_top_stag' , ) + mass ,
+               'u3' : ( 'bottom_top' , ) + stag['U'] , 'v3' : ( 'bottom_top' , ) + stag['V'] ,
+               'u2' : stag['U'] , 'v2' : stag['V'] , 'm2' : mass , 'z' : ( 'bottom_top' , ) , 'zw' : ( 'bottom_top_stag' , ) , 't' : ( ) }
+    stagger = { 'w3' : 'Z' , 'u3' : 'X' , 'v3' : 'Y' , 'u2' : 'X' , 'v2' : 'Y' }
+
+    with Dataset( filename , 'w' ) as ncfile :
+        for name , size in ( ( 'Time' , None ) , ( 'DateStrLen' , 19 ) , ( 'west_east' , nx ) , ( 'south_north' , ny ) ,
+                             ( 'bottom_top' , nz ) , ( 'bottom_top_stag' , nz + 1 ) ,
+                             ( 'west_east_stag' , nx + 1 ) , ( 'south_north_stag' , ny + 1 ) ) :
+            ncfile.createDimension( name , size )
+        ncfile.setncatts( { 'TITLE' : ' OUTPUT FROM SYNTHETIC WRF' , 'START_DATE' : str( np.datetime64( start , 's' ) ).replace( 'T' , '_' ) ,
+                            'SIMULATION_START_DATE' : str( np.datetime64( start , 's' ) ).replace( 'T' , '_' ) ,
+                            'WEST-EAST_GRID_DIMENSION' : nx + 1 , 'SOUTH-NORTH_GRID_DIMENSION' : ny + 1 ,
+                            'BOTTOM-TOP_GRID_DIMENSION' : nz + 1 , 'DX' : np.float32( dx ) , 'DY' : np.float32( dx ) ,
+                            'DT' : np.float32( 6 * dx / 1000 ) , 'GRID_ID' : 1 , 'PARENT_ID' : 0 , 'I_PARENT_START' : 1 ,
+                            'J_PARENT_START' : 1 , 'PARENT_GRID_RATIO' : 1 , 'MAP_PROJ' : 1 , 'MAP_PROJ_CHAR' : 'Lambert Conformal' ,
+                            'CEN_LAT' : np.float32( CEN_LAT ) , 'CEN_LON' : np.float32( CEN_LON ) ,
+                            'TRUELAT1' : np.float32( TRUELAT1 ) , 'TRUELAT2' : np.float32( TRUELAT2 ) ,
+                            'MOAD_CEN_LAT' : np.float32( CEN_LAT ) , 'STAND_LON' : np.float32( CEN_LON ) ,
+                            'POLE_LAT' : np.float32( 90.0 ) , 'POLE_LON' : np.float32( 0.0 ) ,
+                            'MP_PHYSICS' : 8 , 'NUM_LAND_CAT' : 21 , 'ISWATER' : 17 } )
+
+        times = ncfile.createVariable( 'Times' , 'S1' , ( 'Time' , 'DateStrLen' ) )
+        times[0] = np.array( list( time_str ) , dtype='S1' )
+        for name , data in variables.items() :
+            kind = dims.get( name , 'm2' )
+            var = ncfile.createVariable( name , 'f4' , ( 'Time' , ) + shapes[ kind ] )
+            var.setncatts( { 'FieldType' : 104 , 'MemoryOrder' : 'XYZ' if kind[-1] == '3' else 'XY ' ,
+                             'description' : name , 'units' : '' , 'stagger' : stagger.get( kind , '' ) ,
+                             'coordinates' : 'XLONG XLAT XTIME' } )
+            var[0] = np.asarray( data , dtype=np.float32 )
+    return filename
+
+
+def make_run( path='.' , ntimes=6 , nz=40 , ny=100 , nx=120 , dx=4000.0 , start='2020-01-01T00:00:00' ,
+              dt_minutes=60 , domain='d01' , seed=0 ) :
+    """Escribe en path una corrida sintetica de ntimes wrfout (uno por tiempo). Devuelve la lista de archivos."""
+    os.makedirs( path , exist_ok=True )
+    file_list = list()
+    for itime in range( ntimes ) :
+        time = np.datetime64( start , 's' ) + np.timedelta64( itime * dt_minutes , 'm' )
+        filename = os.path.join( path , 'wrfout_' + domain + '_' + str( time ).replace( 'T' , '_' ) )
+        #La misma semilla en todos los tiempos para que las celdas se trasladen en lugar de saltar.
+        file_list.append( write_wrfout( filename , itime , start , dt_minutes , nz , ny , nx , dx , seed ) )
+    return file_list
+
+
+if __name__ == '__main__' :
+
+    path = sys.argv[1] if len( sys.argv ) > 1 else './synthetic_run'
+    ntimes , nz , ny , nx = [ int( arg ) for arg in sys.argv[2:6] ] + [ 6 , 40 , 100 , 120 ][ len( sys.argv[2:6] ): ]
+    for filename in make_run( path , ntimes , nz , ny , nx ) :
+        print( filename )
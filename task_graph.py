@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Grafo de tareas con dependencias para un mismo wrfout.
+Cada tarea (por ejemplo calcular height, uvmet o dbz, o hacer una figura) se ejecuta
+una sola vez, cuando terminaron las tareas de las que depende. Las tareas comunes se
+ejecutan en un pool de threads; las inline (las figuras: matplotlib no se puede usar
+desde varios threads) se ejecutan de a una en el thread que llamo a run, mientras el
+pool sigue con las otras. Asi, por ejemplo, se dibuja una figura mientras se calcula el
+campo de la siguiente (la lectura del netcdf libera el GIL, pero si se turna con un lock
+los calculos que leen el archivo no se aceleran entre si). El resultado de cada tarea se
+libera en cuanto termina la ultima tarea que lo usa, asi que en memoria solo quedan los
+campos que todavia hacen falta.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from parallel_utils import get_nworkers
+
+
+class TaskGraph :
+    """Conjunto de tareas con dependencias.
+
+    add( name , func , deps ) agrega la tarea name que se calcula como func( *resultados de deps ).
+    release( resultado ) (opcional) se llama cuando el resultado ya no lo necesita ninguna tarea.
+    Si se pasa lock, la tarea se ejecuta con ese lock tomado (por ejemplo para no leer el
+    mismo netcdf desde dos threads a la vez). Con inline=True la tarea se ejecuta en el
+    thread que llama a run, de a una.
+    """
+
+    def __init__( self ) :
+        self.tasks = dict()
+
+    def __contains__( self , name ) :
+        return name in self.tasks
+
+    def add( self , name , func , deps=() , release=None , lock=None , inline=False ) :
+        if name in self.tasks :
+            raise ValueError( 'La tarea ' + name + ' ya esta en el grafo' )
+        for dep in deps :
+            if dep not in self.tasks :
+                raise ValueError( 'La tarea ' + name + ' depende de ' + dep + ' que no esta en el grafo' )
+        self.tasks[ name ] = ( func , tuple( deps ) , release , lock , inline )
+        return name
+
+    def _call( self , name , args ) :
+        func , deps , release , lock , inline = self.tasks[ name ]
+        if lock is None :
+            return func( *args )
+        with lock :
+            return func( *args )
+
+    def run( self , nthreads=None , keep=() ) :
+        """Ejecuta todas las tareas. Devuelve un diccionario con los resultados de las tareas de keep.
+
+        Si una tarea falla se espera a las que estan corriendo y se vuelve a lanzar el error.
+        """
+        nthreads = get_nworkers( nthreads )
+        #Cuantas tareas usan el resultado de cada tarea.
+        consumers = { name : 0 for name in self.tasks }
+        for func , deps , release , lock , inline in self.tasks.values() :
+            for dep in deps :
+                consumers[ dep ] += 1
+
+        results = dict()
+        waiting = dict( ( name , set( task[1] ) ) for name , task in self.tasks.items() )
+        running = dict()
+        ready_inline = list()
+        kept = dict()
+
+        def free( name ) :
+            consumers[ name ] -= 1
+            if consumers[ name ] == 0 and name not in keep :
+                result = results.pop( name )
+                release = self.tasks[ name ][2]
+                if release is not None :
+                    release( result )
+
+        def finish( name , result ) :
+            results[ name ] = result
+            if name in keep :
+                kept[ name ] = result
+            for deps in waiting.values() :
+                deps.discard( name )
+            for dep in self.tasks[ name ][1] :
+                free( dep )
+            #Si nadie usa el resultado se libera enseguida.
+            if consumers[ name ] == 0 :
+                consumers[ name ] = 1
+                free( name )
+
+        with ThreadPoolExecutor( max_workers=nthreads ) as executor :
+            while len( waiting ) > 0 or len( running ) > 0 or len( ready_inline ) > 0 :
+                for name in [ name for name , deps in waiting.items() if len( deps ) == 0 ] :
+                    del waiting[ name ]
+                    if self.tasks[ name ][4] :
+                        ready_inline.append( name )
+                    else :
+                        args = [ results[ dep ] for dep in self.tasks[ name ][1] ]
+                        running[ executor.submit( self._call , name , args ) ] = name
+                if len( running ) == 0 and len( ready_inline ) == 0 :
+                    raise ValueError( 'El grafo tiene dependencias circulares: ' + ', '.join( waiting ) )
+
+                #Una tarea inline en este thread (el pool sigue con las suyas) y despues, sin esperar,
+                #las del pool que ya terminaron. Si no hay tareas inline se espera a la proxima del pool.
+                timeout = None
+                if len( ready_inline ) > 0 :
+                    name = ready_inline.pop( 0 )
+                    try :
+                        result = self._call( name , [ results[ dep ] for dep in self.tasks[ name ][1] ] )
+                    except BaseException :
+                        wait( running )
+                        raise
+                    finish( name , result )
+                    timeout = 0
+                if len( running ) == 0 :
+                    continue
+                done , pending = wait( running , timeout=timeout , return_when=FIRST_COMPLETED )
+                for future in done :
+                    name = running.pop( future )
+                    if future.exception() is not None :
+                        wait( running )
+                        raise future.exception()
+                    finish( name , future.result() )
+        return kept
@@ -0,0 +1,11 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Los modulos estan en la carpeta de arriba (no son un paquete), asi que la agregamos al path.
+"""
+
+import os
+import sys
+
+sys.path.insert( 0 , os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) ) )
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+ensemble_stats contra las funciones de numpy que ignoran los NaN.
+"""
+
+import warnings
+
+import numpy as np
+
+from ensemble import ensemble_stats
+
+
+def _stack( nmembers=7 , shape=( 5 , 6 , 8 ) , offset=0.0 , seed=0 ) :
+    """Miembros con NaN sueltos, un punto sin ningun miembro valido y otro con uno solo."""
+    rng = np.random.default_rng( seed )
+    stack = offset + rng.normal( size=( nmembers , ) + shape )
+    stack[ rng.random( stack.shape ) < 0.2 ] = np.nan
+    stack[ : , 0 , 0 , 0 ] = np.nan
+    stack[ 1: , 0 , 0 , 1 ] = np.nan
+    return stack
+
+
+def _reference( stack , ddof ) :
+    with warnings.catch_warnings() :
+        warnings.simplefilter( 'ignore' , RuntimeWarning )
+        return ( np.nanmean( stack , axis=0 ) , np.nanstd( stack , axis=0 , ddof=ddof ) ,
+                 np.nanmin( stack , axis=0 ) , np.nanmax( stack , axis=0 ) )
+
+
+def test_matches_nan_functions() :
+    stack = _stack()
+    for ddof in ( 0 , 1 ) :
+        stats = ensemble_stats( stack , ddof=ddof )
+        mean , spread , low , high = _reference( stack , ddof )
+        np.testing.assert_allclose( stats['mean'] , mean , rtol=1e-12 , atol=1e-12 , equal_nan=True )
+        np.testing.assert_allclose( stats['spread'] , spread , rtol=1e-10 , atol=1e-12 , equal_nan=True )
+        np.testing.assert_array_equal( stats['min'] , low )
+        np.testing.assert_array_equal( stats['max'] , high )
+        np.testing.assert_array_equal( stats['count'] , np.sum( ~np.isnan( stack ) , axis=0 ) )
+
+
+def test_undefined_points_are_nan() :
+    """Sin miembros validos no hay media; con un solo miembro no hay dispersion (ddof=1)."""
+    stats = ensemble_stats( _stack() )
+    assert np.isnan( stats['mean'][ 0 , 0 , 0 ] ) and np.isnan( stats['spread'][ 0 , 0 , 0 ] )
+    assert np.isnan( stats['min'][ 0 , 0 , 0 ] ) and np.isnan( stats['max'][ 0 , 0 , 0 ] )
+    assert not np.isnan( stats['mean'][ 0 , 0 , 1 ] ) and np.isnan( stats['spread'][ 0 , 0 , 1 ] )
+
+
+def test_large_offset_keeps_precision() :
+    """Valores grandes con poca dispersion (presion en Pa): la suma de cuadrados no pierde precision."""
+    stack = _stack( offset=1.0e5 , seed=1 )
+    mean , spread , low , high = _reference( stack , 1 )
+    stats = ensemble_stats( stack )
+    np.testing.assert_allclose( stats['spread'] , spread , rtol=1e-7 , equal_nan=True )
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+GridIndex (KD-tree) sobre una reticula sintetica de la que se conoce la posicion exacta de cada punto.
+"""
+
+import os
+
+import numpy as np
+
+import grid_index
+from diag_cache import clear_cache
+from grid_index import GridIndex, get_grid_index
+
+
+def _grid( ny=30 , nx=40 ) :
+    """Reticula rotada, lineal en lat y lon: la posicion (y, x) de cualquier punto se calcula exacta."""
+    def to_latlon( y , x ) :
+        lats = -35.0 + 0.05 * y + 0.01 * x
+        lons = -65.0 + 0.06 * x - 0.015 * y
+        return lats , lons
+    y , x = np.meshgrid( np.arange( ny , dtype=float ) , np.arange( nx , dtype=float ) , indexing='ij' )
+    lats , lons = to_latlon( y , x )
+    return lats , lons , to_latlon
+
+
+def test_fractional_indices() :
+    lats , lons , to_latlon = _grid()
+    rng = np.random.default_rng( 0 )
+    y = rng.uniform( 1.0 , 28.0 , 50 )
+    x = rng.uniform( 1.0 , 38.0 , 50 )
+    slats , slons = to_latlon( y , x )
+    fy , fx = GridIndex( lats , lons ).fractional( slats , slons )
+    np.testing.assert_allclose( fy , y , atol=1e-8 )
+    np.testing.assert_allclose( fx , x , atol=1e-8 )
+
+
+def test_nearest_is_rounded_fractional() :
+    lats , lons , to_latlon = _grid()
+    rng = np.random.default_rng( 1 )
+    #Lejos de los puntos medios, para que el mas cercano no dependa de la distorsion de la esfera.
+    y = rng.integers( 0 , 30 , 40 ) + rng.uniform( -0.3 , 0.3 , 40 )
+    x = rng.integers( 0 , 40 , 40 ) + rng.uniform( -0.3 , 0.3 , 40 )
+    y , x = np.clip( y , 0 , 29 ) , np.clip( x , 0 , 39 )
+    iy , ix = GridIndex( lats , lons ).nearest( *to_latlon( y , x ) )
+    np.testing.assert_array_equal( iy , np.round( y ) )
+    np.testing.assert_array_equal( ix , np.round( x ) )
+
+
+def test_bilinear_reproduces_linear_field() :
+    """La interpolacion bilineal de un campo lineal en (y, x) es exacta; las estaciones de afuera se marcan."""
+    lats , lons , to_latlon = _grid()
+    y , x = np.meshgrid( np.arange( 30.0 ) , np.arange( 40.0 ) , indexing='ij' )
+    field = 3.0 * y - 2.0 * x + 7.0
+    sy = np.array( [ 0.0 , 5.25 , 12.5 , 29.0 , 35.0 ] )
+    sx = np.array( [ 0.0 , 7.75 , 38.5 , 39.0 , 10.0 ] )
+    index = GridIndex( lats , lons )
+    iy , ix , weights , inside = index.bilinear( *to_latlon( sy , sx ) )
+    np.testing.assert_allclose( weights.sum( axis=1 ) , 1.0 )
+    np.testing.assert_array_equal( inside , [ True , True , True , True , False ] )
+    values = index.interpolate( field , *to_latlon( sy[ inside ] , sx[ inside ] ) )
+    np.testing.assert_allclose( values , 3.0 * sy[ inside ] - 2.0 * sx[ inside ] + 7.0 , atol=1e-6 )
+
+
+def test_cached_index_survives_clear_cache( tmp_path , monkeypatch ) :
+    """El indice guardado en disco no lo borra la limpieza del cache de variables."""
+    lats , lons , to_latlon = _grid()
+    monkeypatch.setattr( grid_index , '_indexes' , dict() )
+    index = get_grid_index( lats , lons , str( tmp_path ) )
+    clear_cache( str( tmp_path ) )
+    assert len( os.listdir( tmp_path / grid_index.GRID_INDEX_DIR ) ) == 1
+
+    monkeypatch.setattr( grid_index , '_indexes' , dict() )
+    def build( *args ) :
+        raise AssertionError( 'el indice se volvio a armar' )
+    monkeypatch.setattr( GridIndex , '__init__' , build )   #pickle no llama a __init__.
+    cached = get_grid_index( lats , lons , str( tmp_path ) )
+    np.testing.assert_array_equal( cached.nearest( lats[ :3 , 0 ] , lons[ :3 , 0 ] ) , index.nearest( lats[ :3 , 0 ] , lons[ :3 , 0 ] ) )
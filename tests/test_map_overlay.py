@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Recorte de las lineas del mapa al dominio de la figura.
+"""
+
+import numpy as np
+
+from map_overlay import clip_line
+
+BBOX = [ 0.0 , 10.0 , 0.0 , 10.0 ]
+
+
+def _segments( line ) :
+    """Segmentos ( p , q ) de la linea recortada (sin los que tienen un extremo NaN)."""
+    return [ ( tuple( p ) , tuple( q ) ) for p , q in zip( line[:-1] , line[1:] ) if not np.isnan( p ).any() and not np.isnan( q ).any() ]
+
+
+def test_inside_points_and_neighbours_are_kept() :
+    line = np.array( [ [ -30.0 , 5.0 ] , [ -20.0 , 5.0 ] , [ 5.0 , 5.0 ] , [ 6.0 , 6.0 ] , [ 20.0 , 6.0 ] , [ 30.0 , 6.0 ] ] )
+    clipped = clip_line( line , BBOX )
+    assert _segments( clipped ) == [ ( ( -20.0 , 5.0 ) , ( 5.0 , 5.0 ) ) , ( ( 5.0 , 5.0 ) , ( 6.0 , 6.0 ) ) , ( ( 6.0 , 6.0 ) , ( 20.0 , 6.0 ) ) ]
+    assert np.isnan( clipped[0] ).all() and np.isnan( clipped[-1] ).all()
+
+
+def test_segment_crossing_domain_with_both_ends_outside() :
+    """Un segmento que cruza el dominio (o una esquina) sin puntos adentro se conserva."""
+    across = np.array( [ [ -50.0 , -50.0 ] , [ -5.0 , 5.0 ] , [ 15.0 , 5.0 ] , [ 50.0 , -50.0 ] ] )
+    assert _segments( clip_line( across , BBOX ) ) == [ ( ( -5.0 , 5.0 ) , ( 15.0 , 5.0 ) ) ]
+    corner = np.array( [ [ 9.0 , 12.0 ] , [ 12.0 , 9.0 ] ] )
+    assert _segments( clip_line( corner , BBOX ) ) == [ ( ( 9.0 , 12.0 ) , ( 12.0 , 9.0 ) ) ]
+
+
+def test_far_lines_and_gaps_are_dropped() :
+    line = np.array( [ [ 20.0 , 20.0 ] , [ 30.0 , 20.0 ] , [ np.nan , np.nan ] , [ 1.0 , 1.0 ] , [ 2.0 , 2.0 ] , [ np.nan , np.nan ] , [ 3.0 , 3.0 ] ] )
+    clipped = clip_line( line , BBOX )
+    assert _segments( clipped ) == [ ( ( 1.0 , 1.0 ) , ( 2.0 , 2.0 ) ) ]
+    #El punto suelto de adentro se conserva y los NaN seguidos quedan en uno solo.
+    np.testing.assert_array_equal( clipped , [ [ np.nan , np.nan ] , [ 1.0 , 1.0 ] , [ 2.0 , 2.0 ] , [ np.nan , np.nan ] , [ 3.0 , 3.0 ] ] )
+
+
+def test_margin_extends_domain() :
+    line = np.array( [ [ 10.5 , 20.0 ] , [ 10.5 , 30.0 ] , [ 10.5 , 5.0 ] ] )
+    assert _segments( clip_line( line , BBOX ) ) == [ ]
+    assert len( _segments( clip_line( line , BBOX , margin=1.0 ) ) ) == 1
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Prefetcher: orden de los resultados, errores del lector, tamanio de la cola y corte del loop.
+"""
+
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from prefetch import Prefetcher
+
+
+class _Reader :
+    """Lector que cuenta cuantos resultados hay leidos (o leyendose) que el proceso principal todavia no recibio."""
+
+    def __init__( self , size=0 , fail=None , delay=0.0 ) :
+        self.size = size
+        self.fail = fail
+        self.delay = delay
+        self.started = 0
+        self.used = 0
+        self.ahead = list()
+        self._lock = threading.Lock()
+
+    def __call__( self , task ) :
+        with self._lock :
+            self.started += 1
+            self.ahead.append( self.started - self.used )
+        time.sleep( self.delay )
+        if task == self.fail :
+            raise RuntimeError( 'no se pudo leer ' + str( task ) )
+        return task , np.zeros( self.size , dtype=np.uint8 )
+
+    def use( self ) :
+        with self._lock :
+            self.used += 1
+
+
+@pytest.mark.parametrize( 'depth' , [ 0 , 1 , 3 ] )
+def test_results_in_order( depth ) :
+    rng = np.random.default_rng( depth )
+    delays = rng.uniform( 0 , 0.005 , 20 )
+
+    def reader( task ) :
+        time.sleep( delays[ task ] )
+        return task
+    assert list( Prefetcher( reader , range( 20 ) , depth ) ) == list( range( 20 ) )
+
+
+@pytest.mark.parametrize( 'depth' , [ 0 , 2 ] )
+def test_error_raised_at_failing_item( depth ) :
+    reader = _Reader( fail=5 )
+    received = list()
+    with pytest.raises( RuntimeError , match='no se pudo leer 5' ) :
+        for task , data in Prefetcher( reader , range( 10 ) , depth ) :
+            received.append( task )
+    assert received == [ 0 , 1 , 2 , 3 , 4 ]
+
+
+@pytest.mark.parametrize( 'depth' , [ 1 , 3 ] )
+def test_depth_bounds_read_ahead( depth ) :
+    """Con el proceso principal lento el lector llena la cola, pero nunca adelanta mas de depth."""
+    reader = _Reader()
+    for task , data in Prefetcher( reader , range( 15 ) , depth ) :
+        reader.use()
+        time.sleep( 0.005 )
+    #La cola se llega a llenar (el lector no se queda corto).
+    assert max( reader.ahead ) == depth
+
+
+def test_max_mb_bounds_read_ahead() :
+    """Resultados de 1 MB con max_mb = 2.5: no se adelantan mas de 2 aunque depth permita 10."""
+    reader = _Reader( size=1024**2 )
+    prefetcher = Prefetcher( reader , range( 12 ) , depth=10 , max_mb=2.5 )
+    for task , data in prefetcher :
+        reader.use()
+        time.sleep( 0.005 )
+    assert max( reader.ahead ) == 2
+    assert prefetcher.stats.peak_mb <= 2.5
+
+
+def test_break_stops_reader() :
+    reader = _Reader( delay=0.001 )
+    prefetcher = Prefetcher( reader , range( 100 ) , depth=2 , name='corte' )
+    for task , data in prefetcher :
+        reader.use()
+        if task == 2 :
+            break
+    assert not any( thread.name == 'prefetch-corte' for thread in threading.enumerate() )
+    assert reader.started <= 3 + 2
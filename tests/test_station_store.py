@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+StationStore con wrfout sinteticos: en lugar de leer el netcdf, read_file lee un npz con
+los tiempos y los valores en las estaciones (lo que devolveria read_points).
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+from station_store import StationStore
+
+POINTS = [ ( 3 , 4 ) , ( 10 , 2 ) ]
+VARIABLES = ( 'T2C' , 'td2' )
+
+
+def _read_file( self , filename , ncfile=None ) :
+    with np.load( filename ) as values :
+        return values['times'] , values['data']
+
+
+@pytest.fixture( autouse=True )
+def _fake_wrfout( monkeypatch ) :
+    monkeypatch.setattr( StationStore , 'read_file' , _read_file )
+
+
+def _write_wrfout( filename , first_hour , ntimes , offset=0.0 ) :
+    """wrfout con ntimes tiempos horarios desde first_hour; los valores dependen de la hora, la estacion, la variable y offset."""
+    hours = first_hour + np.arange( ntimes )
+    times = ( np.datetime64( '2020-01-01T00:00:00' ) + hours * np.timedelta64( 3600 , 's' ) ).astype( np.int64 )
+    data = offset + hours[ : , None , None ] + 100.0 * np.arange( len( POINTS ) )[ None , : , None ] + 1000.0 * np.arange( len( VARIABLES ) )
+    os.makedirs( os.path.dirname( filename ) , exist_ok=True )
+    #Un nombre sin .npz (como los wrfout): np.savez no le agrega la extension si se le pasa el archivo abierto.
+    with open( filename , 'wb' ) as my_file :
+        np.savez( my_file , times=times , data=data.astype( np.float32 ) )
+    #Cada reescritura con otra fecha de modificacion, aunque el sistema de archivos tenga poca resolucion.
+    stat = os.stat( filename )
+    os.utime( filename , ns=( stat.st_atime_ns , stat.st_mtime_ns + first_hour * 10**9 + int( offset ) * 10**6 + ntimes ) )
+    return hours , data
+
+
+def _store( path ) :
+    return StationStore( str( path / 'store' ) , POINTS , VARIABLES )
+
+
+def test_update_reads_only_new_files( tmp_path ) :
+    files = [ str( tmp_path / 'run' / ( 'wrfout_' + str( i ) ) ) for i in range( 3 ) ]
+    expected = [ _write_wrfout( filename , 4 * i , 4 )[1] for i , filename in enumerate( files ) ]
+    store = _store( tmp_path )
+    assert store.update( files[ :2 ] , prefetch=2 ) == 8
+    assert store.update( files ) == 4
+    assert store.update( files ) == 0
+    times , series = _store( tmp_path ).series( files , 1 )
+    np.testing.assert_array_equal( series , np.concatenate( expected )[ : , 1 ] )
+    assert np.all( np.diff( times ) == np.timedelta64( 3600 , 's' ) )
+
+
+def test_interrupted_append_is_discarded( tmp_path ) :
+    """Datos escritos sin llegar a actualizar el indice (se corto la corrida): al abrir se descartan."""
+    first , second = str( tmp_path / 'run' / 'wrfout_0' ) , str( tmp_path / 'run' / 'wrfout_1' )
+    expected = _write_wrfout( first , 0 , 3 )[1]
+    store = _store( tmp_path )
+    store.update( [ first ] )
+    sizes = [ os.path.getsize( os.path.join( store.directory , name ) ) for name in ( 'times.i8' , 'data.f4' ) ]
+    for name in ( 'times.i8' , 'data.f4' ) :
+        with open( os.path.join( store.directory , name ) , 'ab' ) as my_file :
+            my_file.write( b'\x01' * 37 )
+
+    store = _store( tmp_path )
+    assert [ os.path.getsize( os.path.join( store.directory , name ) ) for name in ( 'times.i8' , 'data.f4' ) ] == sizes
+    expected = np.concatenate( [ expected , _write_wrfout( second , 3 , 2 )[1] ] )
+    assert store.update( [ first , second ] ) == 2
+    np.testing.assert_array_equal( store.series( [ first , second ] , 0 )[1] , expected[ : , 0 ] )
+
+
+def test_growing_file_reuses_tail( tmp_path ) :
+    """El ultimo wrfout gana tiempos: sus filas se reescriben en el mismo lugar, sin dejar filas viejas."""
+    files = [ str( tmp_path / 'run' / ( 'wrfout_' + str( i ) ) ) for i in range( 2 ) ]
+    _write_wrfout( files[0] , 0 , 4 )
+    _write_wrfout( files[1] , 4 , 1 )
+    store = _store( tmp_path )
+    store.update( files )
+    assert store.ntimes == 5
+
+    hours , data = _write_wrfout( files[1] , 4 , 3 )
+    assert store.update( files ) == 3
+    assert store.ntimes == 7
+    entry = store.files[ os.path.abspath( files[1] ) ]
+    assert ( entry['start'] , entry['count'] ) == ( 4 , 3 )
+    np.testing.assert_array_equal( store.series( files[ 1: ] , 1 )[1] , data[ : , 1 ] )
+
+
+def test_rewritten_file_is_read_again( tmp_path ) :
+    """Un wrfout que se vuelve a escribir (corrida rehecha) se vuelve a leer y series usa los valores nuevos."""
+    files = [ str( tmp_path / 'run' / ( 'wrfout_' + str( i ) ) ) for i in range( 2 ) ]
+    _write_wrfout( files[0] , 0 , 2 )
+    _write_wrfout( files[1] , 2 , 2 )
+    store = _store( tmp_path )
+    store.update( files )
+
+    #Mismo tamanio, otros valores: cambia solo la fecha de modificacion.
+    hours , data = _write_wrfout( files[0] , 0 , 2 , offset=50.0 )
+    assert not store.ingested( files[0] ) and store.ingested( files[1] )
+    with pytest.raises( ValueError ) :
+        store.series( files )
+    assert store.update( files ) == 2
+    times , series = _store( tmp_path ).series( files , 0 )
+    np.testing.assert_array_equal( series[ :2 ] , data[ : , 0 ] )
+    np.testing.assert_array_equal( ( times - times[0] ) / np.timedelta64( 1 , 'h' ) , [ 0 , 1 , 2 , 3 ] )
+
+
+def test_runs_sharing_a_store( tmp_path ) :
+    """Dos corridas del mismo punto en un almacen: series devuelve solo los tiempos de la corrida pedida."""
+    run_a = [ str( tmp_path / 'a' / ( 'wrfout_' + str( i ) ) ) for i in range( 2 ) ]
+    run_b = [ str( tmp_path / 'b' / ( 'wrfout_' + str( i ) ) ) for i in range( 3 ) ]
+    data_a = np.concatenate( [ _write_wrfout( filename , 2 * i , 2 )[1] for i , filename in enumerate( run_a ) ] )
+    data_b = np.concatenate( [ _write_wrfout( filename , 2 * i , 2 , offset=0.5 )[1] for i , filename in enumerate( run_b ) ] )
+    store = _store( tmp_path )
+    store.update( run_a )
+    store.update( run_b )
+    assert store.ntimes == 10
+
+    times_a , series_a = store.series( run_a , 1 )
+    times_b , series_b = store.series( run_b , 1 , variables=[ 'td2' ] )
+    assert len( times_a ) == 4 and len( times_b ) == 6
+    np.testing.assert_array_equal( series_a , data_a[ : , 1 ] )
+    np.testing.assert_array_equal( series_b , data_b[ : , 1 , 1: ] )
+    np.testing.assert_array_equal( store.series( run_b[ 1:2 ] , 0 , variables=[ 'td2' , 'T2C' ] )[1] ,
+                                   data_b[ 2:4 , 0 , ::-1 ] )
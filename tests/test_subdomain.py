@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Variables escalonadas del subdominio decimado: destagger sobre el subdominio tiene que dar
+exactamente los valores en los puntos de masa del dominio original.
+"""
+
+import numpy as np
+import pytest
+
+from subdomain import _stagger_subset
+
+
+def _destagger( data , axis ) :
+    """Promedio entre vecinos a lo largo de axis (lo que hace wrf.destagger)."""
+    n = data.shape[ axis ]
+    return 0.5 * ( np.take( data , np.arange( n - 1 ) , axis=axis ) + np.take( data , np.arange( 1 , n ) , axis=axis ) )
+
+
+@pytest.mark.parametrize( 'stride' , [ 1 , 2 , 3 , 5 ] )
+@pytest.mark.parametrize( 'axis' , [ 0 , 1 , 2 ] )
+def test_destagger_with_stride_is_exact( stride , axis ) :
+    shape = [ 4 , 5 , 6 ]
+    n = shape[ axis ]
+    #Valores escalonados del dominio original: ( n - 1 ) * stride + 1 puntos de masa.
+    shape[ axis ] = ( n - 1 ) * stride + 2
+    data = np.random.default_rng( stride ).normal( size=shape )
+    subset = _stagger_subset( data , axis , n , stride )
+    assert subset.shape[ axis ] == n + 1
+    mass = np.take( _destagger( data , axis ) , stride * np.arange( n ) , axis=axis )
+    np.testing.assert_allclose( _destagger( subset , axis ) , mass , rtol=1e-12 , atol=1e-12 )
+
+
+def test_stride_one_is_a_slice() :
+    data = np.arange( 20.0 ).reshape( 4 , 5 )
+    np.testing.assert_array_equal( _stagger_subset( data , 1 , 3 , 1 ) , data[ : , :4 ] )
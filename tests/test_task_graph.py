@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+TaskGraph: orden de las dependencias, liberacion de los resultados, keep, ciclos y errores.
+"""
+
+import threading
+
+import pytest
+
+from task_graph import TaskGraph
+
+
+def _diamond( log , inline=False ) :
+    """a -> ( b , c ) -> d, registrando en log cada tarea que se ejecuta o se libera."""
+    lock = threading.Lock()
+
+    def task( name ) :
+        def func( *args ) :
+            with lock :
+                log.append( ( 'run' , name , args ) )
+            return name
+        return func
+
+    def release( name ) :
+        with lock :
+            log.append( ( 'release' , name , ( ) ) )
+
+    graph = TaskGraph()
+    graph.add( 'a' , task( 'a' ) , release=release )
+    graph.add( 'b' , task( 'b' ) , [ 'a' ] , release=release )
+    graph.add( 'c' , task( 'c' ) , [ 'a' ] , release=release , inline=inline )
+    graph.add( 'd' , task( 'd' ) , [ 'b' , 'c' ] , release=release , inline=inline )
+    return graph
+
+
+def _events( log , kind ) :
+    return [ name for event , name , args in log if event == kind ]
+
+
+@pytest.mark.parametrize( 'inline' , [ False , True ] )
+def test_dependencies_run_first( inline ) :
+    log = list()
+    _diamond( log , inline ).run( 4 )
+    order = _events( log , 'run' )
+    assert sorted( order ) == [ 'a' , 'b' , 'c' , 'd' ]
+    assert order[0] == 'a' and order[-1] == 'd'
+    #Cada tarea recibe los resultados de sus dependencias en orden.
+    assert [ args for event , name , args in log if name == 'd' and event == 'run' ] == [ ( 'b' , 'c' ) ]
+
+
+@pytest.mark.parametrize( 'inline' , [ False , True ] )
+def test_release_once_after_last_consumer( inline ) :
+    log = list()
+    _diamond( log , inline ).run( 4 )
+    assert sorted( _events( log , 'release' ) ) == [ 'a' , 'b' , 'c' , 'd' ]
+    position = dict( ( ( event , name ) , i ) for i , ( event , name , args ) in enumerate( log ) )
+    #a se libera cuando terminaron b y c, b y c cuando termino d, y d (sin consumidores) enseguida.
+    assert position[ 'release' , 'a' ] > max( position[ 'run' , 'b' ] , position[ 'run' , 'c' ] )
+    assert position[ 'release' , 'b' ] > position[ 'run' , 'd' ]
+    assert position[ 'release' , 'c' ] > position[ 'run' , 'd' ]
+    assert position[ 'release' , 'd' ] > position[ 'run' , 'd' ]
+
+
+def test_keep_returns_results_without_releasing() :
+    log = list()
+    kept = _diamond( log ).run( 2 , keep=( 'b' , 'd' ) )
+    assert kept == { 'b' : 'b' , 'd' : 'd' }
+    assert sorted( _events( log , 'release' ) ) == [ 'a' , 'c' ]
+
+
+def test_cycle_is_detected() :
+    graph = TaskGraph()
+    graph.add( 'a' , lambda : 1 )
+    graph.add( 'b' , lambda a : a , [ 'a' ] )
+    #add no acepta dependencias que todavia no estan en el grafo, asi que el ciclo se arma a mano.
+    graph.tasks['a'] = ( graph.tasks['a'][0] , ( 'b' , ) ) + graph.tasks['a'][2:]
+    with pytest.raises( ValueError , match='circulares' ) :
+        graph.run( 2 )
+
+
+@pytest.mark.parametrize( 'inline' , [ False , True ] )
+def test_error_is_raised( inline ) :
+    done = list()
+
+    def fail( a ) :
+        raise RuntimeError( 'fallo la tarea' )
+
+    graph = TaskGraph()
+    graph.add( 'a' , lambda : 1 )
+    graph.add( 'b' , fail , [ 'a' ] , inline=inline )
+    graph.add( 'c' , lambda b : done.append( b ) , [ 'b' ] )
+    with pytest.raises( RuntimeError , match='fallo la tarea' ) :
+        graph.run( 2 )
+    assert done == [ ]
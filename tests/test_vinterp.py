@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+VerticalInterpolator contra np.interp columna por columna.
+"""
+
+import numpy as np
+
+from vinterp import VerticalInterpolator, interp_levels
+
+
+def _heights( nz=12 , ny=5 , nx=7 , seed=0 ) :
+    """Alturas crecientes con el indice vertical y distintas en cada columna (como sobre una montania)."""
+    rng = np.random.default_rng( seed )
+    terrain = rng.uniform( 0.0 , 2500.0 , ( ny , nx ) )
+    dz = rng.uniform( 200.0 , 1500.0 , ( nz , ny , nx ) )
+    return terrain + np.cumsum( dz , axis=0 )
+
+
+def _reference( field , z , niveles ) :
+    """np.interp en cada columna, con NaN fuera de la columna (como interplevel)."""
+    nz , ny , nx = z.shape
+    result = np.full( ( len( niveles ) , ny , nx ) , np.nan )
+    for j in range( ny ) :
+        for i in range( nx ) :
+            column = np.interp( niveles , z[ : , j , i ] , field[ : , j , i ] , left=np.nan , right=np.nan )
+            result[ : , j , i ] = column
+    return result
+
+
+def test_matches_np_interp_per_column() :
+    z = _heights()
+    rng = np.random.default_rng( 1 )
+    fields = [ rng.normal( size=z.shape ) for ivar in range( 3 ) ]
+    niveles = [ 100.0 , 1000.0 , 3000.0 , 5000.0 , 9000.0 , 20000.0 ]
+    result = VerticalInterpolator( z ).interp( fields , niveles )
+    assert result.shape == ( 3 , len( niveles ) ) + z.shape[1:]
+    for field , interpolated in zip( fields , result ) :
+        np.testing.assert_allclose( interpolated , _reference( field , z , niveles ) , rtol=1e-12 , atol=1e-12 , equal_nan=True )
+
+
+def test_model_levels_are_exact() :
+    """En las alturas de los niveles del modelo (incluidos el primero y el ultimo) se recupera el campo."""
+    z = np.broadcast_to( np.linspace( 10.0 , 15000.0 , 8 )[ : , None , None ] , ( 8 , 3 , 4 ) )
+    field = np.arange( z.size , dtype=float ).reshape( z.shape )
+    result = interp_levels( [ field ] , z , z[ : , 0 , 0 ] )[0]
+    np.testing.assert_allclose( result , field )
+
+
+def test_reused_weights_give_same_result() :
+    """Pedir los niveles de a uno (reutilizando los pesos guardados) da lo mismo que todos juntos."""
+    z = _heights( seed=2 )
+    field = np.random.default_rng( 3 ).normal( size=z.shape )
+    niveles = [ 500.0 , 2000.0 , 7000.0 ]
+    interpolator = VerticalInterpolator( z )
+    together = interpolator.interp( [ field ] , niveles )
+    one_by_one = np.concatenate( [ interpolator.interp( [ field ] , [ nivel ] ) for nivel in niveles[::-1] ] , axis=1 )[ : , ::-1 ]
+    np.testing.assert_array_equal( together , one_by_one )
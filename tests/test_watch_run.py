@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+follow_files sobre wrfout sinteticos (solo la variable Times) que se van escribiendo.
+"""
+
+import numpy as np
+from netCDF4 import Dataset
+
+import watch_run
+from watch_run import follow_files
+
+DATE = np.array( list( '2020-01-01_00:00:00' ) , 'S1' )
+
+
+def _write( filename , ntimes ) :
+    """Crea el wrfout o le agrega tiempos hasta tener ntimes."""
+    mode = 'a' if filename.exists() else 'w'
+    with Dataset( filename , mode ) as ncfile :
+        if mode == 'w' :
+            ncfile.createDimension( 'Time' , None )
+            ncfile.createDimension( 'DateStrLen' , 19 )
+            ncfile.createVariable( 'Times' , 'S1' , ( 'Time' , 'DateStrLen' ) )
+        times = ncfile.variables['Times']
+        for itime in range( len( ncfile.dimensions['Time'] ) , ntimes ) :
+            times[ itime ] = DATE
+
+
+def _follow( path , **kwargs ) :
+    return follow_files( str( path ) , 'd01' , poll_interval=0.05 , settle_time=0.1 , **kwargs )
+
+
+def test_growing_file( tmp_path ) :
+    """Los tiempos que el WRF agrega a un archivo ya visto se devuelven a continuacion."""
+    first = tmp_path / 'wrfout_d01_2020-01-01_00:00:00'
+    second = tmp_path / 'wrfout_d01_2020-01-01_03:00:00'
+    _write( first , 2 )
+    times = _follow( tmp_path , timeout=1.0 )
+    assert [ next( times ) for i in range( 2 ) ] == [ ( 0 , str( first ) , 0 ) , ( 1 , str( first ) , 1 ) ]
+    _write( first , 3 )
+    assert next( times ) == ( 2 , str( first ) , 2 )
+    _write( second , 2 )
+    assert list( times ) == [ ( 3 , str( second ) , 0 ) , ( 4 , str( second ) , 1 ) ]
+
+
+def test_times_in_order_when_older_file_is_late( tmp_path , monkeypatch ) :
+    """Si un archivo no esta listo no se devuelven los tiempos de los mas nuevos hasta que lo este."""
+    files = [ tmp_path / ( 'wrfout_d01_2020-01-01_0' + str( hour ) + ':00:00' ) for hour in ( 0 , 3 , 6 ) ]
+    for filename in files :
+        _write( filename , 2 )
+    wait_complete = watch_run.wait_complete
+    calls = list()
+
+    def late_first( filename , *args ) :
+        calls.append( filename )
+        if filename == str( files[0] ) and calls.count( filename ) < 3 :
+            return 0
+        return wait_complete( filename , *args )
+
+    monkeypatch.setattr( watch_run , 'wait_complete' , late_first )
+    expected = [ ( 2 * ifile + timeidx , str( filename ) , timeidx ) for ifile , filename in enumerate( files ) for timeidx in ( 0 , 1 ) ]
+    assert list( _follow( tmp_path , timeout=0.5 ) ) == expected
+    assert list( _follow( tmp_path , timeout=0.5 , skip=3 ) ) == expected[ 3: ]
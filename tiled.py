@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Calculo por partes de las variables derivadas para dominios muy grandes.
+getvar arma los campos 3D completos (dbz, uvmet, height, ...) como xarray y to_np hace
+otra copia, asi que en un dominio de alta resolucion una sola figura puede ocupar varios
+GB. Aca el dominio se divide en partes (rectangulos de la reticula) que entran en un
+presupuesto de memoria: cada parte se lee con subdomain.open_subset, se calculan sus
+variables con getvar y enseguida se reducen a lo que se grafica (los niveles de un corte
+horizontal o las columnas de un corte vertical). Solo se calculan las partes que toca
+el corte, y en la memoria nunca hay mas de una parte de los campos 3D.
+
+Las variables que se piden tienen que calcularse punto a punto en la horizontal (z, height,
+tk, dbz, uvmet, wa, ...), que son las que usan los scripts.
+
+Con la variable de entorno WRF_MEMORY_BUDGET_MB se elige el presupuesto por defecto.
+"""
+
+import os
+
+import numpy as np
+
+from subdomain import open_subset, close_subset, subdomain_bounds, Y_DIM, X_DIM
+from vinterp import VerticalInterpolator
+from cross_section import CrossSection, AUTOLEVELS
+from profiling import stage
+
+MEMORY_BUDGET_MB = float( os.environ.get( 'WRF_MEMORY_BUDGET_MB' , 1024 ) )
+
+#Cuantas copias de cada campo 3D (en float64) hay en memoria a la vez al calcular una parte:
+#las variables que lee wrf-python del wrfout, el resultado de getvar, to_np y los temporales
+#de la interpolacion.
+COPIES_PER_FIELD = 4
+
+#Variables de getvar que devuelven mas de un campo.
+FIELD_COMPONENTS = { 'uvmet' : 2 , 'uvmet10' : 2 , 'wspd_wdir' : 2 , 'uvmet_wspd_wdir' : 2 }
+
+
+def field_count( variables ) :
+    """Cantidad de campos que devuelven las variables ( nombre , opciones )."""
+    return sum( FIELD_COMPONENTS.get( varname , 1 ) for varname , kwargs in variables )
+
+
+def tile_side( nz , nfields , budget_mb=None ) :
+    """Lado (en puntos de reticula) de las partes cuadradas para que nfields campos de nz niveles entren en budget_mb."""
+    budget_mb = MEMORY_BUDGET_MB if budget_mb is None else budget_mb
+    side = int( np.sqrt( budget_mb * 1024**2 / ( 8.0 * COPIES_PER_FIELD * nz * max( nfields , 1 ) ) ) )
+    return max( side , 2 )
+
+
+def _split( n , side ) :
+    """Intervalos [inicio, fin) de a lo sumo side puntos que cubren n puntos (ninguno de un solo punto)."""
+    starts = list( range( 0 , n , side ) )
+    if len( starts ) > 1 and n - starts[-1] == 1 :
+        starts.pop()
+    return [ ( start , end ) for start , end in zip( starts , starts[1:] + [ n ] ) ]
+
+
+def tiles( bounds , side , stride=1 ) :
+    """Partes de la reticula que cubren bounds = (y0, y1, x0, x1), decimada cada stride puntos.
+
+    Devuelve una lista de ( bounds de la parte , slice en y , slice en x ), con los slices
+    en la reticula decimada del recorte.
+    """
+    y0 , y1 , x0 , x1 = bounds
+    ny = ( y1 - y0 ) // stride + 1
+    nx = ( x1 - x0 ) // stride + 1
+    parts = list()
+    for ystart , yend in _split( ny , side ) :
+        for xstart , xend in _split( nx , side ) :
+            part = ( y0 + ystart * stride , y0 + ( yend - 1 ) * stride , x0 + xstart * stride , x0 + ( xend - 1 ) * stride )
+            parts.append( ( part , slice( ystart , yend ) , slice( xstart , xend ) ) )
+    return parts
+
+
+def tile_fields( ncfile , bounds , variables , stride=1 , timeidx=0 ) :
+    """Campos de las variables ( nombre , opciones ) en la parte bounds del wrfout, como arrays.
+
+    Las variables con mas de un campo (uvmet, ...) se separan, asi que la lista tiene
+    field_count( variables ) arrays (del tiempo timeidx del archivo). No se usa el cache
+    de diag_cache: guardar las partes en memoria es justamente lo que se quiere evitar.
+    """
+    from wrf import getvar, to_np
+    names = [ varname for varname , kwargs in variables ]
+    with stage( 'getvar' , var=names , tile=bounds ) :
+        subset = open_subset( ncfile , stride=stride , variables=names , bounds=bounds )
+        try :
+            fields = list()
+            for varname , kwargs in variables :
+                field = np.asarray( to_np( getvar( subset , varname , timeidx=timeidx , **kwargs ) ) , dtype=float )
+                if FIELD_COMPONENTS.get( varname , 1 ) > 1 :
+                    fields.extend( field )
+                else :
+                    fields.append( field )
+            return fields
+        finally :
+            close_subset( subset , ncfile )
+
+
+def tiled_levels( ncfile , variables , niveles , z=( 'height' , { 'units' : 'm' } ) , bbox=None , stride=1 , budget_mb=None , timeidx=0 ) :
+    """Interpola las variables ( nombre , opciones ) a las alturas niveles calculandolas por partes.
+
+    Hace lo mismo que VerticalInterpolator( z ).interp( variables , niveles ) sobre el dominio
+    recortado a bbox y decimado cada stride puntos (como open_subset). Las partes en las que
+    todos los niveles quedan por debajo del terreno o por encima del tope no se calculan.
+    Devuelve campos (nfields,nlev,ny,nx), lats y lons (ny,nx).
+    """
+    lats = np.asarray( ncfile.variables['XLAT'][0] )
+    lons = np.asarray( ncfile.variables['XLONG'][0] )
+    bounds = subdomain_bounds( lats , lons , bbox )
+    y0 , y1 , x0 , x1 = bounds
+    lats = lats[ y0:y1+1:stride , x0:x1+1:stride ]
+    lons = lons[ y0:y1+1:stride , x0:x1+1:stride ]
+
+    niveles = np.atleast_1d( np.asarray( niveles , dtype=float ) )
+    nz = len( ncfile.dimensions['bottom_top'] )
+    nfields = field_count( variables )
+    side = tile_side( nz , nfields + 1 , budget_mb )
+    campos = np.full( ( nfields , niveles.size ) + lats.shape , np.nan )
+    for part , ys , xs in tiles( bounds , side , stride ) :
+        z_part , = tile_fields( ncfile , part , [ z ] , stride , timeidx )
+        if np.all( ( niveles < z_part[0].min() ) | ( niveles > z_part[-1].max() ) ) :
+            continue
+        fields = tile_fields( ncfile , part , variables , stride , timeidx )
+        campos[ : , : , ys , xs ] = VerticalInterpolator( z_part ).interp( fields , niveles )
+        del z_part , fields
+    return campos , lats , lons
+
+
+def tiled_columns( ncfile , cross , variables , budget_mb=None , timeidx=0 ) :
+    """Variables ( nombre , opciones ) interpoladas a las columnas del corte cross, calculadas por partes.
+
+    Solo se calculan las partes de la reticula que toca el corte, y de cada una solo el
+    rectangulo que rodea a sus puntos. Devuelve una lista con un array (...,npts) por campo.
+    """
+    nz = len( ncfile.dimensions['bottom_top'] )
+    side = tile_side( nz , field_count( variables ) , budget_mb )
+    columns = None
+    parts = ( cross.j0 // side ) * ( cross.i0.max() // side + 1 ) + cross.i0 // side
+    for ipart in np.unique( parts ) :
+        points = np.where( parts == ipart )[0]
+        #Los 4 puntos de reticula que rodean a cada punto del corte.
+        bounds = ( int( cross.j0[ points ].min() ) , int( cross.j0[ points ].max() ) + 1 ,
+                   int( cross.i0[ points ].min() ) , int( cross.i0[ points ].max() ) + 1 )
+        fields = tile_fields( ncfile , bounds , variables , timeidx=timeidx )
+        if columns is None :
+            columns = [ np.full( field.shape[:-2] + ( cross.npts , ) , np.nan ) for field in fields ]
+        for column , field in zip( columns , fields ) :
+            column[ ... , points ] = cross.horizontal( field , points , origin=bounds[0::2] )
+        del fields
+    return columns
+
+
+def tiled_cross( ncfile , start_point , end_point , variables , z=( 'z' , { } ) , cross=None ,
+                 autolevels=AUTOLEVELS , levels=None , budget_mb=None , timeidx=0 ) :
+    """Corte vertical de las variables ( nombre , opciones ) sin calcular los campos 3D completos.
+
+    Si cross es None se arma el corte (CrossSection) con los niveles elegidos como en
+    vertcross; si no, se reutiliza y solo se actualizan sus pesos verticales con la z de
+    este tiempo. Devuelve cross y un array (nfields,nlevels,npts).
+    """
+    if cross is None :
+        shape = ( len( ncfile.dimensions[ Y_DIM ] ) , len( ncfile.dimensions[ X_DIM ] ) )
+        cross = CrossSection.from_path( shape , start_point , end_point , wrfin=ncfile )
+    columns = tiled_columns( ncfile , cross , [ z ] + list( variables ) , budget_mb , timeidx )
+    if cross.levels is None :
+        cross.set_levels( columns[0] , autolevels , levels )
+    if len( variables ) == 0 :
+        return cross , np.zeros( ( 0 , cross.levels.size , cross.npts ) )
+    return cross , cross.apply_columns( columns[1:] , columns[0] )
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Interpolacion vertical de muchas variables a muchas alturas en una sola pasada.
+Hace lo mismo que interplevel de wrf-python pero los indices y pesos de la
+interpolacion se calculan una sola vez a partir de z y se reutilizan para todas
+las variables (um, vm, tk, ...) y todos los niveles.
+"""
+
+import numpy as np
+
+from profiling import stage
+
+
+class VerticalInterpolator :
+    """Interpolador lineal en la vertical a alturas fijas.
+
+    z es la altura (nz,ny,nx) de los puntos de reticula (tiene que crecer con el
+    indice vertical, como en WRF). Los pesos de cada nivel se guardan, asi que
+    interpolar otra variable al mismo nivel solo cuesta un par de operaciones
+    sobre el campo.
+    """
+
+    def __init__( self , z ) :
+        self.z = np.asarray( z , dtype=float )
+        self.nz = self.z.shape[0]
+        self._weights = dict()
+
+    def _compute_weights( self , niveles ) :
+        """Indices del nivel de abajo, pesos y puntos validos para todos los niveles juntos."""
+        niveles = np.asarray( niveles , dtype=float ).reshape( -1 , 1 , 1 , 1 )
+        #Cantidad de niveles del modelo por debajo de cada altura (nlev,ny,nx).
+        kbelow = np.sum( self.z[ np.newaxis ] <= niveles , axis=1 ) - 1
+        k = np.clip( kbelow , 0 , self.nz - 2 )
+        z0 = np.take_along_axis( self.z , k , axis=0 )
+        z1 = np.take_along_axis( self.z , k + 1 , axis=0 )
+        #Si la altura coincide justo con el ultimo nivel del modelo tambien es valida (w=1).
+        valid = ( kbelow >= 0 ) & ( ( kbelow <= self.nz - 2 ) | ( z1 == niveles[ : , 0 ] ) )
+        dz = np.where( z1 > z0 , z1 - z0 , 1.0 )
+        w = ( niveles[ : , 0 ] - z0 ) / dz
+        return k , w , valid
+
+    def weights( self , niveles ) :
+        """Devuelve k, w, valid (nlev,ny,nx) para la lista de niveles usando los que ya se calcularon."""
+        niveles = [ float( nivel ) for nivel in np.atleast_1d( niveles ) ]
+        missing = [ nivel for nivel in niveles if nivel not in self._weights ]
+        if len( missing ) > 0 :
+            k , w , valid = self._compute_weights( missing )
+            for ilev , nivel in enumerate( missing ) :
+                self._weights[ nivel ] = ( k[ ilev ] , w[ ilev ] , valid[ ilev ] )
+        k , w , valid = zip( *[ self._weights[ nivel ] for nivel in niveles ] )
+        return np.stack( k ) , np.stack( w ) , np.stack( valid )
+
+    def interp( self , variables , niveles ) :
+        """Interpola todas las variables (cada una de nz,ny,nx) a todos los niveles.
+
+        Devuelve un array de (nvars,nlev,ny,nx). Los puntos donde el nivel queda por
+        debajo o por encima de la columna del modelo valen NaN (igual que interplevel).
+        """
+        with stage( 'interp' ) :
+            k , w , valid = self.weights( niveles )
+            fields = np.stack( [ np.asarray( var , dtype=float ) for var in variables ] )
+            lower = np.take_along_axis( fields , k[ np.newaxis ] , axis=1 )
+            upper = np.take_along_axis( fields , k[ np.newaxis ] + 1 , axis=1 )
+            result = lower + w[ np.newaxis ] * ( upper - lower )
+            result[ : , ~valid ] = np.nan
+            return result
+
+
+def interp_levels( variables , z , niveles ) :
+    """Atajo para interpolar una sola vez sin guardar el interpolador."""
+    return VerticalInterpolator( z ).interp( variables , niveles )
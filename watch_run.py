@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Seguimiento de una corrida mientras el WRF la va escribiendo.
+follow_files devuelve cada tiempo nuevo de los wrfout de la carpeta en cuanto esta escrito,
+en orden cronologico, para poder graficarlo sin esperar a que termine la corrida. Si los
+wrfout tienen mas de un tiempo, los tiempos que el WRF agrega a un archivo que ya se habia
+visto tambien se devuelven. Si esta instalado inotify_simple se espera a los eventos del
+sistema de archivos; si no, se revisa la carpeta cada poll_interval segundos.
+"""
+
+import os
+import time
+
+from netCDF4 import Dataset
+
+from batch_utils import get_file_list
+
+POLL_INTERVAL = 10.0   #Segundos entre revisiones de la carpeta.
+SETTLE_TIME   = 5.0    #Segundos que el archivo tiene que quedar sin cambios para considerarlo completo.
+
+
+def _file_state( filename ) :
+    """Tamanio y fecha de modificacion del archivo, o None si ya no existe (se borro o se renombro)."""
+    try :
+        stat = os.stat( filename )
+    except FileNotFoundError :
+        return None
+    return stat.st_size , stat.st_mtime_ns
+
+
+def file_ntimes( filename ) :
+    """Cantidad de tiempos escritos en el wrfout (0 si todavia no se puede leer o si ya no existe)."""
+    try :
+        with Dataset( filename ) as ncfile :
+            if 'Times' not in ncfile.variables :
+                return 0
+            return len( ncfile.dimensions['Time'] )
+    except ( OSError , KeyError , RuntimeError ) :
+        return 0
+
+
+def wait_complete( filename , settle_time=SETTLE_TIME , poll_interval=1.0 , newer_exists=False ) :
+    """Espera a que el WRF termine de escribir filename y devuelve la cantidad de tiempos que tiene.
+
+    El WRF abre el wrfout siguiente solo cuando cerro el anterior, asi que si ya existe
+    un archivo mas nuevo (newer_exists) alcanza con que se pueda leer. Si no, se espera
+    a que el tamanio y la fecha de modificacion no cambien durante settle_time segundos.
+    Si el archivo desaparece mientras tanto devuelve 0 (no esta listo).
+    """
+    if newer_exists :
+        ntimes = file_ntimes( filename )
+        if ntimes > 0 :
+            return ntimes
+    state = _file_state( filename )
+    stable_since = time.time()
+    while state is not None :
+        time.sleep( poll_interval )
+        new_state = _file_state( filename )
+        if new_state != state :
+            state = new_state
+            stable_since = time.time()
+        elif time.time() - stable_since >= settle_time :
+            ntimes = file_ntimes( filename )
+            if ntimes > 0 :
+                return ntimes
+    return 0
+
+
+class _Notifier :
+    """Espera cambios en la carpeta con inotify (si esta disponible) o durmiendo poll_interval."""
+
+    def __init__( self , path , poll_interval ) :
+        self.poll_interval = poll_interval
+        self._inotify = None
+        try :
+            from inotify_simple import INotify, flags
+        except ImportError :
+            return
+        self._inotify = INotify()
+        self._inotify.add_watch( path , flags.CLOSE_WRITE | flags.MOVED_TO | flags.CREATE )
+
+    def wait( self ) :
+        if self._inotify is None :
+            time.sleep( self.poll_interval )
+        else :
+            self._inotify.read( timeout=int( self.poll_interval * 1000 ) )
+
+    def close( self ) :
+        if self._inotify is not None :
+            self._inotify.close()
+
+
+def follow_files( path='.' , domain='d01' , poll_interval=POLL_INTERVAL , settle_time=SETTLE_TIME ,
+                  timeout=None , skip=0 ) :
+    """Generador con los tiempos de la corrida a medida que el WRF los escribe.
+
+    Devuelve ( plot_time , filename , timeidx ): el tiempo en la corrida (el plot_time de
+    los scripts), el wrfout y el tiempo dentro del archivo. Un archivo se vuelve a revisar
+    mientras cambie, asi que si el WRF le agrega tiempos tambien se devuelven. Los skip
+    primeros tiempos no se devuelven (por ejemplo si ya se graficaron). Termina si pasan
+    timeout segundos sin tiempos nuevos (None = sigue esperando para siempre).
+    """
+    notifier = _Notifier( path , poll_interval )
+    done = dict()     #Tiempos ya devueltos de cada archivo.
+    states = dict()   #Tamanio y fecha de cada archivo la ultima vez que se leyo.
+    closed = set()    #Archivos que ya no cambian (el WRF ya escribe uno mas nuevo).
+    ntimes = 0
+    last_new = time.time()
+    try :
+        while True :
+            file_list = get_file_list( path , domain )
+            for ifile , my_file in enumerate( file_list ) :
+                if my_file in closed :
+                    continue
+                newer_exists = ifile < len( file_list ) - 1
+                state = _file_state( my_file )
+                #Si un archivo no esta listo no se sigue con los mas nuevos: los tiempos se devuelven en orden.
+                if state is None or ( state == states.get( my_file ) and not newer_exists ) :
+                    break
+                file_times = wait_complete( my_file , settle_time , min( poll_interval , 1.0 ) , newer_exists )
+                if file_times == 0 :
+                    break
+                states[ my_file ] = state
+                if newer_exists :
+                    closed.add( my_file )
+                for timeidx in range( done.get( my_file , 0 ) , file_times ) :
+                    last_new = time.time()
+                    if ntimes >= skip :
+                        yield ntimes , my_file , timeidx
+                    ntimes += 1
+                done[ my_file ] = max( done.get( my_file , 0 ) , file_times )
+            if timeout is not None and time.time() - last_new > timeout :
+                return
+            notifier.wait()
+    finally :
+        notifier.close()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Acceso a toda la secuencia de wrfout de una corrida como si fuera un unico archivo.
+Se indexa la corrida una sola vez (tiempos, archivo en el que esta cada tiempo y
+forma de las variables) y despues se pueden leer rebanadas [tiempo, z, y, x] de
+cualquier variable sin tener que abrir todos los archivos en cada pedido.
+"""
+
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from netCDF4 import Dataset, chartostring
+
+from batch_utils import get_file_list
+from profiling import stage
+
+#Fecha y hora al final del nombre del wrfout (wrfout_d01_2020-01-01_00:00:00).
+_FILE_TIME = re.compile( r'(\d{4}-\d{2}-\d{2})_(\d{2})\D(\d{2})\D(\d{2})$' )
+
+
+def read_times( ncfile ) :
+    """Lee la variable Times de un wrfout y la devuelve como un array de numpy.datetime64."""
+    times = chartostring( ncfile.variables['Times'][:] )
+    return np.array( [ np.datetime64( str( time ).replace( '_' , 'T' ) ) for time in np.atleast_1d( times ) ] )
+
+
+def open_wrfout( filename ) :
+    """Abre un wrfout (se registra como la etapa open, ver profiling)."""
+    with stage( 'open' , filename=filename ) :
+        return Dataset( filename )
+
+
+def time_from_filename( filename ) :
+    """Fecha del wrfout a partir de su nombre, o None si el nombre no tiene el formato de WRF."""
+    match = _FILE_TIME.search( filename )
+    if match is None :
+        return None
+    return np.datetime64( match.group(1) + 'T' + ':'.join( match.group(2,3,4) ) )
+
+
+class WrfRun :
+    """Indice de todos los wrfout de una corrida.
+
+    Al crearlo solo se abre el primer archivo (para saber cuantos tiempos tiene cada
+    archivo y la forma de las variables); los tiempos se sacan del nombre de los archivos.
+    Si los archivos tienen mas de un tiempo o nombres que no son los de WRF se leen los
+    Times de cada archivo. Como mucho se mantienen max_open archivos abiertos a la vez,
+    asi que la memoria no depende del largo de la corrida. La lista de archivos abiertos
+    esta protegida con un lock, asi que se puede pedir un dataset desde el thread de
+    prefetch (las lecturas en si tienen que seguir siendo de un thread a la vez).
+    """
+
+    def __init__( self , path='.' , domain='d01' , file_list=None , max_open=8 ) :
+        if file_list is None :
+            file_list = get_file_list( path , domain )
+        if len( file_list ) == 0 :
+            raise ValueError( 'No se encontraron archivos wrfout_' + domain + '_* en ' + path )
+        self.file_list = list( file_list )
+        self.max_open = max_open
+        self._open = OrderedDict()
+        self._lock = threading.RLock()
+
+        #Forma y dimensiones de las variables (las tomamos del primer archivo).
+        ncfile = self.dataset( 0 )
+        self.dims = dict()
+        self.shapes = dict()
+        for name , var in ncfile.variables.items() :
+            self.dims[ name ] = var.dimensions
+            self.shapes[ name ] = var.shape
+
+        file_times = [ time_from_filename( my_file ) for my_file in self.file_list ]
+        if len( ncfile.dimensions['Time'] ) == 1 and all( time is not None for time in file_times ) :
+            self.times = np.array( file_times )
+            self.file_ntimes = np.ones( len( self.file_list ) , dtype=int )
+        else :
+            times = [ read_times( self.dataset( ifile ) ) for ifile in range( len( self.file_list ) ) ]
+            self.times = np.concatenate( times )
+            self.file_ntimes = np.array( [ len( time ) for time in times ] )
+
+        #Posicion del primer tiempo de cada archivo dentro de la corrida.
+        self.offsets = np.concatenate( ( [ 0 ] , np.cumsum( self.file_ntimes ) ) )
+
+    @property
+    def ntimes( self ) :
+        return int( self.offsets[-1] )
+
+    def locate( self , itime ) :
+        """Archivo y tiempo dentro del archivo que corresponden al tiempo itime de la corrida."""
+        if itime < 0 :
+            itime = itime + self.ntimes
+        if itime < 0 or itime >= self.ntimes :
+            raise IndexError( 'Tiempo ' + str( itime ) + ' fuera de la corrida (' + str( self.ntimes ) + ' tiempos)' )
+        ifile = int( np.searchsorted( self.offsets , itime , side='right' ) ) - 1
+        return ifile , int( itime - self.offsets[ ifile ] )
+
+    def source( self , itime ) :
+        """Ruta del wrfout y tiempo dentro del archivo (timeidx de getvar) del tiempo itime de la corrida.
+
+        Es lo que hay que pasarle a los procesos del pool: con archivos de mas de un tiempo
+        el tiempo itime no es el archivo file_list[ itime ].
+        """
+        ifile , timeidx = self.locate( itime )
+        return self.file_list[ ifile ] , timeidx
+
+    def time_dataset( self , itime ) :
+        """Dataset (reutilizado si ya esta abierto) y timeidx del tiempo itime de la corrida."""
+        ifile , timeidx = self.locate( itime )
+        return self.dataset( ifile ) , timeidx
+
+    def dataset( self , ifile ) :
+        """Devuelve el Dataset del archivo ifile, reutilizandolo si ya esta abierto."""
+        with self._lock :
+            if ifile in self._open :
+                self._open.move_to_end( ifile )
+                return self._open[ ifile ]
+            ncfile = open_wrfout( self.file_list[ ifile ] )
+            self._open[ ifile ] = ncfile
+            while len( self._open ) > self.max_open :
+                self._open.popitem( last=False )[1].close()
+            return ncfile
+
+    def getvar( self , varname , itime , **kwargs ) :
+        """Igual que wrf.getvar pero indicando el tiempo de la corrida en lugar del archivo."""
+        from wrf import getvar
+        ncfile , timeidx = self.time_dataset( itime )
+        return getvar( ncfile , varname , timeidx=timeidx , **kwargs )
+
+    @property
+    def variables( self ) :
+        """Variables de la corrida, cada una se puede indexar como [tiempo, z, y, x]."""
+        return { name : RunVariable( self , name ) for name in self.shapes }
+
+    def __getitem__( self , name ) :
+        return RunVariable( self , name )
+
+    def close( self ) :
+        with self._lock :
+            while len( self._open ) > 0 :
+                self._open.popitem()[1].close()
+
+    def __enter__( self ) :
+        return self
+
+    def __exit__( self , *args ) :
+        self.close()
+
+
+class RunVariable :
+    """Una variable de la corrida completa. No lee nada hasta que se la indexa."""
+
+    def __init__( self , run , name ) :
+        if name not in run.shapes :
+            raise KeyError( name )
+        self.run = run
+        self.name = name
+        self.dimensions = run.dims[ name ]
+        self.has_time = len( self.dimensions ) > 0 and self.dimensions[0] == 'Time'
+        shape = run.shapes[ name ]
+        self.shape = ( run.ntimes , ) + tuple( shape[1:] ) if self.has_time else tuple( shape )
+
+    def __getitem__( self , key ) :
+        if not isinstance( key , tuple ) :
+            key = ( key , )
+        if not self.has_time :
+            return self.run.dataset( 0 ).variables[ self.name ][ key ]
+
+        time_key , rest = key[0] , key[1:]
+        if isinstance( time_key , ( int , np.integer ) ) :
+            ifile , timeidx = self.run.locate( int( time_key ) )
+            return self.run.dataset( ifile ).variables[ self.name ][ ( timeidx , ) + rest ]
+
+        #Leemos de cada archivo solo los tiempos pedidos y juntamos los pedazos.
+        itimes = np.arange( self.run.ntimes )[ time_key ]
+        ifiles = np.searchsorted( self.run.offsets , itimes , side='right' ) - 1
+        #Cortamos la lista de tiempos donde cambia el archivo (asi se respeta el orden pedido).
+        cuts = np.flatnonzero( np.diff( ifiles ) != 0 ) + 1
+        pieces = list()
+        for group in np.split( np.arange( len( itimes ) ) , cuts ) :
+            if len( group ) == 0 :
+                continue
+            ifile = int( ifiles[ group[0] ] )
+            timeidx = itimes[ group ] - self.run.offsets[ ifile ]
+            pieces.append( self.run.dataset( ifile ).variables[ self.name ][ ( timeidx , ) + rest ] )
+        if len( pieces ) == 0 :
+            return np.zeros( ( 0 , ) + self.shape[1:] )
+        return np.concatenate( pieces , axis=0 )